@@ -18,6 +18,7 @@ import logging
 import os
 import os.path as op
 import subprocess as sp
+import threading
 
 
 # CONSTANTS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
@@ -26,6 +27,30 @@ PROJECT_NAME = "Homotypus"
 class ArgName:
     DEBUG = "debug"
     PORT = "port"
+    LIVERELOAD = "livereload"
+    BIND = "bind"
+    FULL = "full"
+    POLL = "poll"
+    RELEASE = "release"
+    SOURCE_MAP = "source_map"
+    PURGE_CACHE = "purge_cache"
+    SUBPROCESS = "subprocess"
+    PROFILE = "profile"
+    JOBS = "jobs"
+    POSTS = "posts"
+    MATH = "math"
+    CODE = "code"
+    FOOTNOTES = "footnotes"
+    TAGS = "tags"
+    CATEGORIES = "categories"
+    SEED = "seed"
+    REPEAT = "repeat"
+    REPORT = "report"
+    COMPARE = "compare"
+    THRESHOLD = "threshold"
+    TARGET = "target"
+    DRY_RUN = "dry_run"
+    KEEP = "keep"
 
 class SubCmd:
     _SUBCMD = "subcommand"
@@ -33,9 +58,16 @@ class SubCmd:
     SITE = "site"
     HTML = "html"
     CSS = "css"
+    WATCH = "watch"
     CLEAN = "clean"
     SERVE_PELICAN = "serve-pelican"
     SERVE_PYTHON = "serve"
+    BENCH = "bench"
+    DEPLOY = "deploy"
+
+class BuildProfile:
+    DEBUG = "debug"
+    RELEASE = "release"
 
 class PelicanArgLabel:
     INPUT = "Content directory"
@@ -70,6 +102,7 @@ def create_logger(name = LogName.SCRIPT_LOGGER):
     )
     terminal.setFormatter(formatter)
     terminal.set_name(LogName.CONSOLE_HANDLER)
+    terminal.addFilter(TaskLogFilter())
 
     return archivist
 
@@ -195,6 +228,16 @@ def get_sass_output_file():
     return op.join("theme", "static", "css", "homotypus.css")
 
 
+def get_sass_map_file(fpOut):
+    # Only written for release builds asking for an external source map
+    return fpOut + ".map"
+
+
+def get_sass_stamp_file(fpOut):
+    # Kept next to the output, recording the inputs it was generated from
+    return fpOut + ".deps.json"
+
+
 def get_sass_cmd():
     if os.name == "nt":
         # Windows
@@ -220,6 +263,72 @@ def build_sass_paths(dpCur = os.getcwd(), wantIn = True, wantOut = True):
     return result
 
 
+def resolve_sass_load(strUrl, dpFrom):
+    """
+    Find the file that a @use, @forward or @import of the given URL refers to,
+    following the Sass rules for partials and index files. Returns None for
+    built-in modules, plain CSS imports and anything that cannot be found.
+    """
+
+    if strUrl.startswith("sass:") or "://" in strUrl or \
+            strUrl.endswith(".css") or strUrl.startswith("url("):
+        return None
+
+    (dpUrl, name) = op.split(strUrl)
+    dp = op.join(dpFrom, dpUrl)
+
+    if op.splitext(name)[1] in [".scss", ".sass"]:
+        lstName = [name, "_" + name]
+    else:
+        lstName = []
+        for ext in [".scss", ".sass"]:
+            lstName.extend([name + ext, "_" + name + ext])
+        for ext in [".scss", ".sass"]:
+            lstName.extend([
+                op.join(name, "_index" + ext), op.join(name, "index" + ext)
+            ])
+
+    for n in lstName:
+        fp = op.join(dp, n)
+        if op.isfile(fp):
+            return op.abspath(fp)
+
+    return None
+
+
+def find_sass_deps(fpIn):
+    """
+    List the given Sass source file along with every file it loads, directly
+    or indirectly.
+    """
+
+    import re
+
+    reComment = re.compile(r"/\*.*?\*/|^\s*//.*?$", re.DOTALL | re.MULTILINE)
+    reLoad = re.compile(r"@(?:use|forward|import)\s+([^;{]+)")
+    reString = re.compile(r"""["']([^"']+)["']""")
+
+    lstFp = []
+    lstTodo = [op.abspath(fpIn)]
+    while lstTodo:
+        fp = lstTodo.pop()
+        if fp in lstFp:
+            continue
+        lstFp.append(fp)
+
+        with open(fp, "r", encoding = "utf-8") as f:
+            text = reComment.sub("", f.read())
+
+        for m in reLoad.finditer(text):
+            # @import may load several files at once
+            for strUrl in reString.findall(m.group(1)):
+                fpDep = resolve_sass_load(strUrl, op.dirname(fp))
+                if fpDep is not None:
+                    lstTodo.append(fpDep)
+
+    return sorted(lstFp)
+
+
 def check_valid_sass_file_structure(
     dpCur = os.getcwd(), wantIn = True, wantOut = False
 ):
@@ -259,7 +368,4085 @@ def check_valid_sass_file_structure(
             for msg in lstMsg:
                 archivist.error(msg)
 
-    return all(lstPassCheck)
+    return all(lstPassCheck)
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# BUILD MANIFEST SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# The build manifest remembers the content hashes of everything Pelican reads,
+# while the "build_deps" plugin records which source files each output page was
+# rendered from. Together they tell us which pages are stale.
+def get_cache_dir():
+    # Needs to be consistent with CACHE_PATH in the Pelican settings file
+    return "cache"
+
+
+def get_build_manifest_file():
+    return op.join(get_cache_dir(), "build-manifest.json")
+
+
+def get_build_deps_file():
+    # Needs to be consistent with the "build_deps" plugin
+    return op.join(get_cache_dir(), "build-deps.json")
+
+
+def get_search_state_file():
+    # Needs to be consistent with the "search_index" plugin
+    return op.join(get_cache_dir(), "search-index.json")
+
+
+def get_sitemap_state_file():
+    # Needs to be consistent with the "sitemaps" plugin
+    return op.join(get_cache_dir(), "sitemap.json")
+
+
+def get_purgeable_cache_files():
+    # Needs to be consistent with the caching plugins
+    return {
+        "katex": op.join(get_cache_dir(), "katex.sqlite"),
+        "highlight": op.join(get_cache_dir(), "highlight.sqlite"),
+        "reader": op.join(get_cache_dir(), "reader.sqlite"),
+        "images": get_image_cache_dir(),
+        "deploy": get_deploy_dir(),
+    }
+
+
+def get_site_input_dirs():
+    # Directories whose files affect every generated page
+    return [op.join("theme", "templates"), "plugins"]
+
+
+def get_static_input_dirs():
+    # Directories whose files Pelican copies verbatim into the output
+    return [op.join("theme", "static"), "extra"]
+
+
+class ManifestKey:
+    CONTENT = "content"
+    SITE = "site"
+    STATIC = "static"
+    PROFILE = "profile"
+    HASH = "hash"
+    META = "meta"
+
+
+CONTENT_SOURCE_EXTS = [".md", ".markdown", ".mkd", ".mdown", ".html", ".htm"]
+
+
+def hash_bytes(data):
+    import hashlib
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(fp):
+    with open(fp, "rb") as f:
+        return hash_bytes(f.read())
+
+
+def hash_content_meta(fp):
+    """
+    Hash only the metadata header of a content source, i.e. everything up to
+    the first blank line. Changing the metadata (title, category, tags etc.)
+    can affect any page, whereas changing the body only affects the pages which
+    show that particular piece of content.
+    """
+
+    lstHead = []
+    with open(fp, "rb") as f:
+        for line in f:
+            if not line.strip():
+                break
+            lstHead.append(line)
+
+    return hash_bytes(b"".join(lstHead))
+
+
+def to_manifest_path(fp, dpCur):
+    return op.relpath(fp, dpCur).replace(os.sep, "/")
+
+
+def list_files(dp):
+    lstFile = []
+    for (dpRoot, lstDir, lstName) in os.walk(dp):
+        lstDir.sort()
+        for name in sorted(lstName):
+            lstFile.append(op.join(dpRoot, name))
+
+    return lstFile
+
+
+def scan_build_inputs(dtPelPath):
+    fpSettings = dtPelPath[PelicanArgLabel.SETTINGS]
+    dpIn = dtPelPath[PelicanArgLabel.INPUT]
+    dpCur = op.dirname(fpSettings)
+
+    dtContent = {}
+    for fp in list_files(dpIn):
+        hashFull = hash_file(fp)
+        if op.splitext(fp)[1].lower() in CONTENT_SOURCE_EXTS:
+            hashMeta = hash_content_meta(fp)
+        else:
+            hashMeta = hashFull
+        dtContent[to_manifest_path(fp, dpCur)] = {
+            ManifestKey.HASH: hashFull, ManifestKey.META: hashMeta
+        }
+
+    dtSite = {to_manifest_path(fpSettings, dpCur): hash_file(fpSettings)}
+    for dp in get_site_input_dirs():
+        for fp in list_files(op.join(dpCur, dp)):
+            if "__pycache__" in fp:
+                continue
+            dtSite[to_manifest_path(fp, dpCur)] = hash_file(fp)
+
+    # The Sass output is left out, since it is copied into the output directory
+    # separately whether Pelican runs or not
+    fpSassOut = op.join(dpCur, get_sass_output_file())
+    setSkip = set(op.normcase(fp) for fp in [
+        fpSassOut, get_sass_map_file(fpSassOut), get_sass_stamp_file(fpSassOut)
+    ])
+
+    dtStatic = {}
+    for dp in get_static_input_dirs():
+        for fp in list_files(op.join(dpCur, dp)):
+            if op.normcase(fp) in setSkip:
+                continue
+            dtStatic[to_manifest_path(fp, dpCur)] = hash_file(fp)
+
+    return {
+        ManifestKey.CONTENT: dtContent,
+        ManifestKey.SITE: dtSite,
+        ManifestKey.STATIC: dtStatic
+    }
+
+
+def load_json_file(fp, default = None):
+    import json
+
+    if not op.isfile(fp):
+        return default
+
+    try:
+        with open(fp, "r", encoding = "utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+        archivist.warning("Ignoring unreadable file [%s]", fp)
+        return default
+
+
+def save_json_file(fp, obj):
+    import json
+
+    dp = op.dirname(fp)
+    if dp:
+        os.makedirs(dp, exist_ok = True)
+
+    # Write to a temporary file first so an interrupted build never leaves a
+    # half-written file behind
+    fpTmp = fp + ".tmp"
+    with open(fpTmp, "w", encoding = "utf-8") as f:
+        json.dump(obj, f, indent = 1, sort_keys = True)
+    os.replace(fpTmp, fp)
+
+
+def plan_html_build(dtPelPath, dtInput):
+    """
+    Work out which output pages need to be regenerated.
+
+    Returns None if everything has to be regenerated, otherwise a (possibly
+    empty) list of absolute output paths to hand to Pelican's --write-selected.
+    """
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    dpOut = dtPelPath[PelicanArgLabel.OUTPUT]
+    dpCur = op.dirname(dtPelPath[PelicanArgLabel.SETTINGS])
+
+    dtOld = load_json_file(op.join(dpCur, get_build_manifest_file()))
+    dtDeps = load_json_file(op.join(dpCur, get_build_deps_file()))
+    if dtOld is None or dtDeps is None or not op.isdir(dpOut):
+        archivist.info("No record of a previous build, regenerating everything")
+        return None
+
+    if dtOld.get(ManifestKey.PROFILE, BuildProfile.DEBUG) != \
+            dtInput[ManifestKey.PROFILE]:
+        archivist.info("Build profile changed, regenerating everything")
+        return None
+
+    if dtOld.get(ManifestKey.SITE) != dtInput[ManifestKey.SITE]:
+        archivist.info("Settings, templates or plugins changed, regenerating everything")
+        return None
+
+    dtOldContent = dtOld.get(ManifestKey.CONTENT, {})
+    dtNewContent = dtInput[ManifestKey.CONTENT]
+    if set(dtOldContent) != set(dtNewContent):
+        archivist.info("Content was added or removed, regenerating everything")
+        return None
+
+    lstChanged = []
+    for (fp, dtHash) in dtNewContent.items():
+        dtOldHash = dtOldContent[fp]
+        if dtOldHash[ManifestKey.META] != dtHash[ManifestKey.META]:
+            archivist.info(
+                "Metadata of [%s] changed, regenerating everything", fp
+            )
+            return None
+        if dtOldHash[ManifestKey.HASH] != dtHash[ManifestKey.HASH]:
+            lstChanged.append(fp)
+
+    for fpOut in dtDeps:
+        if not op.isfile(op.join(dpOut, fpOut)):
+            archivist.info(
+                "Output file [%s] is missing, regenerating everything", fpOut
+            )
+            return None
+
+    setChanged = set(lstChanged)
+    lstSelected = sorted(
+        fpOut for (fpOut, lstSource) in dtDeps.items()
+        if setChanged.intersection(lstSource)
+    )
+
+    # Static files are copied by Pelican on every run regardless of the pages
+    # selected for writing, so selecting a path that no page is written to is
+    # enough to get Pelican to run without rendering any page
+    dtOldStatic = dtOld.get(ManifestKey.STATIC, {})
+    for (fp, h) in dtInput[ManifestKey.STATIC].items():
+        if dtOldStatic.get(fp) != h:
+            lstSelected.append(fp)
+    for fp in lstChanged:
+        if op.splitext(fp)[1].lower() not in CONTENT_SOURCE_EXTS:
+            lstSelected.append(fp)
+
+    for fp in lstChanged:
+        archivist.debug("Changed content: %s", fp)
+    for fpOut in lstSelected:
+        archivist.debug("Selected for writing: %s", fpOut)
+
+    return [op.join(dpOut, fp) for fp in lstSelected]
+
+
+def save_build_manifest(dtPelPath, dtInput):
+    dpCur = op.dirname(dtPelPath[PelicanArgLabel.SETTINGS])
+    save_json_file(op.join(dpCur, get_build_manifest_file()), dtInput)
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# TASK SCHEDULING SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+class TaskLogFilter(logging.Filter):
+    """
+    Prefix every message logged while a task runs with the name of the task, so
+    that the interleaved output of concurrent tasks can be told apart.
+    """
+
+    _local = threading.local()
+
+    @classmethod
+    def get_task(cls):
+        return getattr(cls._local, "name", None)
+
+    @classmethod
+    def set_task(cls, name):
+        cls._local.name = name
+
+    def filter(self, record):
+        name = getattr(self._local, "name", None)
+        if name is not None and not getattr(record, "buildTask", None):
+            record.msg = "[{}] {}".format(name, record.msg)
+            record.buildTask = name
+        return True
+
+
+class TaskGraph:
+    """
+    Runs named tasks on a thread pool, starting each task as soon as all the
+    tasks it depends on have finished successfully. If a task fails, the tasks
+    already running are allowed to finish, nothing new is started and the
+    failure is raised again once everything has settled.
+    """
+
+    def __init__(self):
+        self._dtTask = {}
+
+    def add(self, name, func, deps = ()):
+        for dep in deps:
+            if dep not in self._dtTask:
+                raise ValueError("Unknown dependency [{}] of task [{}]" \
+                    .format(dep, name))
+        self._dtTask[name] = (func, list(deps))
+
+    def _run_task(self, name):
+        # Tasks may run graphs of their own on the same thread
+        namePrev = TaskLogFilter.get_task()
+        TaskLogFilter.set_task(name)
+        try:
+            with profile_span(name, "task"):
+                return self._dtTask[name][0]()
+        finally:
+            TaskLogFilter.set_task(namePrev)
+
+    def run(self):
+        from concurrent.futures import (
+            ThreadPoolExecutor, wait, FIRST_COMPLETED
+        )
+
+        archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+        setDone = set()
+        setPending = set(self._dtTask)
+        dtRunning = {}
+        excFirst = None
+
+        numWorker = max(1, len(self._dtTask))
+        with ThreadPoolExecutor(max_workers = numWorker) as executor:
+            while setPending or dtRunning:
+                if excFirst is None:
+                    lstReady = [
+                        name for name in sorted(setPending)
+                        if all(dep in setDone for dep in self._dtTask[name][1])
+                    ]
+                    setPending.difference_update(lstReady)
+
+                    if len(lstReady) == 1 and not dtRunning:
+                        # Nothing to overlap with, so run it on this thread,
+                        # which also keeps long-running tasks such as servers
+                        # interruptible
+                        name = lstReady[0]
+                        archivist.debug("Running task [%s]", name)
+                        try:
+                            self._run_task(name)
+                        except Exception as exc:
+                            archivist.error("Task [%s] failed: %s", name, exc)
+                            excFirst = exc
+                        else:
+                            setDone.add(name)
+                        continue
+
+                    for name in lstReady:
+                        archivist.debug("Starting task [%s]", name)
+                        future = executor.submit(self._run_task, name)
+                        dtRunning[future] = name
+                elif setPending:
+                    archivist.debug(
+                        "Skipping tasks %s", ", ".join(sorted(setPending))
+                    )
+                    setPending.clear()
+
+                if not dtRunning:
+                    break
+
+                (setFinished, _) = wait(
+                    list(dtRunning), return_when = FIRST_COMPLETED
+                )
+                for future in setFinished:
+                    name = dtRunning.pop(future)
+                    exc = future.exception()
+                    if exc is None:
+                        setDone.add(name)
+                        archivist.debug("Finished task [%s]", name)
+                    else:
+                        archivist.error("Task [%s] failed: %s", name, exc)
+                        if excFirst is None:
+                            excFirst = exc
+
+        if excFirst is not None:
+            raise excFirst
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# PROFILING SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+def get_profile_trace_file():
+    return op.join(get_cache_dir(), "profile-trace.json")
+
+
+def get_peak_rss():
+    """
+    The peak resident set size of this process and of its waited-for
+    children, in kilobytes, or (None, None) where this cannot be told.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return (None, None)
+
+    # Linux reports kilobytes, macOS bytes
+    scale = 1024 if sys.platform == "darwin" else 1
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+    )
+
+
+def get_child_cpu_time():
+    # Seconds of CPU time used by the waited-for child processes so far
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class ProfileSpan:
+    """
+    Context manager timing one phase for a build profiler.
+    """
+
+    def __init__(self, profiler, name, cat, dtArg):
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.dtArg = dtArg
+
+    def __enter__(self):
+        import time
+
+        self._wall = time.perf_counter_ns()
+        self._cpu = time.thread_time_ns()
+        self._cpuChild = get_child_cpu_time()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        import time
+
+        wall = time.perf_counter_ns() - self._wall
+        cpu = time.thread_time_ns() - self._cpu
+        cpuChild = get_child_cpu_time() - self._cpuChild
+        self.profiler.record(
+            self.name, self.cat, self._wall, wall, cpu, cpuChild, self.dtArg
+        )
+        return False
+
+
+class BuildProfiler:
+    """
+    Records the wall-clock and CPU time of the phases of a build, and the peak
+    memory use of the process by the end of each. Phases nest, and may be
+    recorded from several threads at once. CPU time is that of the thread
+    running the phase, plus whatever child processes finished during it.
+    """
+
+    _active = None
+
+    @classmethod
+    def get_active(cls):
+        return cls._active
+
+    @classmethod
+    def set_active(cls, profiler):
+        cls._active = profiler
+
+    def __init__(self):
+        import time
+
+        self._lock = threading.Lock()
+        self._lstEvent = []
+        self._dtThread = {}
+        self._start = time.perf_counter_ns()
+
+    def span(self, name, cat, **kwargs):
+        return ProfileSpan(self, name, cat, kwargs)
+
+    def clear(self):
+        with self._lock:
+            self._lstEvent = []
+            self._dtThread = {}
+
+    def get_events(self):
+        with self._lock:
+            return list(self._lstEvent)
+
+    def add_events(self, lstEvent, strThread):
+        """
+        Take in the phases recorded by another process (on the same clock),
+        shown as one thread of this one.
+        """
+
+        with self._lock:
+            tid = len(self._dtThread) + 1
+            self._dtThread[("process", strThread)] = (tid, strThread)
+            for e in lstEvent:
+                self._lstEvent.append(dict(e, tid = tid))
+
+    def record(self, name, cat, start, wall, cpu, cpuChild, dtArg):
+        (rss, rssChild) = get_peak_rss()
+        thread = threading.current_thread()
+
+        with self._lock:
+            tid = self._dtThread.setdefault(
+                thread.ident, (len(self._dtThread) + 1, thread.name)
+            )[0]
+            self._lstEvent.append({
+                "name": name,
+                "cat": cat,
+                "start": start - self._start,
+                "wall": wall,
+                "cpu": cpu,
+                "cpuChild": int(cpuChild * 1e9),
+                "rss": rss,
+                "rssChild": rssChild,
+                "tid": tid,
+                "args": dtArg,
+            })
+
+    def save_trace(self, fp):
+        """
+        Write the recorded phases in the Trace Event Format, which both
+        chrome://tracing and Perfetto read.
+        """
+
+        with self._lock:
+            lstEvent = list(self._lstEvent)
+            dtThread = dict(self._dtThread)
+
+        pid = os.getpid()
+        lstTrace = [{
+            "name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+            "args": {"name": "build.py"}
+        }]
+        for (tid, name) in dtThread.values():
+            lstTrace.append({
+                "name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                "args": {"name": name}
+            })
+
+        for e in lstEvent:
+            dtArg = dict(e["args"])
+            dtArg.update({
+                "cpu_ms": e["cpu"] / 1e6,
+                "child_cpu_ms": e["cpuChild"] / 1e6,
+                "peak_rss_kb": e["rss"],
+                "child_peak_rss_kb": e["rssChild"],
+            })
+            lstTrace.append({
+                "name": e["name"], "cat": e["cat"], "ph": "X",
+                "ts": e["start"] / 1e3, "dur": e["wall"] / 1e3,
+                "pid": pid, "tid": e["tid"], "args": dtArg
+            })
+
+        save_json_file(fp, {
+            "traceEvents": lstTrace, "displayTimeUnit": "ms"
+        })
+
+    def summarize(self, numSlowest = 10):
+        """
+        Yield the lines of a table of the phases, slowest first, followed by
+        the slowest of the individual pages read and written. Phases include
+        the time of the phases nested in them.
+        """
+
+        with self._lock:
+            lstEvent = list(self._lstEvent)
+        if not lstEvent:
+            return
+
+        # Files read, templates rendered and pages written are added up per
+        # kind
+        dtPhase = {}
+        for e in lstEvent:
+            if e["cat"] in PROFILE_GROUPED_CATS:
+                key = (e["cat"], "(all)")
+            else:
+                key = (e["cat"], e["name"])
+            dtTotal = dtPhase.setdefault(key, {
+                "count": 0, "wall": 0, "cpu": 0, "rss": None
+            })
+            dtTotal["count"] += 1
+            dtTotal["wall"] += e["wall"]
+            dtTotal["cpu"] += e["cpu"] + e["cpuChild"]
+            if e["rss"] is not None:
+                dtTotal["rss"] = max(
+                    dtTotal["rss"] or 0, e["rss"], e["rssChild"]
+                )
+
+        def format_row(cat, name, count, wall, cpu, rss):
+            return "{:<10} {:<44} {:>6} {:>10.1f} {:>10.1f} {:>9}".format(
+                cat, name if len(name) <= 44 else "..." + name[-41:], count,
+                wall / 1e6, cpu / 1e6,
+                "-" if rss is None else "{:.1f}".format(rss / 1024)
+            )
+
+        strHead = "{:<10} {:<44} {:>6} {:>10} {:>10} {:>9}".format(
+            "Kind", "Phase", "Count", "Wall ms", "CPU ms", "Peak MB"
+        )
+        yield strHead
+        for ((cat, name), dtTotal) in sorted(
+            dtPhase.items(), key = lambda kv: -kv[1]["wall"]
+        ):
+            yield format_row(
+                cat, name, dtTotal["count"], dtTotal["wall"], dtTotal["cpu"],
+                dtTotal["rss"]
+            )
+
+        for cat in PROFILE_PER_FILE_CATS:
+            lstFile = sorted(
+                (e for e in lstEvent if e["cat"] == cat),
+                key = lambda e: -e["wall"]
+            )[:numSlowest]
+            if not lstFile:
+                continue
+
+            yield ""
+            yield "Slowest {}:".format(PROFILE_PER_FILE_CATS[cat])
+            yield strHead
+            for e in lstFile:
+                yield format_row(
+                    cat, e["name"], 1, e["wall"], e["cpu"] + e["cpuChild"],
+                    e["rss"]
+                )
+
+
+# Kinds of phases timed once per file, which are summarized together, and
+# those whose slowest files are listed separately
+PROFILE_GROUPED_CATS = ["read", "render", "page"]
+PROFILE_PER_FILE_CATS = {"read": "sources read", "page": "pages written"}
+
+
+def profile_span(name, cat, **kwargs):
+    """
+    Time a phase if the build is being profiled, and do nothing otherwise.
+    """
+
+    import contextlib
+
+    profiler = BuildProfiler.get_active()
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.span(name, cat, **kwargs)
+
+
+def profile_function(obj, strAttr, cat, label = None):
+    """
+    Replace a function or method with one timing every call, returning a
+    function that puts the original back. The label function, if any, names
+    each call from its arguments.
+    """
+
+    import functools
+
+    func = getattr(obj, strAttr)
+    strName = "{}.{}".format(getattr(obj, "__name__", obj), strAttr)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        name = label(*args, **kwargs) if label is not None else strName
+        with profile_span(name, cat):
+            return func(*args, **kwargs)
+
+    setattr(obj, strAttr, wrapper)
+    return lambda: setattr(obj, strAttr, func)
+
+
+def instrument_pelican():
+    """
+    Time the parts of an in-process Pelican run: the generators, every source
+    file read (and the Markdown and KaTeX work within), the rendering of the
+    templates and every page written. Returns a function undoing all of it.
+    Expects the plugins to have been loaded already.
+    """
+
+    import jinja2
+    import pelican.generators
+    import pelican.readers
+    import pelican.writers
+
+    lstUndo = []
+
+    # Every generator, including those of plugins
+    lstCls = [pelican.generators.Generator]
+    while lstCls:
+        cls = lstCls.pop()
+        lstCls.extend(cls.__subclasses__())
+        for strAttr in ["generate_context", "generate_output"]:
+            if strAttr in cls.__dict__:
+                lstUndo.append(profile_function(cls, strAttr, "generate"))
+
+    lstUndo.append(profile_function(
+        pelican.readers.Readers, "read_file", "read",
+        label = lambda self, base_path, path, *args, **kwargs: path
+    ))
+    lstUndo.append(profile_function(
+        pelican.readers.MarkdownReader, "read", "markdown"
+    ))
+    lstUndo.append(profile_function(
+        jinja2.Template, "render", "render",
+        label = lambda self, *args, **kwargs: "render {}".format(self.name)
+    ))
+    lstUndo.append(profile_function(
+        pelican.writers.Writer, "write_file", "page",
+        label = lambda self, name, *args, **kwargs: name
+    ))
+
+    # The KaTeX plugins, when loaded
+    for (strModule, strAttr) in [
+        ("pelican_katex.markdown", "render_latex"),
+        ("pelican_katex.restructuredtext", "render_latex"),
+        ("katex_cache", "prefetch"),
+    ]:
+        module = sys.modules.get(strModule)
+        if module is not None and hasattr(module, strAttr):
+            lstUndo.append(profile_function(module, strAttr, "katex"))
+
+    def undo():
+        for f in reversed(lstUndo):
+            f()
+
+    return undo
+
+
+def finish_profile():
+    profiler = BuildProfiler.get_active()
+    if profiler is None:
+        return
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    fpTrace = get_profile_trace_file()
+    profiler.save_trace(fpTrace)
+
+    archivist.info("")
+    archivist.info("Build profile:")
+    for line in profiler.summarize():
+        archivist.info("%s", line)
+    archivist.info("Trace written to [%s]", fpTrace)
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# RELEASE SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+def get_build_profile(cmdLineArgs):
+    if getattr(cmdLineArgs, ArgName.RELEASE, False):
+        return BuildProfile.RELEASE
+    else:
+        return BuildProfile.DEBUG
+
+
+# Elements whose contents are left exactly as they are
+HTML_RAW_ELEMENTS = ["pre", "textarea", "script", "style"]
+
+# Elements that are laid out as blocks (or not at all), so that whitespace next
+# to their tags is never rendered
+HTML_BLOCK_ELEMENTS = [
+    "!doctype", "html", "head", "body", "title", "meta", "link", "base",
+    "script", "style", "div", "p", "ul", "ol", "li", "dl", "dt", "dd", "nav",
+    "header", "footer", "main", "section", "article", "aside", "h1", "h2",
+    "h3", "h4", "h5", "h6", "hr", "table", "thead", "tbody", "tfoot", "tr",
+    "td", "th", "caption", "colgroup", "col", "form", "fieldset", "legend",
+    "figure", "figcaption", "blockquote", "pre", "address", "details",
+    "summary"
+]
+
+
+def squeeze_html_tag(tag):
+    import re
+
+    # Whitespace outside attribute values only separates attributes
+    lstPart = re.findall(r"""\"[^\"]*\"|'[^']*'|\s+|[^\s\"']+|.""", tag)
+    lstOut = []
+    for (i, part) in enumerate(lstPart):
+        if part.isspace():
+            if i + 1 < len(lstPart) and lstPart[i + 1].startswith((">", "/>")):
+                continue
+            part = " "
+        lstOut.append(part)
+
+    return "".join(lstOut)
+
+
+def minify_html(text):
+    """
+    Remove comments and collapse whitespace that does not affect how an HTML
+    document is rendered.
+    """
+
+    import re
+
+    reToken = re.compile(
+        r"<!--.*?-->|<!(?P<decl>[a-zA-Z]+)[^>]*>"
+        r"|<(?P<close>/?)(?P<name>[a-zA-Z][^\s/>]*)"
+        r"""(?:"[^"]*"|'[^']*'|[^'">])*>""",
+        re.DOTALL
+    )
+    reSpace = re.compile(r"[ \t\n\r\f]+")
+
+    # Split into text and tags, keeping the contents of raw elements with their
+    # opening tag
+    lstToken = []
+    pos = 0
+    while True:
+        m = reToken.search(text, pos)
+        if m is None:
+            lstToken.append(("text", text[pos:], None))
+            break
+
+        lstToken.append(("text", text[pos:m.start()], None))
+        pos = m.end()
+
+        strTag = m.group(0)
+        if strTag.startswith("<!--"):
+            # Conditional comments still mean something to old browsers
+            if strTag.startswith("<!--[if"):
+                lstToken.append(("tag", strTag, None))
+            continue
+
+        if m.group("decl"):
+            lstToken.append(("tag", strTag, "!" + m.group("decl").lower()))
+            continue
+
+        name = m.group("name").lower()
+        strTag = squeeze_html_tag(strTag)
+        if not m.group("close") and name in HTML_RAW_ELEMENTS and \
+                not strTag.endswith("/>"):
+            mEnd = re.compile(r"</{}\s*>".format(name), re.I).search(text, pos)
+            posEnd = len(text) if mEnd is None else mEnd.end()
+            strTag += text[pos:posEnd]
+            pos = posEnd
+
+        lstToken.append(("tag", strTag, name))
+
+    # Removing comments may have left pieces of text next to each other
+    lstMerged = []
+    for token in lstToken:
+        if token[0] == "text" and lstMerged and lstMerged[-1][0] == "text":
+            lstMerged[-1] = ("text", lstMerged[-1][1] + token[1], None)
+        else:
+            lstMerged.append(token)
+
+    def is_block(i):
+        if i < 0 or i >= len(lstMerged):
+            return True
+        return lstMerged[i][2] in HTML_BLOCK_ELEMENTS
+
+    lstOut = []
+    for (i, (kind, strPart, _)) in enumerate(lstMerged):
+        if kind == "text":
+            strPart = reSpace.sub(" ", strPart)
+            if is_block(i - 1):
+                strPart = strPart.lstrip(" ")
+            if is_block(i + 1):
+                strPart = strPart.rstrip(" ")
+        lstOut.append(strPart)
+
+    return "".join(lstOut)
+
+
+def minify_html_output(dpOut):
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+    archivist.info("Minifying HTML in the output directory")
+
+    numFile = 0
+    numSaved = 0
+    for fp in list_files(dpOut):
+        if op.splitext(fp)[1].lower() not in [".html", ".htm"]:
+            continue
+
+        with open(fp, "r", encoding = "utf-8") as f:
+            text = f.read()
+        textMin = minify_html(text)
+
+        # Minifying is idempotent, so pages already minified by an earlier
+        # release build are left untouched, modification time included
+        if textMin == text:
+            continue
+
+        with open(fp, "w", encoding = "utf-8") as f:
+            f.write(textMin)
+        numFile += 1
+        numSaved += len(text.encode("utf-8")) - len(textMin.encode("utf-8"))
+
+    archivist.info("Minified %d HTML files, saving %d bytes", numFile, numSaved)
+
+
+# Extensions of files worth compressing; everything else (images, WOFF fonts)
+# is compressed already
+COMPRESSIBLE_EXTS = [
+    ".html", ".htm", ".css", ".js", ".mjs", ".json", ".xml", ".svg", ".txt",
+    ".map", ".ico", ".ttf", ".otf", ".eot", ".webmanifest"
+]
+
+# Files smaller than this fit in a single packet anyway
+COMPRESS_MIN_SIZE = 256
+
+
+class CompressEncoding:
+    GZIP = "gzip"
+    BROTLI = "br"
+
+
+COMPRESS_SUFFIXES = {CompressEncoding.GZIP: ".gz", CompressEncoding.BROTLI: ".br"}
+
+
+def get_compress_manifest_file():
+    # Lives in the output directory, for whatever serves it
+    return "precompressed.json"
+
+
+def get_compressors():
+    """
+    Map each available encoding to a function compressing bytes with it.
+    Brotli is only available if the brotli module is installed.
+    """
+
+    import gzip
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    # A fixed modification time keeps the output reproducible
+    dtCompressor = {
+        CompressEncoding.GZIP:
+            lambda data: gzip.compress(data, compresslevel = 9, mtime = 0)
+    }
+
+    try:
+        import brotli
+        dtCompressor[CompressEncoding.BROTLI] = \
+            lambda data: brotli.compress(data, quality = 11)
+    except ImportError:
+        archivist.warning("Brotli module not available, only using gzip")
+
+    return dtCompressor
+
+
+def compress_file(fp, dtCompressor):
+    """
+    Write the compressed siblings of a file that are missing or out of date.
+    A sibling is up to date if it has the same modification time as the file,
+    since it gets that time when written. Returns the sizes of the siblings
+    by encoding, along with the number of them that were written.
+    """
+
+    st = os.stat(fp)
+    data = None
+
+    dtSize = {}
+    numWritten = 0
+    for (encoding, compress) in dtCompressor.items():
+        fpOut = fp + COMPRESS_SUFFIXES[encoding]
+        try:
+            stOut = os.stat(fpOut)
+            if stOut.st_mtime_ns == st.st_mtime_ns:
+                dtSize[encoding] = stOut.st_size
+                continue
+        except FileNotFoundError:
+            pass
+
+        if data is None:
+            with open(fp, "rb") as f:
+                data = f.read()
+        dataOut = compress(data)
+
+        if len(dataOut) >= len(data):
+            # Not worth serving
+            if op.isfile(fpOut):
+                os.remove(fpOut)
+            continue
+
+        fpTmp = fpOut + ".tmp"
+        with open(fpTmp, "wb") as f:
+            f.write(dataOut)
+        os.utime(fpTmp, ns = (st.st_atime_ns, st.st_mtime_ns))
+        os.replace(fpTmp, fpOut)
+
+        dtSize[encoding] = len(dataOut)
+        numWritten += 1
+
+    return (dtSize, numWritten)
+
+
+def compress_output(dpOut):
+    from concurrent.futures import ThreadPoolExecutor
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+    archivist.info("Compressing the output directory")
+
+    dtCompressor = get_compressors()
+    setSuffix = set(COMPRESS_SUFFIXES.values())
+
+    fpManifest = op.join(dpOut, get_compress_manifest_file())
+
+    lstFp = []
+    for fp in list_files(dpOut):
+        if fp == fpManifest:
+            continue
+
+        (fpBase, ext) = op.splitext(fp)
+        if ext in setSuffix:
+            # Remove siblings of files that are gone
+            if not op.isfile(fpBase):
+                os.remove(fp)
+            continue
+
+        if ext.lower() in COMPRESSIBLE_EXTS and \
+                op.getsize(fp) >= COMPRESS_MIN_SIZE:
+            lstFp.append(fp)
+
+    # Both zlib and brotli release the GIL while compressing
+    with ThreadPoolExecutor(max_workers = os.cpu_count() or 1) as executor:
+        lstResult = list(executor.map(
+            lambda fp: compress_file(fp, dtCompressor), lstFp
+        ))
+
+    # Record what each sibling was compressed from, so that whatever serves
+    # the output can tell whether a sibling is safe to use
+    dtManifest = {}
+    numWritten = 0
+    for (fp, (dtSize, n)) in zip(lstFp, lstResult):
+        numWritten += n
+        if not dtSize:
+            continue
+
+        st = os.stat(fp)
+        dtManifest[op.relpath(fp, dpOut).replace(os.sep, "/")] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "encodings": dtSize
+        }
+
+    save_json_file(fpManifest, dtManifest)
+    archivist.info(
+        "Wrote %d compressed files, %d were up to date", numWritten,
+        sum(len(dtEntry["encodings"]) for dtEntry in dtManifest.values()) -
+            numWritten
+    )
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# ICON SPRITE SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+def read_settings_file(fpSettings):
+    """
+    Read the settings as they are written in the settings file, without any of
+    the defaults or path resolution Pelican applies.
+    """
+
+    import runpy
+
+    dtGlobal = runpy.run_path(fpSettings)
+    return dict((k, v) for (k, v) in dtGlobal.items() if k.isupper())
+
+
+def find_static_source(dtSetting, dpIn, strOutPath):
+    """
+    Find the source of a static file that EXTRA_PATH_METADATA saves to the
+    given output path.
+    """
+
+    for (fp, dtMeta) in dtSetting.get("EXTRA_PATH_METADATA", {}).items():
+        if dtMeta.get("path") == strOutPath:
+            return op.normpath(op.join(dpIn, fp))
+
+    return None
+
+
+def find_used_icons(lstFp, setIcon):
+    import re
+
+    reIcon = re.compile(r"\bicon-[A-Za-z0-9_-]+")
+    reInlined = re.compile(r"<svg data-icon-sprite[^>]*>.*?</svg>", re.DOTALL)
+
+    setUsed = set()
+    for fp in lstFp:
+        with open(fp, "r", encoding = "utf-8") as f:
+            # An inlined sprite holds every icon used anywhere, not only here
+            setUsed.update(reIcon.findall(reInlined.sub("", f.read())))
+
+    return setUsed & setIcon
+
+
+def subset_icon_sprite(svg, setUsed):
+    import re
+
+    reSymbol = re.compile(
+        r"""<symbol\b[^>]*\bid=["']([^"']+)["'].*?</symbol>\s*""", re.DOTALL
+    )
+    return reSymbol.sub(
+        lambda m: m.group(0) if m.group(1) in setUsed else "", svg
+    )
+
+
+def subset_icon_css(css, setUsed):
+    import re
+
+    reComment = re.compile(r"/\*.*?\*/\s*", re.DOTALL)
+    reRule = re.compile(r"([^{}]+)\{([^{}]*)\}\s*")
+    reIcon = re.compile(r"\.(icon-[A-Za-z0-9_-]+)")
+
+    def filter_rule(m):
+        lstSelector = [
+            s.strip() for s in m.group(1).split(",")
+            if all(i in setUsed for i in reIcon.findall(s))
+        ]
+        if not lstSelector:
+            return ""
+        return "{} {{{}}}\n\n".format(", ".join(lstSelector), m.group(2))
+
+    return reRule.sub(filter_rule, reComment.sub("", css)).strip() + "\n"
+
+
+def inline_icon_sprite(html, svg, strSpriteUrl):
+    """
+    Put the sprite at the start of the body of a page (replacing any sprite
+    put there before) and point the references to it at the inlined copy.
+    """
+
+    import re
+
+    # The sprite is marked with a hash of itself, so that pages which already
+    # have it are left alone even after being minified
+    strMarker = 'data-icon-sprite="{}"'.format(hash_bytes(svg.encode())[:16])
+    if strMarker in html:
+        return html
+
+    reInlined = re.compile(r"<svg data-icon-sprite[^>]*>.*?</svg>", re.DOTALL)
+    html = reInlined.sub("", html)
+
+    svg = re.sub(r"<\?xml[^>]*\?>\s*", "", svg).strip()
+    svg = svg.replace("<svg", "<svg " + strMarker, 1)
+
+    mBody = re.search(r"<body\b[^>]*>", html, re.IGNORECASE)
+    if mBody is None:
+        return html
+    html = html[:mBody.end()] + svg + html[mBody.end():]
+
+    return re.sub(
+        r"""(href=["'])[^"'#]*{}#""".format(re.escape(strSpriteUrl)),
+        r"\1#", html
+    )
+
+
+def subset_icons(dtPelPath):
+    """
+    Cut the icon sprite and its stylesheet in the output directory down to the
+    icons referenced by the pages and templates. Pelican copies the full ones
+    on every run, so this starts from the sources every time.
+    """
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    fpSettings = dtPelPath[PelicanArgLabel.SETTINGS]
+    dpCur = op.dirname(fpSettings)
+    dpOut = dtPelPath[PelicanArgLabel.OUTPUT]
+    dtSetting = read_settings_file(fpSettings)
+
+    strSvgPath = dtSetting.get("ICONS_SVG_PATH")
+    strCssPath = dtSetting.get("ICONS_CSS_PATH")
+    dpIn = op.join(dpCur, dtSetting.get("PATH", get_pel_input_dir()))
+    fpSvgIn = find_static_source(dtSetting, dpIn, strSvgPath)
+    if strSvgPath is None or fpSvgIn is None or not op.isfile(fpSvgIn):
+        archivist.debug("No icon sprite to subset")
+        return
+
+    with open(fpSvgIn, "r", encoding = "utf-8") as f:
+        svg = f.read()
+
+    import re
+    setIcon = set(re.findall(r"""<symbol\b[^>]*\bid=["']([^"']+)["']""", svg))
+
+    lstFpHtml = [
+        fp for fp in list_files(dpOut)
+        if op.splitext(fp)[1].lower() in [".html", ".htm"]
+    ]
+    lstFpTemplate = list_files(op.join(dpCur, "theme", "templates"))
+    setUsed = find_used_icons(lstFpHtml + lstFpTemplate, setIcon)
+
+    svg = subset_icon_sprite(svg, setUsed)
+    dtOut = {strSvgPath: svg}
+
+    fpCssIn = find_static_source(dtSetting, dpIn, strCssPath)
+    if strCssPath is not None and fpCssIn is not None and op.isfile(fpCssIn):
+        with open(fpCssIn, "r", encoding = "utf-8") as f:
+            dtOut[strCssPath] = subset_icon_css(f.read(), setUsed)
+
+    for (strPath, text) in dtOut.items():
+        fp = op.join(dpOut, strPath)
+        with open(fp, "r", encoding = "utf-8") as f:
+            flagSame = f.read() == text
+        if not flagSame:
+            with open(fp, "w", encoding = "utf-8") as f:
+                f.write(text)
+
+    archivist.info(
+        "Kept %d of %d icons: %s", len(setUsed), len(setIcon),
+        ", ".join(sorted(setUsed))
+    )
+
+    if not dtSetting.get("ICONS_SVG_INLINE", False):
+        return
+
+    numInlined = 0
+    for fp in lstFpHtml:
+        with open(fp, "r", encoding = "utf-8") as f:
+            html = f.read()
+        htmlNew = inline_icon_sprite(html, svg, strSvgPath)
+
+        # Pages that Pelican did not write this time already have it
+        if htmlNew != html:
+            with open(fp, "w", encoding = "utf-8") as f:
+                f.write(htmlNew)
+            numInlined += 1
+
+    archivist.info("Inlined the icon sprite into %d pages", numInlined)
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# RESPONSIVE IMAGE SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# Kinds of images that get resized copies, with the format of the copies that
+# browsers without support for the formats in IMAGE_FORMATS fall back to
+IMAGE_FALLBACK_FORMATS = {".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg"}
+
+IMAGE_FORMAT_EXTS = {
+    "avif": ".avif", "webp": ".webp", "png": ".png", "jpeg": ".jpg"
+}
+
+IMAGE_MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+# Pillow's options for each format
+IMAGE_ENCODE_OPTIONS = {
+    "avif": {"quality": 55},
+    "webp": {"quality": 80, "method": 6},
+    "png": {"optimize": True},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+
+
+def get_image_cache_dir():
+    # Needs to be consistent with get_purgeable_cache_files
+    return op.join(get_cache_dir(), "images")
+
+
+def get_image_record_file():
+    return op.join(get_cache_dir(), "image-derivatives.json")
+
+
+def get_derivative_path(strPath, width, fmt):
+    return "{}-{}w{}".format(
+        op.splitext(strPath)[0], width, IMAGE_FORMAT_EXTS[fmt]
+    )
+
+
+def encode_image(fpSrc, width, fmt, fpDest):
+    """
+    Write a copy of an image scaled down to a width. Runs in a worker process.
+    """
+
+    from PIL import Image
+
+    with Image.open(fpSrc) as im:
+        im.load()
+
+        flagAlpha = im.mode in ["RGBA", "LA", "PA"] or \
+            "transparency" in im.info
+        if fmt == "jpeg":
+            im = im.convert("RGB")
+        elif im.mode not in ["RGB", "RGBA", "L", "LA"]:
+            im = im.convert("RGBA" if flagAlpha else "RGB")
+
+        if im.width != width:
+            height = max(1, round(im.height * width / im.width))
+            im = im.resize((width, height), Image.LANCZOS)
+
+        fpTemp = fpDest + ".tmp"
+        im.save(fpTemp, format = fmt.upper(), **IMAGE_ENCODE_OPTIONS[fmt])
+
+    os.replace(fpTemp, fpDest)
+
+
+def parse_html_attrs(strTag):
+    """
+    Split the attributes of an HTML start tag into a list of names and raw
+    values (with their quotes, or None for attributes without a value).
+    """
+
+    import re
+
+    strBody = re.sub(r"^<[^\s/>]+|/?>$", "", strTag)
+    return [
+        [m.group(1).lower(), m.group(2)] for m in re.finditer(
+            r"""([^\s"'=<>/]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'=<>`]+))?""",
+            strBody
+        )
+    ]
+
+
+def get_html_attr(lstAttr, name):
+    import html
+
+    for (strName, strRaw) in lstAttr:
+        if strName == name:
+            if strRaw is None:
+                return ""
+            return html.unescape(strRaw.strip("\"'"))
+
+    return None
+
+
+def format_html_attrs(lstAttr):
+    return "".join(
+        " " + strName if strRaw is None else " {}={}".format(strName, strRaw)
+        for (strName, strRaw) in lstAttr
+    )
+
+
+class ImageTagRewriter:
+    """
+    Wraps the image elements of pages referring to images with resized copies
+    in picture elements offering the copies. The picture elements record the
+    attributes added to the images, so that later builds can take them off
+    again before rewriting the images afresh.
+    """
+
+    def __init__(self, dpOut, strSiteUrl, dtImage, strSizes, dtPathSizes):
+        self.dpOut = dpOut
+        self.strSiteUrl = strSiteUrl
+        self.dtImage = dtImage
+        self.strSizes = strSizes
+        self.dtPathSizes = dtPathSizes
+
+    def unwrap(self, m):
+        setAdded = set(m.group("added").split())
+        lstAttr = [
+            a for a in parse_html_attrs(m.group("img"))
+            if a[0] not in setAdded
+        ]
+        return "<img" + format_html_attrs(lstAttr) + ">"
+
+    def make_srcset(self, strUrl, lstCandidate):
+        import posixpath
+        from urllib.parse import quote
+
+        # Copies are next to the original, so the URL only needs a new name;
+        # any fingerprint is put back by the fingerprinting step
+        (strDir, _) = posixpath.split(strUrl.split("#")[0].split("?")[0])
+        return ", ".join(
+            "{}{} {}w".format(
+                strDir + "/" if strDir else "",
+                quote(posixpath.basename(strPath)), width
+            )
+            for (width, strPath) in lstCandidate
+        )
+
+    def rewrite_img(self, strTag, fpPage):
+        import html
+
+        lstAttr = parse_html_attrs(strTag)
+        strSrc = get_html_attr(lstAttr, "src")
+        if strSrc is None or get_html_attr(lstAttr, "srcset") is not None:
+            return strTag
+
+        strPath = resolve_output_url(
+            strSrc, fpPage, self.dpOut, self.strSiteUrl
+        )
+        entry = self.dtImage.get(strip_fingerprint(strPath or ""))
+        if entry is None:
+            return strTag
+
+        lstAdded = []
+
+        def add_attr(name, value):
+            lstAttr.append([name, '"{}"'.format(html.escape(str(value)))])
+            lstAdded.append(name)
+
+        strSizes = get_html_attr(lstAttr, "sizes")
+        if strSizes is None:
+            strSizes = self.dtPathSizes.get(
+                strip_fingerprint(strPath), self.strSizes
+            )
+            add_attr("sizes", strSizes)
+
+        # The original itself is the largest candidate in its own format
+        (width, height) = entry["size"]
+        lstFallback = entry["derivatives"][entry["fallback"]] + \
+            [[width, strPath]]
+        add_attr("srcset", self.make_srcset(strSrc, lstFallback))
+
+        if get_html_attr(lstAttr, "width") is None and \
+                get_html_attr(lstAttr, "height") is None:
+            add_attr("width", width)
+            add_attr("height", height)
+
+        lstSource = []
+        for (fmt, lstCandidate) in entry["derivatives"].items():
+            if fmt == entry["fallback"] or not lstCandidate:
+                continue
+            lstSource.append('<source type="{}" srcset="{}" sizes="{}">'.format(
+                IMAGE_MIME_TYPES[fmt],
+                html.escape(self.make_srcset(strSrc, lstCandidate)),
+                html.escape(strSizes)
+            ))
+
+        return '<picture data-derived="{}">{}<img{}></picture>'.format(
+            " ".join(lstAdded), "".join(lstSource), format_html_attrs(lstAttr)
+        )
+
+    def rewrite_html(self, text, fpPage):
+        import re
+
+        def rewrite(m):
+            if m.group("added") is not None:
+                strNew = self.rewrite_img(self.unwrap(m), fpPage)
+                # Unless something changed, the picture stays as it was,
+                # including any fingerprints added since
+                if strip_fingerprints(strNew) == \
+                        strip_fingerprints(m.group(0)):
+                    return m.group(0)
+                return strNew
+            elif m.group("picture") is not None:
+                # Images in picture elements of their own are left to them
+                return m.group(0)
+            else:
+                return self.rewrite_img(m.group(0), fpPage)
+
+        return re.sub(
+            r"""<picture\s+data-derived=["']?(?P<added>[^"'>]*)["']?\s*>"""
+            r"""\s*(?:<source\b[^>]*>\s*)*(?P<img><img\b[^>]*>)\s*</picture>"""
+            r"|(?P<picture><picture\b.*?</picture>)|<img\b[^>]*>",
+            rewrite, text, flags = re.IGNORECASE | re.DOTALL
+        )
+
+
+def make_responsive_images(dtPelPath):
+    """
+    Make resized copies of the images under the directories in IMAGE_PATHS,
+    at the widths in IMAGE_WIDTHS, in the formats in IMAGE_FORMATS and in the
+    format of the original, and offer them to browsers through srcset and sizes
+    wherever the pages show the originals. Copies are cached by the hash of
+    the original and encoded by a pool of processes.
+    """
+
+    import filecmp
+    import json
+    import re
+    import shutil
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    try:
+        import PIL
+        from PIL import Image, features
+    except ImportError:
+        archivist.warning("Pillow module not available, leaving images as is")
+        return
+
+    fpSettings = dtPelPath[PelicanArgLabel.SETTINGS]
+    dpOut = dtPelPath[PelicanArgLabel.OUTPUT]
+    dtSetting = read_settings_file(fpSettings)
+    lstWidth = sorted(set(dtSetting.get("IMAGE_WIDTHS", [])))
+    strSizes = dtSetting.get("IMAGE_SIZES", "100vw")
+
+    lstFormat = []
+    for fmt in dtSetting.get("IMAGE_FORMATS", []):
+        if fmt in IMAGE_MIME_TYPES and features.check(fmt):
+            lstFormat.append(fmt)
+        else:
+            archivist.warning("Cannot encode %s images, leaving them out", fmt)
+
+    # Copies are only good for the encoder options and Pillow they came from
+    strConfig = hash_bytes(json.dumps(
+        [PIL.__version__, IMAGE_ENCODE_OPTIONS], sort_keys = True
+    ).encode("utf-8"))[:16]
+
+    fpRecord = get_image_record_file()
+    dtOld = load_json_file(fpRecord, {})
+    setOldCopy = set(
+        strCopy for entry in dtOld.values()
+        for lstCandidate in entry["derivatives"].values()
+        for (_, strCopy) in lstCandidate
+    )
+
+    # Originals, without the copies (in case the record went missing) or
+    # fingerprinted versions of either
+    setSuffix = set(COMPRESS_SUFFIXES.values())
+    lstPath = []
+    for dp in dtSetting.get("IMAGE_PATHS", []):
+        for fp in list_files(op.join(dpOut, dp)):
+            strPath = op.relpath(fp, dpOut).replace(os.sep, "/")
+            (strBase, ext) = op.splitext(strPath)
+            if ext in setSuffix or \
+                    ext.lower() not in IMAGE_FALLBACK_FORMATS or \
+                    strPath in setOldCopy or \
+                    strip_fingerprint(strPath) != strPath:
+                continue
+            m = re.match(r"^(.*)-\d+w$", strBase)
+            if m and any(
+                op.isfile(op.join(dpOut, m.group(1) + e))
+                for e in IMAGE_FALLBACK_FORMATS
+            ):
+                continue
+            lstPath.append(strPath)
+
+    dpCache = get_image_cache_dir()
+    dtImage = {}
+    lstTask = []
+    lstCopy = []
+    for strPath in lstPath:
+        fp = op.join(dpOut, strPath)
+        with open(fp, "rb") as f:
+            strHash = hash_bytes(f.read())
+        with Image.open(fp) as im:
+            (width, height) = im.size
+
+        fallback = IMAGE_FALLBACK_FORMATS[op.splitext(strPath)[1].lower()]
+        dtDerivative = {}
+        for fmt in lstFormat + [fallback]:
+            # Other formats get a copy at full size too, since the original
+            # is only good for browsers that support nothing better
+            lstCopyWidth = [w for w in lstWidth if w < width]
+            if fmt != fallback:
+                lstCopyWidth.append(width)
+
+            dtDerivative[fmt] = []
+            for w in lstCopyWidth:
+                fpCache = op.join(dpCache, "{}-{}-{}{}".format(
+                    strHash[:32], strConfig, w, IMAGE_FORMAT_EXTS[fmt]
+                ))
+                if not op.isfile(fpCache):
+                    lstTask.append((fp, w, fmt, fpCache))
+                strCopy = get_derivative_path(strPath, w, fmt)
+                dtDerivative[fmt].append([w, strCopy])
+                lstCopy.append((fpCache, strCopy, fp, w == width))
+
+        dtImage[strPath] = {
+            "hash": strHash, "size": [width, height], "fallback": fallback,
+            "derivatives": dtDerivative
+        }
+
+    if lstTask:
+        from concurrent.futures import ProcessPoolExecutor
+
+        os.makedirs(dpCache, exist_ok = True)
+        with ProcessPoolExecutor(max_workers = os.cpu_count() or 1) as pool:
+            list(pool.map(encode_image, *zip(*lstTask)))
+
+    # Full-size copies that come out no smaller than the original are not
+    # worth offering
+    setUseless = set()
+    numWritten = 0
+    for (fpCache, strCopy, fpOrig, flagFull) in lstCopy:
+        if flagFull and op.getsize(fpCache) >= op.getsize(fpOrig):
+            setUseless.add(strCopy)
+            continue
+
+        fpOut = op.join(dpOut, strCopy)
+        if not op.isfile(fpOut) or \
+                not filecmp.cmp(fpCache, fpOut, shallow = False):
+            shutil.copyfile(fpCache, fpOut)
+            numWritten += 1
+
+    setNewCopy = set()
+    for entry in dtImage.values():
+        for (fmt, lstCandidate) in entry["derivatives"].items():
+            entry["derivatives"][fmt] = [
+                c for c in lstCandidate if c[1] not in setUseless
+            ]
+            setNewCopy.update(c[1] for c in entry["derivatives"][fmt])
+
+    for strCopy in setOldCopy - setNewCopy:
+        fp = op.join(dpOut, strCopy)
+        if op.isfile(fp):
+            os.remove(fp)
+
+    rewriter = ImageTagRewriter(
+        dpOut, dtSetting.get("SITEURL", ""), dtImage, strSizes,
+        dtSetting.get("IMAGE_PATH_SIZES", {})
+    )
+    numRewritten = 0
+    for fp in list_files(dpOut):
+        if op.splitext(fp)[1].lower() not in [".html", ".htm"]:
+            continue
+
+        with open(fp, "r", encoding = "utf-8") as f:
+            html = f.read()
+        htmlNew = rewriter.rewrite_html(html, fp)
+        if htmlNew != html:
+            with open(fp, "w", encoding = "utf-8") as f:
+                f.write(htmlNew)
+            numRewritten += 1
+
+    if dtImage != dtOld:
+        save_json_file(fpRecord, dtImage)
+
+    archivist.info(
+        "Made %d resized copies of %d images (%d encoded, %d written), " \
+            "rewrote %d pages",
+        len(setNewCopy), len(dtImage), len(lstTask), numWritten, numRewritten
+    )
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# STYLESHEET BUNDLE SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+def resolve_output_url(strUrl, fpPage, dpOut, strSiteUrl):
+    """
+    Work out which file in the output directory a URL found in a page (or
+    stylesheet) refers to. Returns the path relative to the output directory,
+    or None if the URL points elsewhere.
+    """
+
+    from urllib.parse import unquote, urlsplit
+
+    strUrl = strUrl.strip()
+    if strSiteUrl and strUrl.startswith(strSiteUrl + "/"):
+        strUrl = strUrl[len(strSiteUrl):]
+
+    parts = urlsplit(strUrl)
+    if parts.scheme or parts.netloc or not parts.path:
+        return None
+
+    strPath = unquote(parts.path)
+    if strPath.startswith("/"):
+        fp = op.join(dpOut, strPath.lstrip("/"))
+    else:
+        fp = op.join(op.dirname(fpPage), strPath)
+
+    strRelPath = op.relpath(op.normpath(fp), dpOut)
+    if strRelPath.startswith(".."):
+        return None
+    return strRelPath.replace(os.sep, "/")
+
+
+class HtmlUsageCollector:
+    """
+    Collects the element names, classes and ids used by HTML pages.
+    """
+
+    def __init__(self):
+        from html.parser import HTMLParser
+
+        self.setTag = set()
+        self.setClass = set()
+        self.setId = set()
+
+        collector = self
+
+        class Parser(HTMLParser):
+            def handle_starttag(self, tag, attrs):
+                collector.setTag.add(tag.lower())
+                for (k, v) in attrs:
+                    if k == "class" and v:
+                        collector.setClass.update(v.split())
+                    elif k == "id" and v:
+                        collector.setId.add(v)
+
+        self._parser = Parser()
+
+    def feed(self, html):
+        self._parser.feed(html)
+        self._parser.close()
+        self._parser.reset()
+
+
+def split_css_top_level(text, sep):
+    # Split on a character that is not inside parentheses, brackets or strings
+    lstPart = []
+    depth = 0
+    quote = None
+    start = 0
+    for (i, c) in enumerate(text):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == sep and depth == 0:
+            lstPart.append(text[start:i])
+            start = i + 1
+    lstPart.append(text[start:])
+
+    return lstPart
+
+
+def parse_css_blocks(css):
+    """
+    Split a stylesheet without comments into (prelude, body) pairs, where the
+    body is None for statements like @import that end with a semicolon.
+    """
+
+    lstBlock = []
+    pos = 0
+    n = len(css)
+    while pos < n:
+        # Find the end of the prelude
+        i = pos
+        quote = None
+        while i < n:
+            c = css[i]
+            if quote:
+                if c == quote:
+                    quote = None
+            elif c in "\"'":
+                quote = c
+            elif c in "{;":
+                break
+            i += 1
+
+        prelude = css[pos:i].strip()
+        if i >= n:
+            if prelude:
+                lstBlock.append((prelude, None))
+            break
+
+        if css[i] == ";":
+            lstBlock.append((prelude, None))
+            pos = i + 1
+            continue
+
+        # Find the matching closing brace
+        depth = 1
+        j = i + 1
+        quote = None
+        while j < n and depth > 0:
+            c = css[j]
+            if quote:
+                if c == quote:
+                    quote = None
+            elif c in "\"'":
+                quote = c
+            elif c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            j += 1
+
+        lstBlock.append((prelude, css[i + 1:j - 1]))
+        pos = j
+
+    return lstBlock
+
+
+def is_selector_used(selector, usage):
+    import re
+
+    # Pseudo-classes, pseudo-elements and attribute selectors are not checked
+    selector = re.sub(r"\[[^\]]*\]", "", selector)
+    selector = re.sub(r"::?[A-Za-z-]+(\([^)]*\))?", "", selector)
+
+    for c in re.findall(r"\.(-?[_A-Za-z][\w-]*)", selector):
+        if c not in usage.setClass:
+            return False
+    for i in re.findall(r"#(-?[_A-Za-z][\w-]*)", selector):
+        if i not in usage.setId:
+            return False
+
+    selector = re.sub(r"[.#]-?[_A-Za-z][\w-]*", "", selector)
+    for tag in re.findall(r"(?:^|[\s>+~])([A-Za-z][\w-]*)", selector):
+        if tag.lower() not in usage.setTag:
+            return False
+
+    return True
+
+
+# At-rules whose contents are rules themselves
+CSS_NESTING_AT_RULES = ["@media", "@supports", "@document"]
+
+
+def purge_css(css, usage):
+    """
+    Drop the rules of a stylesheet whose selectors match nothing in the pages,
+    returning the compacted stylesheet and the number of rules dropped.
+    """
+
+    import re
+
+    css = re.sub(r"/\*.*?\*/", "", css, flags = re.DOTALL)
+
+    lstOut = []
+    numDropped = 0
+    for (prelude, body) in parse_css_blocks(css):
+        prelude = re.sub(r"\s+", " ", prelude)
+        if body is None:
+            lstOut.append(prelude + ";")
+        elif prelude.lower().startswith(tuple(CSS_NESTING_AT_RULES)):
+            (bodyNew, n) = purge_css(body, usage)
+            numDropped += n
+            if bodyNew:
+                lstOut.append("{}{{{}}}".format(prelude, bodyNew))
+        elif prelude.startswith("@"):
+            lstOut.append("{}{{{}}}".format(prelude, body.strip()))
+        else:
+            lstSelector = [
+                s.strip() for s in split_css_top_level(prelude, ",")
+                if is_selector_used(s, usage)
+            ]
+            if lstSelector:
+                strBody = re.sub(r"\s*\n\s*", " ", body.strip())
+                lstOut.append("{}{{{}}}".format(",".join(lstSelector), strBody))
+            else:
+                numDropped += 1
+
+    return ("\n".join(lstOut), numDropped)
+
+
+def rebase_css_urls(css, strFrom, strTo):
+    """
+    Make the relative URLs in a stylesheet at one output path work from
+    another.
+    """
+
+    import posixpath
+    import re
+
+    def rebase(m):
+        strUrl = m.group(2)
+        if re.match(r"^([a-z][a-z0-9+.-]*:|/|#)", strUrl, re.IGNORECASE):
+            return m.group(0)
+        strPath = posixpath.normpath(
+            posixpath.join(posixpath.dirname(strFrom), strUrl)
+        )
+        strNew = posixpath.relpath(strPath, posixpath.dirname(strTo))
+        return "url({0}{1}{0})".format(m.group(1), strNew)
+
+    return re.sub(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""", rebase, css)
+
+
+def bundle_css(dtPelPath):
+    """
+    Combine the stylesheets named by CSS_BUNDLE into the one at
+    CSS_BUNDLE_PATH, without the rules that no page uses, and make the pages
+    link to that instead.
+    """
+
+    import re
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    fpSettings = dtPelPath[PelicanArgLabel.SETTINGS]
+    dpOut = dtPelPath[PelicanArgLabel.OUTPUT]
+    dtSetting = read_settings_file(fpSettings)
+
+    lstCssPath = dtSetting.get("CSS_BUNDLE", [])
+    strBundlePath = dtSetting.get("CSS_BUNDLE_PATH")
+    strSiteUrl = dtSetting.get("SITEURL", "")
+    if not lstCssPath or not strBundlePath:
+        archivist.debug("No stylesheets to bundle")
+        return
+
+    lstFpHtml = [
+        fp for fp in list_files(dpOut)
+        if op.splitext(fp)[1].lower() in [".html", ".htm"]
+    ]
+
+    usage = HtmlUsageCollector()
+    for fp in lstFpHtml:
+        with open(fp, "r", encoding = "utf-8") as f:
+            usage.feed(f.read())
+
+    lstBundle = []
+    sizeIn = 0
+    numDropped = 0
+    for strPath in lstCssPath:
+        with open(op.join(dpOut, strPath), "r", encoding = "utf-8") as f:
+            css = f.read().lstrip("\ufeff")
+        sizeIn += len(css.encode("utf-8"))
+
+        (css, n) = purge_css(css, usage)
+        numDropped += n
+        lstBundle.append(rebase_css_urls(css, strPath, strBundlePath))
+
+    # @charset and @import are only allowed at the very start of a stylesheet,
+    # so they cannot stay where they were
+    bundle = "\n".join(lstBundle)
+    lstHoisted = re.findall(r"^@(?:charset|import)\b[^;]*;\n?", bundle, re.M)
+    bundle = re.sub(
+        r"^@(?:charset|import)\b[^;]*;\n?", "", bundle, flags = re.M
+    )
+    bundle = "".join(
+        s for s in lstHoisted if s.startswith("@charset")
+    ) + "".join(
+        s for s in lstHoisted if s.startswith("@import")
+    ) + bundle + "\n"
+
+    fpBundle = op.join(dpOut, strBundlePath)
+    flagSame = False
+    if op.isfile(fpBundle):
+        with open(fpBundle, "r", encoding = "utf-8") as f:
+            flagSame = f.read() == bundle
+    if not flagSame:
+        with open(fpBundle, "w", encoding = "utf-8") as f:
+            f.write(bundle)
+
+    archivist.info(
+        "Bundled %d stylesheets into [%s], dropping %d unused rules, %d -> %d "
+        "bytes", len(lstCssPath), strBundlePath, numDropped, sizeIn,
+        len(bundle.encode("utf-8"))
+    )
+
+    # The first link to a bundled stylesheet becomes the link to the bundle,
+    # and the others go
+    setCssPath = set(lstCssPath)
+    reLink = re.compile(r"<link\b[^>]*>\s*", re.IGNORECASE)
+    reRel = re.compile(r"""\brel=["']?stylesheet\b""", re.IGNORECASE)
+    reHref = re.compile(r"""\bhref=(["'])([^"']*)\1""", re.IGNORECASE)
+
+    numRewritten = 0
+    for fp in lstFpHtml:
+        with open(fp, "r", encoding = "utf-8") as f:
+            html = f.read()
+
+        lstFlag = [False]
+
+        def replace_link(m):
+            mHref = reHref.search(m.group(0))
+            if not reRel.search(m.group(0)) or mHref is None:
+                return m.group(0)
+            strPath = resolve_output_url(mHref.group(2), fp, dpOut, strSiteUrl)
+            if strPath not in setCssPath:
+                return m.group(0)
+
+            if lstFlag[0]:
+                return ""
+            lstFlag[0] = True
+            return m.group(0).replace(
+                mHref.group(0),
+                'href="{}/{}"'.format(strSiteUrl, strBundlePath), 1
+            )
+
+        htmlNew = reLink.sub(replace_link, html)
+        if htmlNew != html:
+            with open(fp, "w", encoding = "utf-8") as f:
+                f.write(htmlNew)
+            numRewritten += 1
+
+    archivist.info("Linked %d pages to the bundle", numRewritten)
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# CRITICAL CSS SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# Attribute marking what is added to the pages, so that the next release build
+# can take it out again before starting over on pages it did not regenerate
+CRITICAL_CSS_MARK = "data-critical-css"
+
+# Elements whose text is never shown
+CRITICAL_CSS_HIDDEN_ELEMENTS = ["script", "style", "noscript", "template"]
+
+# At-rules left to the full stylesheets: fonts are swapped in once those load,
+# and an inline style cannot import anything without blocking
+CRITICAL_CSS_DEFERRED_AT_RULES = ["@font-face", "@import", "@charset"]
+
+
+class FoldUsageCollector:
+    """
+    Collects the element names, classes and ids used by the part of HTML pages
+    shown before scrolling, taken to be everything up to a given amount of
+    text into the body.
+    """
+
+    def __init__(self, numFold):
+        from html.parser import HTMLParser
+
+        self.setTag = set()
+        self.setClass = set()
+        self.setId = set()
+
+        collector = self
+
+        class Parser(HTMLParser):
+            def reset(self):
+                super().reset()
+                self.numText = 0
+                self.numHidden = 0
+                self.flagBody = False
+
+            def handle_starttag(self, tag, attrs):
+                tag = tag.lower()
+                if self.numText >= numFold:
+                    return
+
+                if tag == "body":
+                    self.flagBody = True
+                elif tag in CRITICAL_CSS_HIDDEN_ELEMENTS:
+                    self.numHidden += 1
+
+                collector.setTag.add(tag)
+                for (k, v) in attrs:
+                    if k == "class" and v:
+                        collector.setClass.update(v.split())
+                    elif k == "id" and v:
+                        collector.setId.add(v)
+
+            def handle_endtag(self, tag):
+                if tag.lower() in CRITICAL_CSS_HIDDEN_ELEMENTS:
+                    self.numHidden = max(0, self.numHidden - 1)
+
+            def handle_data(self, data):
+                if self.flagBody and not self.numHidden:
+                    self.numText += len(" ".join(data.split()))
+
+        self._parser = Parser()
+
+    def feed(self, html):
+        self._parser.feed(html)
+        self._parser.close()
+        self._parser.reset()
+
+
+def extract_critical_css(css, usage):
+    """
+    Cut a stylesheet down to the rules that apply to the elements in usage,
+    leaving out fonts and imports.
+    """
+
+    (css, _) = purge_css(css, usage)
+
+    tupDeferred = tuple(CRITICAL_CSS_DEFERRED_AT_RULES)
+    lstOut = []
+    for (prelude, body) in parse_css_blocks(css):
+        if body is None or prelude.lower().startswith(tupDeferred):
+            continue
+        lstOut.append("{}{{{}}}".format(prelude, body))
+
+    return "".join(lstOut)
+
+
+def remove_critical_css(html):
+    """
+    Take out what inline_critical_css added to a page, bringing back the
+    stylesheet links as they were.
+    """
+
+    import re
+
+    html = re.sub(
+        r"<style {}>.*?</style>".format(CRITICAL_CSS_MARK), "", html,
+        flags = re.DOTALL
+    )
+    return re.sub(
+        r"<link\b[^>]*\b{}[^>]*><noscript>(<link\b[^>]*>)</noscript>".format(
+            CRITICAL_CSS_MARK
+        ),
+        lambda m: m.group(1), html
+    )
+
+
+def defer_stylesheet_link(strTag):
+    # Browsers fetch stylesheets for other media without waiting for them,
+    # and the link applies to the screen once it has loaded; without
+    # JavaScript, the original link still works
+    strAttr = " media=\"print\" onload=\"this.media='all'\" {}".format(
+        CRITICAL_CSS_MARK
+    )
+    if strTag.endswith("/>"):
+        strDeferred = strTag[:-2].rstrip() + strAttr + ">"
+    else:
+        strDeferred = strTag[:-1].rstrip() + strAttr + ">"
+
+    return "{}<noscript>{}</noscript>".format(strDeferred, strTag)
+
+
+def inline_critical_css(dtPelPath):
+    """
+    Put the rules needed to render the top of each page into the page itself,
+    and load its stylesheets without blocking rendering. Pages made from the
+    same template (as their body's data-template says) share the same rules,
+    taken from whatever the tops of all those pages use.
+    """
+
+    import re
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    fpSettings = dtPelPath[PelicanArgLabel.SETTINGS]
+    dpOut = dtPelPath[PelicanArgLabel.OUTPUT]
+    dtSetting = read_settings_file(fpSettings)
+    strSiteUrl = dtSetting.get("SITEURL", "")
+    numFold = dtSetting.get("CRITICAL_CSS_FOLD", 0)
+
+    reLink = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+    reRel = re.compile(r"""\brel=(["']?)stylesheet\1[\s/>]""", re.IGNORECASE)
+    reHref = re.compile(r"""\bhref=(["'])([^"']*)\1""", re.IGNORECASE)
+    reMedia = re.compile(r"\bmedia=", re.IGNORECASE)
+    reTemplate = re.compile(
+        r"""<body\b[^>]*\bdata-template=(["'])([^"']*)\1""", re.IGNORECASE
+    )
+
+    # The stylesheet links of each page, and what the top of the pages of
+    # each template use
+    dtPage = {}
+    dtUsage = {}
+    for fp in list_files(dpOut):
+        if op.splitext(fp)[1].lower() not in [".html", ".htm"]:
+            continue
+
+        with open(fp, "r", encoding = "utf-8") as f:
+            html = f.read()
+        htmlBase = remove_critical_css(html)
+
+        mTemplate = reTemplate.search(htmlBase)
+        strTemplate = mTemplate.group(2) if mTemplate else ""
+        posHead = htmlBase.lower().find("</head>")
+
+        lstLink = []
+        for m in reLink.finditer(htmlBase, 0, max(posHead, 0)):
+            mHref = reHref.search(m.group(0))
+            if not reRel.search(m.group(0)) or mHref is None or \
+                    reMedia.search(m.group(0)):
+                continue
+            strPath = resolve_output_url(mHref.group(2), fp, dpOut, strSiteUrl)
+            if strPath is not None:
+                strPath = strip_fingerprint(strPath)
+                if not op.isfile(op.join(dpOut, strPath)):
+                    strPath = None
+            lstLink.append((m, strPath))
+
+        dtPage[fp] = (html, htmlBase, strTemplate, lstLink)
+        if numFold and lstLink:
+            if strTemplate not in dtUsage:
+                dtUsage[strTemplate] = FoldUsageCollector(numFold)
+            dtUsage[strTemplate].feed(htmlBase)
+
+    # Rules of each stylesheet for each template, made when first needed
+    dtCss = {}
+    dtCritical = {}
+
+    def get_critical_css(strTemplate, strPath):
+        key = (strTemplate, strPath)
+        if key not in dtCritical:
+            if strPath not in dtCss:
+                fpCss = op.join(dpOut, strPath)
+                with open(fpCss, "r", encoding = "utf-8") as f:
+                    dtCss[strPath] = f.read().lstrip("\ufeff")
+            dtCritical[key] = extract_critical_css(
+                dtCss[strPath], dtUsage[strTemplate]
+            )
+        return dtCritical[key]
+
+    numRewritten = 0
+    setSize = set()
+    for (fp, (html, htmlBase, strTemplate, lstLink)) in dtPage.items():
+        htmlNew = htmlBase
+        if numFold and lstLink:
+            strPage = op.relpath(fp, dpOut).replace(os.sep, "/")
+            css = "".join(
+                rebase_css_urls(
+                    get_critical_css(strTemplate, strPath), strPath, strPage
+                )
+                for (_, strPath) in lstLink if strPath is not None
+            )
+            setSize.add(len(css.encode("utf-8")))
+
+            lstPart = []
+            pos = 0
+            for (i, (m, strPath)) in enumerate(lstLink):
+                lstPart.append(htmlBase[pos:m.start()])
+                if i == 0 and css:
+                    lstPart.append(
+                        "<style {}>{}</style>".format(CRITICAL_CSS_MARK, css)
+                    )
+                # Nothing is inlined for stylesheets that could not be read
+                # (e.g. from a CDN), so they have to keep blocking rendering
+                if strPath is None:
+                    lstPart.append(m.group(0))
+                else:
+                    lstPart.append(defer_stylesheet_link(m.group(0)))
+                pos = m.end()
+            lstPart.append(htmlBase[pos:])
+            htmlNew = "".join(lstPart)
+
+        # Pages left as they were by an earlier build carry fingerprints,
+        # which are put back (or updated) by the fingerprinting step
+        if strip_fingerprints(htmlNew) != strip_fingerprints(html):
+            with open(fp, "w", encoding = "utf-8") as f:
+                f.write(htmlNew)
+            numRewritten += 1
+
+    if numFold:
+        archivist.info(
+            "Inlined critical CSS for %d templates (%d to %d bytes a page), "
+            "rewrote %d pages", len(dtUsage), min(setSize, default = 0),
+            max(setSize, default = 0), numRewritten
+        )
+    else:
+        archivist.info(
+            "No critical CSS to inline, rewrote %d pages", numRewritten
+        )
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# ASSET FINGERPRINT SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# Kinds of files given content-hashed names
+FINGERPRINT_EXTS = [
+    ".css", ".js", ".svg", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif",
+    ".ico", ".woff", ".woff2", ".ttf", ".otf", ".eot"
+]
+
+# Hexadecimal digits of the content hash in a name
+FINGERPRINT_LENGTH = 12
+
+
+def get_fingerprint_manifest_file():
+    # Relative to the output directory
+    return "fingerprints.json"
+
+
+def add_fingerprint(strPath, strHash):
+    (strBase, ext) = op.splitext(strPath)
+    return "{}.{}{}".format(strBase, strHash[:FINGERPRINT_LENGTH], ext)
+
+
+def strip_fingerprint(strPath):
+    import re
+    return re.sub(
+        r"\.[0-9a-f]{{{}}}(?=\.[^./]+$)".format(FINGERPRINT_LENGTH), "",
+        strPath
+    )
+
+
+def strip_fingerprints(text):
+    # From every file name in a page, for telling whether it changed in more
+    # than the fingerprints put back by the fingerprinting step
+    import re
+    return re.sub(
+        r"\.[0-9a-f]{{{}}}(?=\.\w+\b)".format(FINGERPRINT_LENGTH), "", text
+    )
+
+
+class AssetUrlRewriter:
+    """
+    Points URLs in pages and stylesheets at the fingerprinted copies of the
+    files they refer to. URLs that already carry an outdated fingerprint, as in
+    pages left over from an earlier build, are updated as well.
+    """
+
+    def __init__(self, dpOut, strSiteUrl, dtAsset):
+        self.dpOut = dpOut
+        self.strSiteUrl = strSiteUrl
+        self.dtAsset = dtAsset
+
+    def rewrite_url(self, strUrl, fpFrom):
+        import posixpath
+
+        strRelPath = resolve_output_url(
+            strUrl, fpFrom, self.dpOut, self.strSiteUrl
+        )
+        if strRelPath is None:
+            return strUrl
+        strRelPath = strip_fingerprint(strRelPath)
+        if strRelPath not in self.dtAsset:
+            return strUrl
+
+        # Only the last part of the path changes, so the URL stays relative or
+        # absolute as it was
+        strPath = strUrl
+        strRest = ""
+        for sep in ["#", "?"]:
+            if sep in strPath:
+                (strPath, strTail) = strPath.split(sep, 1)
+                strRest = sep + strTail + strRest
+        (strDir, strName) = posixpath.split(strPath)
+        strNew = posixpath.basename(self.dtAsset[strRelPath])
+        return (strDir + "/" if strDir else "") + strNew + strRest
+
+    def rewrite_css(self, css, fpFrom):
+        import re
+
+        return re.sub(
+            r"""url\(\s*(["']?)([^"')]+)\1\s*\)""",
+            lambda m: "url({0}{1}{0})".format(
+                m.group(1), self.rewrite_url(m.group(2), fpFrom)
+            ),
+            css
+        )
+
+    def rewrite_html(self, html, fpFrom):
+        import re
+
+        def rewrite_attr(m):
+            if m.group(1).lower() == "srcset":
+                lstCandidate = []
+                for strCandidate in m.group(3).split(","):
+                    lstPart = strCandidate.strip().split(None, 1)
+                    if lstPart:
+                        lstPart[0] = self.rewrite_url(lstPart[0], fpFrom)
+                    lstCandidate.append(" ".join(lstPart))
+                strValue = ", ".join(lstCandidate)
+            else:
+                strValue = self.rewrite_url(m.group(3), fpFrom)
+            return "{}={}{}{}".format(
+                m.group(1), m.group(2), strValue, m.group(2)
+            )
+
+        html = re.sub(
+            r"""\b(href|src|srcset|poster|xlink:href)=(["'])([^"']*)\2""",
+            rewrite_attr, html, flags = re.IGNORECASE
+        )
+
+        # Inline styles and style elements
+        return re.sub(
+            r"""url\(\s*(["']?)([^"')<>]+)\1\s*\)""",
+            lambda m: "url({0}{1}{0})".format(
+                m.group(1), self.rewrite_url(m.group(2), fpFrom)
+            ),
+            html
+        )
+
+
+def fingerprint_assets(dtPelPath):
+    """
+    Give a copy of every asset under the directories in FINGERPRINT_PATHS a
+    name containing a hash of its contents, point the pages and stylesheets at
+    the copies, and list the copies in the fingerprint manifest. Since a name
+    always stands for the same contents, the copies can be cached for good.
+    """
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    fpSettings = dtPelPath[PelicanArgLabel.SETTINGS]
+    dpOut = dtPelPath[PelicanArgLabel.OUTPUT]
+    dtSetting = read_settings_file(fpSettings)
+    strSiteUrl = dtSetting.get("SITEURL", "")
+
+    fpManifest = op.join(dpOut, get_fingerprint_manifest_file())
+    dtOld = load_json_file(fpManifest, {})
+    setOld = set(dtOld.values())
+
+    # Originals, without the copies made by earlier builds (or their
+    # precompressed siblings)
+    setSuffix = set(COMPRESS_SUFFIXES.values())
+    lstPath = []
+    for dp in dtSetting.get("FINGERPRINT_PATHS", []):
+        for fp in list_files(op.join(dpOut, dp)):
+            strPath = op.relpath(fp, dpOut).replace(os.sep, "/")
+            (strBase, ext) = op.splitext(strPath)
+            if ext in setSuffix or ext.lower() not in FINGERPRINT_EXTS or \
+                    strPath in setOld or strip_fingerprint(strPath) != strPath:
+                continue
+            lstPath.append(strPath)
+
+    # Stylesheets refer to other files, so they go after everything else and
+    # are hashed as rewritten
+    lstPath.sort(key = lambda s: (op.splitext(s)[1].lower() == ".css", s))
+
+    dtAsset = {}
+    rewriter = AssetUrlRewriter(dpOut, strSiteUrl, dtAsset)
+    numWritten = 0
+    for strPath in lstPath:
+        fp = op.join(dpOut, strPath)
+        with open(fp, "rb") as f:
+            data = f.read()
+        if op.splitext(strPath)[1].lower() == ".css":
+            data = rewriter.rewrite_css(
+                data.decode("utf-8"), fp
+            ).encode("utf-8")
+
+        strNew = add_fingerprint(strPath, hash_bytes(data))
+        dtAsset[strPath] = strNew
+
+        fpNew = op.join(dpOut, strNew)
+        if not op.isfile(fpNew):
+            with open(fpNew, "wb") as f:
+                f.write(data)
+            numWritten += 1
+
+    # Copies of contents that are gone; the pages referring to them are all
+    # rewritten below
+    setNew = set(dtAsset.values())
+    for strPath in setOld - setNew:
+        fp = op.join(dpOut, strPath)
+        if op.isfile(fp):
+            os.remove(fp)
+
+    numRewritten = 0
+    for fp in list_files(dpOut):
+        if op.splitext(fp)[1].lower() not in [".html", ".htm"]:
+            continue
+
+        with open(fp, "r", encoding = "utf-8") as f:
+            html = f.read()
+        htmlNew = rewriter.rewrite_html(html, fp)
+        if htmlNew != html:
+            with open(fp, "w", encoding = "utf-8") as f:
+                f.write(htmlNew)
+            numRewritten += 1
+
+    if dtAsset != dtOld:
+        save_json_file(fpManifest, dtAsset)
+
+    archivist.info(
+        "Fingerprinted %d assets (%d new, %d removed), rewrote %d pages",
+        len(dtAsset), numWritten, len(setOld - setNew), numRewritten
+    )
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# STATIC SERVER SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# Encodings of precompressed siblings, in order of preference
+SERVE_ENCODINGS = ["br", "gzip"]
+
+
+class WatchedJsonFile:
+    """
+    The contents of a JSON file that a build may rewrite while a server is
+    running, read again whenever the file changes. Safe to use from several
+    threads at once.
+    """
+
+    def __init__(self, fp, default):
+        self.fp = fp
+        self.default = default
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._obj = default
+
+    def get(self):
+        try:
+            mtime = os.stat(self.fp).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            if mtime != self._mtime:
+                self._obj = load_json_file(self.fp, self.default) \
+                    if mtime is not None else self.default
+                self._mtime = mtime
+
+            return self._obj
+
+
+class PrecompressedIndex:
+    """
+    Knows which files in the output directory have precompressed siblings
+    that are up to date, according to the manifest written by release builds.
+    """
+
+    def __init__(self, dpOut):
+        self._manifest = WatchedJsonFile(
+            op.join(dpOut, get_compress_manifest_file()), {}
+        )
+
+    def get_encodings(self, strRelPath, st):
+        """
+        List the encodings with a sibling made from the file as it is now.
+        """
+
+        dtEntry = self._manifest.get().get(strRelPath)
+        if dtEntry is None or dtEntry["size"] != st.st_size or \
+                dtEntry["mtime_ns"] != st.st_mtime_ns:
+            return []
+
+        return [e for e in SERVE_ENCODINGS if e in dtEntry["encodings"]]
+
+
+class FingerprintIndex:
+    """
+    Knows which files in the output directory are fingerprinted copies,
+    according to the manifest written by release builds.
+    """
+
+    def __init__(self, dpOut):
+        self._manifest = WatchedJsonFile(
+            op.join(dpOut, get_fingerprint_manifest_file()), {}
+        )
+        self._lock = threading.Lock()
+        self._dtAsset = None
+        self._setCopy = set()
+
+    def is_immutable(self, strRelPath):
+        dtAsset = self._manifest.get()
+        with self._lock:
+            if dtAsset is not self._dtAsset:
+                self._setCopy = set(dtAsset.values())
+                self._dtAsset = dtAsset
+
+            return strRelPath in self._setCopy
+
+
+def parse_accept_encoding(strHeader):
+    setAccept = set()
+    for item in (strHeader or "").split(","):
+        (coding, _, params) = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            (k, _, v) = param.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    pass
+        if coding and q > 0:
+            setAccept.add(coding.strip().lower())
+
+    return setAccept
+
+
+def parse_byte_range(strHeader, size):
+    """
+    Parse a Range header asking for a single range of bytes. Returns None if
+    it should be ignored, (start, end) inclusive if it can be satisfied, or
+    False if it cannot.
+    """
+
+    (unit, _, strRange) = (strHeader or "").partition("=")
+    if unit.strip() != "bytes" or "," in strRange:
+        # Several ranges at once are rare enough to just send everything
+        return None
+
+    (strStart, _, strEnd) = strRange.strip().partition("-")
+    try:
+        if strStart:
+            start = int(strStart)
+            end = int(strEnd) if strEnd else size - 1
+        else:
+            # The last so many bytes
+            start = max(size - int(strEnd), 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        return False
+
+    return (start, min(end, size - 1))
+
+
+# Path of the event stream telling browsers about changes to the output
+LIVERELOAD_PATH = "/__livereload"
+
+# Reloads the page if it, or anything other than a stylesheet, changed, but
+# only swaps the stylesheets if nothing else did
+LIVERELOAD_CLIENT = """<script>
+(function () {
+  var source = new EventSource("%s");
+  source.addEventListener("change", function (event) {
+    var lstPath = JSON.parse(event.data);
+    var page = location.pathname.replace(/\\/$/, "/index.html");
+    var flagReload = lstPath.some(function (path) {
+      return !/\\.css$/.test(path) && (!/\\.html?$/.test(path) || path === page);
+    });
+    if (flagReload) {
+      location.reload();
+      return;
+    }
+    document.querySelectorAll("link[rel=stylesheet]").forEach(function (link) {
+      var url = new URL(link.href);
+      if (url.origin === location.origin && lstPath.indexOf(url.pathname) >= 0) {
+        url.searchParams.set("livereload", Date.now());
+        link.href = url.href;
+      }
+    });
+  });
+})();
+</script>
+""" % LIVERELOAD_PATH
+
+
+class LiveReloadHub:
+    """
+    Watches the output directory and tells every connected browser which
+    files in it changed, through Server-Sent Events.
+    """
+
+    # Seconds between comments sent to keep idle connections open
+    HEARTBEAT = 15
+
+    def __init__(self, dpOut):
+        self.dpOut = dpOut
+        self._lock = threading.Lock()
+        self._lstQueue = []
+        self._manifest = WatchedJsonFile(get_build_manifest_file(), {})
+
+    def start(self):
+        thread = threading.Thread(target = self._watch, daemon = True)
+        thread.start()
+
+    def _watch(self):
+        setSkip = set(COMPRESS_SUFFIXES.values())
+        watcher = create_watcher([self.dpOut], [])
+
+        while True:
+            # Pelican writes pages in bursts, with some time in between to
+            # read the content
+            setChanged = wait_for_changes(watcher, debounce = 0.5)
+            lstPath = sorted(
+                "/" + op.relpath(fp, self.dpOut).replace(os.sep, "/")
+                for fp in setChanged
+                if op.splitext(fp)[1] not in setSkip and
+                    op.basename(fp) != get_compress_manifest_file()
+            )
+            if lstPath:
+                self.publish(lstPath)
+
+    def publish(self, lstPath):
+        import json
+
+        archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+        with self._lock:
+            lstQueue = list(self._lstQueue)
+        archivist.info(
+            "Telling %d browsers about %d changed files",
+            len(lstQueue), len(lstPath)
+        )
+
+        strData = json.dumps(lstPath)
+        for q in lstQueue:
+            q.put(strData)
+
+    def wants_client(self):
+        # Release builds are meant to be served as they are
+        profile = self._manifest.get().get(ManifestKey.PROFILE)
+        return profile != BuildProfile.RELEASE
+
+    def add_client(self, data):
+        """
+        Add the client to the bytes of an HTML page.
+        """
+
+        script = LIVERELOAD_CLIENT.encode("utf-8")
+        pos = data.lower().rfind(b"</body>")
+        if pos < 0:
+            return data + script
+        return data[:pos] + script + data[pos:]
+
+    def stream(self, handler):
+        """
+        Answer a request for the event stream, which lasts until the browser
+        goes away.
+        """
+
+        import queue
+
+        q = queue.Queue()
+        with self._lock:
+            self._lstQueue.append(q)
+
+        handler.close_connection = True
+        try:
+            handler.send_response(200)
+            handler.send_header("Content-Type", "text/event-stream")
+            handler.send_header("Cache-Control", "no-cache")
+            handler.send_header("Connection", "close")
+            handler.end_headers()
+            handler.wfile.write(b"retry: 1000\n\n")
+            handler.wfile.flush()
+
+            while True:
+                try:
+                    strData = q.get(timeout = self.HEARTBEAT)
+                    strMsg = "event: change\ndata: {}\n\n".format(strData)
+                except queue.Empty:
+                    strMsg = ": heartbeat\n\n"
+                handler.wfile.write(strMsg.encode("utf-8"))
+                handler.wfile.flush()
+        except OSError:
+            # The browser went away
+            pass
+        finally:
+            with self._lock:
+                self._lstQueue.remove(q)
+
+
+def create_pelican_server(dpOut, host, port, hub = None):
+    """
+    Create a server for the output directory behaving like the one Pelican
+    runs, except that it handles requests on threads and, given a live reload
+    hub, serves the hub's event stream and adds the client to HTML pages.
+    """
+
+    import io
+    import socketserver
+    import pelican.server
+
+    class PelicanRequestHandler(pelican.server.ComplexHTTPRequestHandler):
+        def do_GET(self):
+            if hub is not None and \
+                    self.path.split("?", 1)[0] == LIVERELOAD_PATH:
+                hub.stream(self)
+                return
+
+            super().do_GET()
+
+        def send_head(self):
+            fp = self.translate_path(self.path)
+            if op.isdir(fp):
+                fp = op.join(fp, "index.html")
+            if hub is None or not op.isfile(fp) or \
+                    not self.guess_type(fp).startswith("text/html") or \
+                    not hub.wants_client():
+                return super().send_head()
+
+            with open(fp, "rb") as f:
+                data = hub.add_client(f.read())
+            self.send_response(200)
+            self.send_header("Content-Type", self.guess_type(fp))
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return io.BytesIO(data)
+
+    class PelicanServer(
+        socketserver.ThreadingMixIn, pelican.server.RootedHTTPServer
+    ):
+        # Event streams keep their threads busy for as long as they last
+        daemon_threads = True
+        allow_reuse_address = True
+
+    return PelicanServer(dpOut, (host, port), PelicanRequestHandler)
+
+
+def create_static_server(dpOut, host, port, hub = None):
+    """
+    Create a threaded HTTP/1.1 server for the output directory that answers
+    conditional requests, serves byte ranges, prefers up-to-date precompressed
+    siblings and sends file contents with sendfile where available. Given a
+    live reload hub, it also serves the hub's event stream and adds the client
+    to HTML pages when the hub wants it to.
+    """
+
+    import email.utils
+    import http.server
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+    index = PrecompressedIndex(dpOut)
+    fingerprints = FingerprintIndex(dpOut)
+
+    class StaticRequestHandler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        # Idle keep-alive connections are closed after this many seconds
+        timeout = 30
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory = dpOut, **kwargs)
+
+        def log_message(self, format, *args):
+            archivist.debug("%s %s", self.address_string(), format % args)
+
+        def log_error(self, format, *args):
+            archivist.warning("%s %s", self.address_string(), format % args)
+
+        def do_GET(self):
+            if hub is not None and \
+                    self.path.split("?", 1)[0] == LIVERELOAD_PATH:
+                hub.stream(self)
+                return
+
+            self.serve(flagBody = True)
+
+        def do_HEAD(self):
+            self.serve(flagBody = False)
+
+        def is_not_modified(self, strETag, st):
+            strMatch = self.headers.get("If-None-Match")
+            if strMatch is not None:
+                lstTag = [t.strip() for t in strMatch.split(",")]
+                return "*" in lstTag or strETag in lstTag or \
+                    "W/" + strETag in lstTag
+
+            strSince = self.headers.get("If-Modified-Since")
+            if strSince is not None:
+                try:
+                    dtSince = email.utils.parsedate_to_datetime(strSince)
+                    return int(st.st_mtime) <= dtSince.timestamp()
+                except (TypeError, ValueError):
+                    pass
+
+            return False
+
+        def serve(self, flagBody):
+            fp = self.translate_path(self.path)
+            if op.isdir(fp):
+                if not self.path.split("?", 1)[0].endswith("/"):
+                    # Let the base class redirect to the path with a slash,
+                    # or list the directory
+                    f = super().send_head()
+                    if f is not None:
+                        f.close()
+                    return
+                for name in ["index.html", "index.htm"]:
+                    if op.isfile(op.join(fp, name)):
+                        fp = op.join(fp, name)
+                        break
+                else:
+                    f = super().send_head()
+                    if f is not None:
+                        try:
+                            if flagBody:
+                                self.copyfile(f, self.wfile)
+                        finally:
+                            f.close()
+                    return
+
+            try:
+                st = os.stat(fp)
+            except OSError:
+                self.send_error(404, "File not found")
+                return
+            if not op.isfile(fp):
+                self.send_error(404, "File not found")
+                return
+
+            strRelPath = op.relpath(fp, dpOut).replace(os.sep, "/")
+            lstEncoding = index.get_encodings(strRelPath, st)
+            flagImmutable = fingerprints.is_immutable(strRelPath)
+            strRange = self.headers.get("Range")
+
+            # Pages getting the live reload client are put together in memory
+            flagClient = hub is not None and \
+                self.guess_type(fp).startswith("text/html") and \
+                hub.wants_client()
+            if flagClient:
+                lstEncoding = []
+                strRange = None
+
+            # Ranges are only served from the file as it is, so that they mean
+            # the same whatever the encoding the client accepts
+            encoding = None
+            if strRange is None:
+                setAccept = parse_accept_encoding(
+                    self.headers.get("Accept-Encoding")
+                )
+                for e in lstEncoding:
+                    if e in setAccept:
+                        encoding = e
+                        break
+
+            strETag = '"{:x}-{:x}{}{}"'.format(
+                st.st_mtime_ns, st.st_size,
+                "-" + encoding if encoding else "",
+                "-livereload" if flagClient else ""
+            )
+            strLastModified = email.utils.formatdate(st.st_mtime, usegmt = True)
+
+            if self.is_not_modified(strETag, st):
+                self.send_response(304)
+                self.send_validators(
+                    strETag, strLastModified, lstEncoding, flagImmutable
+                )
+                self.end_headers()
+                return
+
+            if flagClient:
+                with open(fp, "rb") as f:
+                    data = hub.add_client(f.read())
+                self.send_response(200)
+                self.send_header("Content-Type", self.guess_type(fp))
+                self.send_header("Content-Length", str(len(data)))
+                self.send_validators(
+                    strETag, strLastModified, lstEncoding, flagImmutable
+                )
+                self.end_headers()
+                if flagBody:
+                    self.wfile.write(data)
+                return
+
+            fpSend = fp
+            if encoding is not None:
+                fpSend = fp + COMPRESS_SUFFIXES[encoding]
+            try:
+                f = open(fpSend, "rb")
+            except OSError:
+                self.send_error(404, "File not found")
+                return
+
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                (start, end) = (0, size - 1)
+                status = 200
+
+                strIfRange = self.headers.get("If-Range")
+                if strRange is not None and \
+                        strIfRange in [None, strETag, strLastModified]:
+                    byteRange = parse_byte_range(strRange, size)
+                    if byteRange is False:
+                        self.send_response(416)
+                        self.send_header(
+                            "Content-Range", "bytes */{}".format(size)
+                        )
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    elif byteRange is not None:
+                        (start, end) = byteRange
+                        status = 206
+
+                self.send_response(status)
+                self.send_header("Content-Type", self.guess_type(fp))
+                if encoding is not None:
+                    self.send_header("Content-Encoding", encoding)
+                if status == 206:
+                    self.send_header(
+                        "Content-Range",
+                        "bytes {}-{}/{}".format(start, end, size)
+                    )
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_validators(
+                    strETag, strLastModified, lstEncoding, flagImmutable
+                )
+                self.end_headers()
+
+                if flagBody and end >= start:
+                    # Zero-copy where the platform supports it
+                    self.connection.sendfile(f, start, end - start + 1)
+
+        def send_validators(
+            self, strETag, strLastModified, lstEncoding, flagImmutable
+        ):
+            self.send_header("ETag", strETag)
+            self.send_header("Last-Modified", strLastModified)
+            if flagImmutable:
+                # The name changes along with the contents
+                self.send_header(
+                    "Cache-Control", "public, max-age=31536000, immutable"
+                )
+            else:
+                # Always check back, since the site may be rebuilt at any
+                # moment
+                self.send_header("Cache-Control", "no-cache")
+            if lstEncoding:
+                self.send_header("Vary", "Accept-Encoding")
+
+    class StaticServer(http.server.ThreadingHTTPServer):
+        # Requests are handled on daemon threads, so stopping the server does
+        # not wait for idle keep-alive connections
+        daemon_threads = True
+        request_queue_size = 128
+
+    return StaticServer((host, port), StaticRequestHandler)
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# WATCH SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+def get_watch_dirs():
+    return ["content", "extra", op.join("theme", "templates")]
+
+
+def get_watch_files():
+    return ["settings.py"]
+
+
+def is_editor_noise(fp):
+    # Swap, backup and temporary files written by editors while saving
+    name = op.basename(fp)
+    return name.startswith((".", "#")) or \
+        name.endswith(("~", ".swp", ".swx", ".tmp"))
+
+
+class PollingWatcher:
+    """
+    Detects changes by comparing the modification times and sizes of all the
+    watched files every so often. Works everywhere.
+    """
+
+    INTERVAL = 0.5
+
+    def __init__(self, lstDir, lstFile):
+        self.lstDir = lstDir
+        self.lstFile = lstFile
+        self._dtStamp = self._snapshot()
+
+    def _snapshot(self):
+        dtStamp = {}
+        lstFp = list(self.lstFile)
+        for dp in self.lstDir:
+            lstFp.extend(list_files(dp))
+
+        for fp in lstFp:
+            try:
+                st = os.stat(fp)
+            except OSError:
+                continue
+            dtStamp[op.abspath(fp)] = (st.st_mtime_ns, st.st_size)
+
+        return dtStamp
+
+    def wait(self, timeout = None):
+        """
+        Return the set of paths changed since the last call, waiting up to
+        timeout seconds (forever if None) for something to change.
+        """
+
+        import time
+
+        timeStart = time.monotonic()
+        while True:
+            time.sleep(self.INTERVAL)
+            dtStamp = self._snapshot()
+            setChanged = set(dtStamp.items()) ^ set(self._dtStamp.items())
+            self._dtStamp = dtStamp
+            if setChanged:
+                return set(fp for (fp, _) in setChanged)
+
+            if timeout is not None and time.monotonic() - timeStart >= timeout:
+                return set()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Gets told about changes by the Linux kernel through inotify, so waiting
+    costs nothing however many files are watched.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+        IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, lstDir, lstFile):
+        import ctypes
+        import ctypes.util
+        import struct
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno = True)
+        self._event = struct.Struct("iIII")
+
+        self._fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._dtWatchDir = {}
+        for dp in lstDir:
+            for (dpRoot, _, _) in os.walk(dp):
+                self._add_watch(dpRoot)
+
+        # Single files are watched through their directory, since editors
+        # often replace a file rather than write to it
+        self._setFile = set(op.abspath(fp) for fp in lstFile)
+        for fp in self._setFile:
+            self._add_watch(op.dirname(fp))
+
+        self._setRecursive = set(op.abspath(dp) for dp in lstDir)
+
+    def _add_watch(self, dp):
+        dp = op.abspath(dp)
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(dp), self.MASK
+        )
+        if wd >= 0:
+            self._dtWatchDir[wd] = dp
+
+    def _is_watched(self, fp):
+        if fp in self._setFile:
+            return True
+
+        return any(
+            fp.startswith(dp + os.sep) for dp in self._setRecursive
+        )
+
+    def wait(self, timeout = None):
+        import select
+
+        (lstReady, _, _) = select.select([self._fd], [], [], timeout)
+        if not lstReady:
+            return set()
+
+        data = os.read(self._fd, 64 * 1024)
+        setChanged = set()
+        pos = 0
+        while pos < len(data):
+            (wd, mask, _, length) = self._event.unpack_from(data, pos)
+            pos += self._event.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+            pos += length
+
+            dp = self._dtWatchDir.get(wd)
+            if dp is None:
+                continue
+            fp = op.join(dp, name)
+
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and \
+                        self._is_watched(fp):
+                    for (dpRoot, _, _) in os.walk(fp):
+                        self._add_watch(dpRoot)
+                continue
+
+            if self._is_watched(fp):
+                setChanged.add(fp)
+
+        return setChanged
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(lstDir, lstFile, flagPoll = False):
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    if not flagPoll and sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(lstDir, lstFile)
+            archivist.info("Watching for changes using inotify")
+            return watcher
+        except (OSError, AttributeError) as exc:
+            archivist.warning("Could not use inotify: %s", exc)
+
+    archivist.info("Watching for changes by polling")
+    return PollingWatcher(lstDir, lstFile)
+
+
+def wait_for_changes(watcher, debounce = 0.3):
+    """
+    Block until something changes, then keep collecting changes until nothing
+    has changed for the debounce period, so that a burst of saves results in a
+    single rebuild.
+    """
+
+    setChanged = set()
+    while not setChanged:
+        setChanged = set(
+            fp for fp in watcher.wait() if not is_editor_noise(fp)
+        )
+
+    while True:
+        setMore = watcher.wait(debounce)
+        if not setMore:
+            return setChanged
+        setChanged.update(fp for fp in setMore if not is_editor_noise(fp))
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# BENCHMARK SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+def get_bench_report_file():
+    return op.join(get_cache_dir(), "bench-report.json")
+
+
+# What a benchmark copies of the repository; the content is generated instead
+BENCH_COPY_FILES = ["build.py", "settings.py"]
+BENCH_COPY_DIRS = ["extra", "plugins", "theme"]
+BENCH_LINK_DIRS = ["node_modules"]
+
+# The scenarios run, in order. Each builds on what the one before it left.
+BENCH_SCENARIOS = ["cold", "warm", "edit"]
+
+# Wall-clock times closer than this (in seconds) are never a regression, since
+# they are within the noise of starting Python
+BENCH_MIN_WALL_DELTA = 0.05
+
+BENCH_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo "
+    "consequat duis aute irure in reprehenderit voluptate velit esse cillum "
+    "eu fugiat nulla pariatur excepteur sint occaecat cupidatat non proident "
+    "sunt culpa qui officia deserunt mollit anim id est laborum"
+).split()
+
+BENCH_INLINE_MATH = [
+    r"x_{{{0}}} \le x_{{{1}}}",
+    r"\sum_{{n = 1}}^{{{0}}} a_n",
+    r"\frac{{{0}}}{{{1}}} \in \mathbb{{Q}}",
+    r"\alpha^{{{0}}} + \beta^{{{1}}}",
+    r"\lVert f_{{{0}}} \rVert_{{{1}}}",
+]
+
+BENCH_DISPLAY_MATH = [
+    r"\int_0^{{{0}}} e^{{-{1} t}} \, dt"
+        r" = \frac{{1 - e^{{-{0} \cdot {1}}}}}{{{1}}}",
+    r"\lim_{{n \to \infty}} \left(1 + \frac{{{0}}}{{n}}\right)^{{n}}"
+        r" = e^{{{0}}}",
+    r"\prob(X > {0}) \le \frac{{\expected X}}{{{0}}}"
+        r" \quad \text{{for }} {1} > 0",
+]
+
+BENCH_CODE = [
+    ("python", [
+        "def scale_{0}(lstValue, factor = {1}):",
+        "    # Multiply every value by the factor",
+        "    return [v * factor for v in lstValue]",
+    ]),
+    ("c", [
+        "static int count_{0}(const char *s) {{",
+        "    int n = {1};",
+        "    while (*s++) n++;",
+        "    return n;",
+        "}}",
+    ]),
+    ("bash", [
+        "for f in output/*.html; do",
+        "    gzip -{1} --keep \"$f\"  # {0}",
+        "done",
+    ]),
+]
+
+
+def make_bench_post(rng, idx, dtOption):
+    """
+    Write the Markdown source of one synthetic post.
+    """
+
+    import datetime
+
+    def sentence(numWord):
+        lstWord = [rng.choice(BENCH_WORDS) for _ in range(numWord)]
+        return " ".join(lstWord).capitalize() + "."
+
+    def count(mean):
+        # Spread around the mean, never negative
+        return int(mean) + (1 if rng.random() < mean - int(mean) else 0)
+
+    date = datetime.datetime(2015, 1, 1) + datetime.timedelta(
+        hours = 13 * idx + rng.randrange(13)
+    )
+    lstTag = sorted(set(
+        "tag-{}".format(rng.randrange(dtOption["tags"]))
+        for _ in range(rng.randint(1, 3))
+    ))
+
+    lstLine = [
+        "Title: Benchmark post {}".format(idx),
+        "Date: {}".format(date.strftime("%Y-%m-%dT%H:%M+10:00")),
+        "Category: Category {}".format(rng.randrange(dtOption["categories"])),
+        "Slug: bench-{:05d}".format(idx),
+        "Summary: {}".format(sentence(8)),
+        "Tags: {}".format(", ".join(lstTag)),
+        "",
+        # Commands used by the display math, as in the real posts
+        "$$@",
+        r"\newcommand{\prob}{\mathbf{P}}",
+        r"\newcommand{\expected}{\mathbf{E}}",
+        "$$",
+        "",
+    ]
+
+    # Math, code and footnotes are spread over the paragraphs
+    numPara = 6
+    lstExtra = [[] for _ in range(numPara)]
+    numFootnote = count(dtOption["footnotes"])
+    for _ in range(count(dtOption["math"])):
+        a = rng.randint(1, 99)
+        b = rng.randint(1, 99)
+        if rng.random() < 0.7:
+            lstExtra[rng.randrange(numPara)].append(
+                ("inline", rng.choice(BENCH_INLINE_MATH).format(a, b))
+            )
+        else:
+            lstExtra[rng.randrange(numPara)].append(
+                ("display", rng.choice(BENCH_DISPLAY_MATH).format(a, b))
+            )
+    for _ in range(count(dtOption["code"])):
+        (lang, lstCode) = rng.choice(BENCH_CODE)
+        lstExtra[rng.randrange(numPara)].append(("code", (lang, [
+            line.format(idx, rng.randint(1, 9)) for line in lstCode
+        ])))
+    for n in range(1, numFootnote + 1):
+        lstExtra[rng.randrange(numPara)].append(("footnote", n))
+
+    for lstItem in lstExtra:
+        lstPart = [sentence(rng.randint(8, 20)) for _ in range(4)]
+        lstBlock = []
+        for (kind, value) in lstItem:
+            if kind == "inline":
+                lstPart.insert(
+                    rng.randrange(len(lstPart) + 1),
+                    "Note that ${}$ holds.".format(value)
+                )
+            elif kind == "footnote":
+                lstPart.insert(
+                    rng.randrange(len(lstPart) + 1),
+                    "See the note[^{}].".format(value)
+                )
+            elif kind == "display":
+                lstBlock.append("$$\n{}\n$$".format(value))
+            else:
+                (lang, lstCode) = value
+                lstBlock.append(
+                    "```{}\n{}\n```".format(lang, "\n".join(lstCode))
+                )
+
+        lstLine.append(" ".join(lstPart))
+        lstLine.append("")
+        for block in lstBlock:
+            lstLine.append(block)
+            lstLine.append("")
+
+    for n in range(1, numFootnote + 1):
+        lstLine.append("[^{}]: {}".format(n, sentence(10)))
+
+    return "\n".join(lstLine) + "\n"
+
+
+def generate_bench_corpus(dpContent, dtOption):
+    """
+    Fill a content directory with synthetic posts, the same ones every time
+    for the same options, returning their total size in bytes.
+    """
+
+    import random
+
+    rng = random.Random(dtOption["seed"])
+
+    dpPost = op.join(dpContent, "posts")
+    os.makedirs(dpPost, exist_ok = True)
+
+    sizeTotal = 0
+    for idx in range(dtOption["posts"]):
+        text = make_bench_post(rng, idx, dtOption)
+        fp = op.join(dpPost, "bench-{:05d}.md".format(idx))
+        with open(fp, "w", encoding = "utf-8") as f:
+            f.write(text)
+        sizeTotal += len(text.encode("utf-8"))
+
+    return sizeTotal
+
+
+def setup_bench_tree(dpBench, dtOption):
+    """
+    Make a copy of the repository with a synthetic corpus in place of the
+    content, returning the size of the corpus in bytes.
+    """
+
+    import shutil
+
+    for fp in BENCH_COPY_FILES:
+        shutil.copy2(fp, op.join(dpBench, fp))
+    for dp in BENCH_COPY_DIRS:
+        shutil.copytree(
+            dp, op.join(dpBench, dp),
+            ignore = shutil.ignore_patterns("__pycache__")
+        )
+    for dp in BENCH_LINK_DIRS:
+        if op.isdir(dp):
+            os.symlink(op.abspath(dp), op.join(dpBench, dp))
+
+    return generate_bench_corpus(
+        op.join(dpBench, get_pel_input_dir()), dtOption
+    )
+
+
+def run_bench_build(dpBench, lstArg):
+    """
+    Run the build script in the benchmark tree, returning the wall-clock time
+    in seconds and the peak resident set size in kilobytes (None where this
+    cannot be told).
+    """
+
+    import time
+
+    fpLog = op.join(dpBench, "bench-build.log")
+    lstCmd = [sys.executable, "build.py"] + lstArg
+
+    with open(fpLog, "w") as fLog:
+        start = time.perf_counter()
+        proc = sp.Popen(
+            lstCmd, cwd = dpBench, stdout = fLog, stderr = sp.STDOUT
+        )
+        if hasattr(os, "wait4"):
+            (_, status, rusage) = os.wait4(proc.pid, 0)
+            wall = time.perf_counter() - start
+            proc.returncode = os.WEXITSTATUS(status) \
+                if os.WIFEXITED(status) else 1
+            rss = rusage.ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+        else:
+            proc.wait()
+            wall = time.perf_counter() - start
+            rss = None
+
+    if proc.returncode != 0:
+        archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+        with open(fpLog, "r") as f:
+            for line in f.read().splitlines()[-20:]:
+                archivist.error("    %s", line)
+        strErrMsg = "Benchmark build [{}] failed".format(" ".join(lstArg))
+        archivist.error(strErrMsg)
+        raise Exception(strErrMsg)
+
+    return (wall, rss)
+
+
+def measure_output(dpOut):
+    lstFp = list_files(dpOut)
+    return (sum(op.getsize(fp) for fp in lstFp), len(lstFp))
+
+
+def prepare_bench_scenario(dpBench, scenario, idxRun):
+    """
+    Put the benchmark tree into the state a scenario starts from.
+    """
+
+    import shutil
+
+    if scenario == "cold":
+        # Nothing left from earlier builds
+        for dp in [get_pel_output_dir(), get_cache_dir()]:
+            shutil.rmtree(op.join(dpBench, dp), ignore_errors = True)
+    elif scenario == "edit":
+        # A writer saving a change to one post
+        fp = op.join(
+            dpBench, get_pel_input_dir(), "posts", "bench-00000.md"
+        )
+        with open(fp, "a", encoding = "utf-8") as f:
+            f.write("\nAn edit made by run {} of the benchmark.\n".format(
+                idxRun
+            ))
+
+
+def run_bench(cmdLineArgs):
+    import datetime
+    import platform
+    import statistics
+    import tempfile
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    dtOption = {
+        "posts": getattr(cmdLineArgs, ArgName.POSTS),
+        "math": getattr(cmdLineArgs, ArgName.MATH),
+        "code": getattr(cmdLineArgs, ArgName.CODE),
+        "footnotes": getattr(cmdLineArgs, ArgName.FOOTNOTES),
+        "tags": getattr(cmdLineArgs, ArgName.TAGS),
+        "categories": getattr(cmdLineArgs, ArgName.CATEGORIES),
+        "seed": getattr(cmdLineArgs, ArgName.SEED),
+    }
+    numRepeat = max(1, getattr(cmdLineArgs, ArgName.REPEAT))
+
+    # Read before anything is measured, since the new report may replace it
+    fpBaseline = getattr(cmdLineArgs, ArgName.COMPARE)
+    dtBase = None
+    if fpBaseline is not None:
+        dtBase = load_json_file(fpBaseline)
+        if dtBase is None or "scenarios" not in dtBase:
+            strErrMsg = "[{}] is not a benchmark report".format(fpBaseline)
+            archivist.error(strErrMsg)
+            raise Exception(strErrMsg)
+
+    lstArg = []
+    if getattr(cmdLineArgs, ArgName.SUBPROCESS):
+        lstArg.append("--subprocess")
+    lstArg.append(SubCmd.HTML)
+    if getattr(cmdLineArgs, ArgName.RELEASE):
+        lstArg.append("--release")
+    lstArg += ["--jobs", str(getattr(cmdLineArgs, ArgName.JOBS))]
+
+    dtScenario = {}
+    with tempfile.TemporaryDirectory(prefix = "homotypus-bench-") as dpBench:
+        sizeCorpus = setup_bench_tree(dpBench, dtOption)
+        archivist.info(
+            "Generated %d posts (%d bytes) in [%s]", dtOption["posts"],
+            sizeCorpus, dpBench
+        )
+
+        # The HTML build needs the Sass output to exist, but Sass itself is
+        # not what is measured
+        fpSassOut = op.join(dpBench, get_sass_output_file())
+        if not op.isfile(fpSassOut):
+            run_bench_build(dpBench, [SubCmd.CSS])
+
+        for scenario in BENCH_SCENARIOS:
+            lstWall = []
+            lstRss = []
+            for idxRun in range(numRepeat):
+                prepare_bench_scenario(dpBench, scenario, idxRun)
+                (wall, rss) = run_bench_build(dpBench, lstArg)
+                lstWall.append(wall)
+                lstRss.append(rss)
+                archivist.info(
+                    "%-5s run %d: %.3f s, peak %s KB", scenario, idxRun + 1,
+                    wall, "-" if rss is None else rss
+                )
+
+            (sizeOut, numOut) = measure_output(
+                op.join(dpBench, get_pel_output_dir())
+            )
+            dtScenario[scenario] = {
+                "wall_s": statistics.median(lstWall),
+                "wall_s_runs": lstWall,
+                "peak_rss_kb": None if None in lstRss else max(lstRss),
+                "output_bytes": sizeOut,
+                "output_files": numOut,
+            }
+
+    dtReport = {
+        "created": datetime.datetime.now().isoformat(timespec = "seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "corpus": dict(dtOption, source_bytes = sizeCorpus),
+        "build": lstArg,
+        "repeat": numRepeat,
+        "scenarios": dtScenario,
+    }
+
+    fpReport = getattr(cmdLineArgs, ArgName.REPORT)
+    save_json_file(fpReport, dtReport)
+
+    archivist.info("")
+    archivist.info(
+        "%-8s %10s %12s %14s %8s", "Scenario", "Wall s", "Peak KB",
+        "Output bytes", "Files"
+    )
+    for scenario in BENCH_SCENARIOS:
+        dt = dtScenario[scenario]
+        archivist.info(
+            "%-8s %10.3f %12s %14d %8d", scenario, dt["wall_s"],
+            "-" if dt["peak_rss_kb"] is None else dt["peak_rss_kb"],
+            dt["output_bytes"], dt["output_files"]
+        )
+    archivist.info("Report written to [%s]", fpReport)
+
+    if dtBase is not None:
+        compare_bench_reports(
+            dtBase, dtReport, getattr(cmdLineArgs, ArgName.THRESHOLD)
+        )
+
+
+def compare_bench_reports(dtBase, dtReport, threshold):
+    """
+    Check a benchmark report against a baseline, raising an exception if the
+    wall-clock time or peak memory of any scenario grew by more than the
+    threshold (in percent).
+    """
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    if dtBase.get("corpus") != dtReport["corpus"] or \
+            dtBase.get("build") != dtReport["build"]:
+        archivist.warning(
+            "The baseline was measured with a different corpus or build, so "
+            "the comparison may not mean much"
+        )
+
+    archivist.info("")
+    archivist.info(
+        "%-8s %-12s %12s %12s %9s", "Scenario", "Measure", "Baseline",
+        "Now", "Change"
+    )
+
+    lstRegression = []
+    for scenario in BENCH_SCENARIOS:
+        dtOld = dtBase["scenarios"].get(scenario)
+        dtNew = dtReport["scenarios"][scenario]
+        if dtOld is None:
+            continue
+
+        for (key, minDelta) in [
+            ("wall_s", BENCH_MIN_WALL_DELTA), ("peak_rss_kb", 0)
+        ]:
+            (old, new) = (dtOld.get(key), dtNew.get(key))
+            if not old or new is None:
+                continue
+
+            change = (new - old) / old * 100
+            flagRegressed = change > threshold and new - old > minDelta
+            archivist.info(
+                "%-8s %-12s %12.6g %12.6g %+8.1f%%%s", scenario, key, old, new,
+                change, "  REGRESSED" if flagRegressed else ""
+            )
+            if flagRegressed:
+                lstRegression.append("{} {}".format(scenario, key))
+
+    if lstRegression:
+        strErrMsg = "Regressed by more than {}%: {}".format(
+            threshold, ", ".join(lstRegression)
+        )
+        archivist.error(strErrMsg)
+        raise Exception(strErrMsg)
+
+    archivist.info("No regressions beyond %s%%", threshold)
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+# DEPLOY SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# A deployment target is a directory holding one subdirectory per release
+# under DEPLOY_RELEASES_DIR, and a symbolic link DEPLOY_CURRENT_LINK pointing
+# at the release being served, which is what the web server should serve. A
+# new release starts out as hard links to the files of the current one, so
+# only what changed has to be transferred, and goes live by replacing the link.
+DEPLOY_RELEASES_DIR = "releases"
+DEPLOY_CURRENT_LINK = "current"
+
+# Run with python3 on the target: make a copy of a directory out of hard links
+DEPLOY_LINK_TREE_SCRIPT = """
+import os, sys
+(src, dst) = sys.argv[1:]
+for (root, dirs, files) in os.walk(src):
+    rel = os.path.relpath(root, src)
+    os.makedirs(os.path.join(dst, rel))
+    # Links to directories are listed with the directories, not followed
+    for name in files + dirs:
+        fp = os.path.join(root, name)
+        if name in dirs and not os.path.islink(fp):
+            continue
+        if os.path.islink(fp):
+            os.symlink(os.readlink(fp), os.path.join(dst, rel, name))
+        else:
+            os.link(fp, os.path.join(dst, rel, name))
+"""
+
+
+def get_deploy_dir():
+    return op.join(get_cache_dir(), "deploy")
+
+
+def get_output_hash_file():
+    return op.join(get_deploy_dir(), "output-hashes.json")
+
+
+def get_deploy_record_file(strTarget):
+    # One per target, named after it
+    return op.join(
+        get_deploy_dir(), hash_bytes(strTarget.encode("utf-8"))[:16] + ".json"
+    )
+
+
+def hash_output(dpOut):
+    """
+    Hash every file in the output directory, rehashing only the files whose
+    size or modification time changed since the last time.
+    """
+
+    fpCache = get_output_hash_file()
+    dtOld = load_json_file(fpCache, {})
+
+    dtNew = {}
+    for fp in list_files(dpOut):
+        strPath = op.relpath(fp, dpOut).replace(os.sep, "/")
+        st = os.stat(fp)
+        entry = dtOld.get(strPath)
+        if entry is None or entry[:2] != [st.st_size, st.st_mtime_ns]:
+            entry = [st.st_size, st.st_mtime_ns, hash_file(fp)]
+        dtNew[strPath] = entry
+
+    if dtNew != dtOld:
+        os.makedirs(op.dirname(fpCache), exist_ok = True)
+        save_json_file(fpCache, dtNew)
+
+    return dict((k, v[2]) for (k, v) in dtNew.items())
+
+
+def make_release_id():
+    # Microseconds, so that deployments in quick succession get their own
+    # release; the IDs still sort in the order they were made
+    import datetime
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return now.strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def split_batches(lst, numBatch):
+    numBatch = max(1, min(numBatch, len(lst)))
+    return [lst[i::numBatch] for i in range(numBatch)]
+
+
+class DeployTarget:
+    """
+    Somewhere to deploy the output to. Subclasses say how to carry out each
+    step on their kind of target; deploy_output decides what to do.
+    """
+
+    # Subclasses by the kind of target they handle, in order of precedence
+    registry = []
+
+    @classmethod
+    def register(cls, targetCls):
+        cls.registry.append(targetCls)
+        return targetCls
+
+    @classmethod
+    def create(cls, strTarget, numJobs):
+        for targetCls in cls.registry:
+            target = targetCls.parse(strTarget, numJobs)
+            if target is not None:
+                return target
+
+        return None
+
+    @classmethod
+    def parse(cls, strTarget, numJobs):
+        """
+        Return a target for the given description, or None if it is not one
+        of this kind.
+        """
+
+        raise NotImplementedError
+
+    def check(self):
+        """
+        Make sure the target can be reached.
+        """
+
+        pass
+
+    def get_current_release(self):
+        raise NotImplementedError
+
+    def list_releases(self):
+        raise NotImplementedError
+
+    def create_release(self, idRelease, idBase):
+        """
+        Create a release, made of hard links to the files of another unless
+        idBase is None.
+        """
+
+        raise NotImplementedError
+
+    def upload(self, dpOut, idRelease, lstPath):
+        raise NotImplementedError
+
+    def delete(self, idRelease, lstPath):
+        raise NotImplementedError
+
+    def switch(self, idRelease):
+        """
+        Atomically make a release the one being served.
+        """
+
+        raise NotImplementedError
+
+    def remove_release(self, idRelease):
+        raise NotImplementedError
+
+
+@DeployTarget.register
+class RsyncDeployTarget(DeployTarget):
+    """
+    A directory on another machine, given as [user@]host:path, reached with
+    ssh and rsync. The files are transferred by several rsync processes at
+    once.
+    """
+
+    def __init__(self, strHost, dpRemote, numJobs):
+        self.strHost = strHost
+        self.dpRemote = dpRemote
+        self.numJobs = numJobs
+
+    @classmethod
+    def parse(cls, strTarget, numJobs):
+        import re
+
+        # Not a Windows drive letter
+        m = re.match(r"^([^/:]{2,}):(.+)$", strTarget)
+        if m is None:
+            return None
+        return cls(m.group(1), m.group(2).rstrip("/"), numJobs)
+
+    def get_remote_path(self, *lstPart):
+        import posixpath
+        return posixpath.join(self.dpRemote, *lstPart)
+
+    def run_ssh(self, strCmd, input = None):
+        import shlex
+
+        archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+        archivist.debug("On %s: %s", self.strHost, strCmd)
+        proc = sp.run(
+            ["ssh", self.strHost, "sh -c " + shlex.quote(strCmd)],
+            input = input, stdout = sp.PIPE, stderr = sp.PIPE,
+            universal_newlines = True
+        )
+        if proc.returncode != 0:
+            strErrMsg = "Command on {} failed: {}\n{}".format(
+                self.strHost, strCmd, proc.stderr.strip()
+            )
+            archivist.error(strErrMsg)
+            raise Exception(strErrMsg)
+
+        return proc.stdout
+
+    def check(self):
+        require_valid_ext(["rsync"], "rsync")
+        # Needed by create_release and switch, which must work on hosts
+        # without GNU cp and mv
+        self.run_ssh("command -v python3 >/dev/null || " \
+            "{ echo 'python3 not found' >&2; exit 1; }")
+
+    def get_current_release(self):
+        import posixpath
+        import shlex
+
+        strLink = self.run_ssh("readlink {} || true".format(
+            shlex.quote(self.get_remote_path(DEPLOY_CURRENT_LINK))
+        )).strip()
+        return posixpath.basename(strLink) or None
+
+    def list_releases(self):
+        import shlex
+
+        return sorted(self.run_ssh("ls -1 {} 2>/dev/null || true".format(
+            shlex.quote(self.get_remote_path(DEPLOY_RELEASES_DIR))
+        )).split())
+
+    def create_release(self, idRelease, idBase):
+        import shlex
+
+        dpNew = shlex.quote(
+            self.get_remote_path(DEPLOY_RELEASES_DIR, idRelease)
+        )
+        if idBase is None:
+            self.run_ssh("mkdir -p {}".format(dpNew))
+        else:
+            # cp -al is GNU-only, so the links are made with Python as well
+            self.run_ssh("python3 -c {} {} {}".format(
+                shlex.quote(DEPLOY_LINK_TREE_SCRIPT),
+                shlex.quote(self.get_remote_path(DEPLOY_RELEASES_DIR, idBase)),
+                dpNew
+            ))
+
+    def upload(self, dpOut, idRelease, lstPath):
+        from concurrent.futures import ThreadPoolExecutor
+
+        strDest = "{}:{}/".format(
+            self.strHost, self.get_remote_path(DEPLOY_RELEASES_DIR, idRelease)
+        )
+
+        # rsync writes each file under a temporary name and renames it, so
+        # the hard links to the current release are replaced rather than
+        # written through; --ignore-times since the files are known to differ
+        def run_batch(lstBatch):
+            proc = sp.run(
+                [
+                    "rsync", "--archive", "--ignore-times", "--from0",
+                    "--files-from=-", dpOut + "/", strDest
+                ],
+                input = "\0".join(lstBatch), stdout = sp.PIPE,
+                stderr = sp.STDOUT, universal_newlines = True
+            )
+            if proc.returncode != 0:
+                raise Exception("rsync failed:\n" + proc.stdout.strip())
+
+        with ThreadPoolExecutor(max_workers = self.numJobs) as executor:
+            list(executor.map(
+                run_batch, split_batches(lstPath, self.numJobs)
+            ))
+
+    def delete(self, idRelease, lstPath):
+        import shlex
+
+        self.run_ssh(
+            "cd {} && xargs -0 rm -f -- && " \
+                "find . -mindepth 1 -type d -empty -delete".format(
+                    shlex.quote(
+                        self.get_remote_path(DEPLOY_RELEASES_DIR, idRelease)
+                    )
+                ),
+            input = "\0".join(lstPath)
+        )
+
+    def switch(self, idRelease):
+        import posixpath
+        import shlex
+
+        # mv would move the new link into the directory the current one
+        # points to, unless given the GNU-only -T, so rename it with Python
+        strTemp = DEPLOY_CURRENT_LINK + ".new"
+        strRename = "import os; os.replace({!r}, {!r})".format(
+            strTemp, DEPLOY_CURRENT_LINK
+        )
+        self.run_ssh("cd {} && ln -sfn {} {} && python3 -c {}".format(
+            shlex.quote(self.dpRemote),
+            shlex.quote(posixpath.join(DEPLOY_RELEASES_DIR, idRelease)),
+            strTemp, shlex.quote(strRename)
+        ))
+
+    def remove_release(self, idRelease):
+        import shlex
+
+        self.run_ssh("rm -rf {}".format(
+            shlex.quote(self.get_remote_path(DEPLOY_RELEASES_DIR, idRelease))
+        ))
+
+
+@DeployTarget.register
+class LocalDeployTarget(DeployTarget):
+    """
+    A directory on this machine, e.g. for trying deployments out or for a web
+    server running on the same machine. Files are copied by a pool of threads.
+    """
+
+    def __init__(self, dp, numJobs):
+        self.dp = op.abspath(dp)
+        self.numJobs = numJobs
+
+    @classmethod
+    def parse(cls, strTarget, numJobs):
+        return cls(strTarget, numJobs)
+
+    def get_release_dir(self, idRelease):
+        return op.join(self.dp, DEPLOY_RELEASES_DIR, idRelease)
+
+    def get_current_release(self):
+        fpLink = op.join(self.dp, DEPLOY_CURRENT_LINK)
+        if not op.islink(fpLink):
+            return None
+        return op.basename(os.readlink(fpLink))
+
+    def list_releases(self):
+        dp = op.join(self.dp, DEPLOY_RELEASES_DIR)
+        return sorted(os.listdir(dp)) if op.isdir(dp) else []
+
+    def create_release(self, idRelease, idBase):
+        import shutil
+
+        dpNew = self.get_release_dir(idRelease)
+        if idBase is None:
+            os.makedirs(dpNew)
+        else:
+            shutil.copytree(
+                self.get_release_dir(idBase), dpNew, symlinks = True,
+                copy_function = os.link
+            )
+
+    def upload(self, dpOut, idRelease, lstPath):
+        import shutil
+        from concurrent.futures import ThreadPoolExecutor
+
+        dpRelease = self.get_release_dir(idRelease)
+
+        # Replace rather than write through the hard links to the current
+        # release
+        def copy(strPath):
+            fpDest = op.join(dpRelease, strPath)
+            os.makedirs(op.dirname(fpDest), exist_ok = True)
+            fpTemp = fpDest + ".deploy-tmp"
+            shutil.copy2(op.join(dpOut, strPath), fpTemp)
+            os.replace(fpTemp, fpDest)
+
+        with ThreadPoolExecutor(max_workers = self.numJobs) as executor:
+            list(executor.map(copy, lstPath))
+
+    def delete(self, idRelease, lstPath):
+        dpRelease = self.get_release_dir(idRelease)
+        for strPath in lstPath:
+            fp = op.join(dpRelease, strPath)
+            if op.isfile(fp):
+                os.remove(fp)
+
+        for (dpRoot, lstDir, lstName) in os.walk(dpRelease, topdown = False):
+            if dpRoot != dpRelease and not os.listdir(dpRoot):
+                os.rmdir(dpRoot)
+
+    def switch(self, idRelease):
+        fpTemp = op.join(self.dp, DEPLOY_CURRENT_LINK + ".new")
+        if op.lexists(fpTemp):
+            os.remove(fpTemp)
+        os.symlink(op.join(DEPLOY_RELEASES_DIR, idRelease), fpTemp)
+        os.replace(fpTemp, op.join(self.dp, DEPLOY_CURRENT_LINK))
+
+    def remove_release(self, idRelease):
+        import shutil
+        shutil.rmtree(self.get_release_dir(idRelease))
+
+
+def deploy_output(cmdLineArgs, dtPelPath):
+    """
+    Deploy the output directory as a new release of a target, transferring
+    only the files whose contents differ from those of the release currently
+    deployed there, as recorded by the last deployment to the same target.
+    """
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    dpOut = dtPelPath[PelicanArgLabel.OUTPUT]
+    fpSettings = build_pelican_input_paths()[PelicanArgLabel.SETTINGS]
+    dtSetting = read_settings_file(fpSettings)
+
+    strTarget = getattr(cmdLineArgs, ArgName.TARGET) or \
+        dtSetting.get("DEPLOY_TARGET")
+    if not strTarget:
+        strErrMsg = "No deployment target given, nor DEPLOY_TARGET set"
+        archivist.error(strErrMsg)
+        raise Exception(strErrMsg)
+
+    dtManifest = load_json_file(get_build_manifest_file(), {})
+    if dtManifest.get(ManifestKey.PROFILE) != BuildProfile.RELEASE:
+        archivist.warning("The output is not from a release build")
+
+    numJobs = get_pelican_jobs(cmdLineArgs)
+    target = DeployTarget.create(strTarget, numJobs)
+    if target is None:
+        strErrMsg = "Unknown deployment target [{}]".format(strTarget)
+        archivist.error(strErrMsg)
+        raise Exception(strErrMsg)
+    target.check()
+    archivist.info("Deploying to [%s]", strTarget)
+
+    dtHash = hash_output(dpOut)
+
+    # What was deployed last only counts if it is still what is being served
+    fpRecord = get_deploy_record_file(strTarget)
+    dtRecord = load_json_file(fpRecord, {})
+    idCurrent = target.get_current_release()
+    if getattr(cmdLineArgs, ArgName.FULL) or idCurrent is None or \
+            dtRecord.get("release") != idCurrent:
+        dtDeployed = {}
+        idBase = None
+    else:
+        dtDeployed = dtRecord.get("files", {})
+        idBase = idCurrent
+
+    lstChanged = sorted(p for p in dtHash if dtDeployed.get(p) != dtHash[p])
+    lstOrphan = sorted(p for p in dtDeployed if p not in dtHash)
+    numBytes = sum(op.getsize(op.join(dpOut, p)) for p in lstChanged)
+    archivist.info(
+        "%d files to upload (%d bytes), %d to delete, %d unchanged",
+        len(lstChanged), numBytes, len(lstOrphan),
+        len(dtHash) - len(lstChanged)
+    )
+
+    if getattr(cmdLineArgs, ArgName.DRY_RUN):
+        for strPath in lstChanged:
+            archivist.info("    Upload %s", strPath)
+        for strPath in lstOrphan:
+            archivist.info("    Delete %s", strPath)
+        return
+
+    if not lstChanged and not lstOrphan:
+        archivist.info("Release %s is up to date", idCurrent)
+        return
+
+    idRelease = make_release_id()
+    if idRelease in target.list_releases():
+        strErrMsg = "Release {} already exists".format(idRelease)
+        archivist.error(strErrMsg)
+        raise Exception(strErrMsg)
+
+    # Orphans go last, so that the new release is complete before anything
+    # is taken out of it, and it only goes live once it is all there
+    with profile_span("create release", "deploy"):
+        target.create_release(idRelease, idBase)
+    with profile_span("upload", "deploy"):
+        target.upload(dpOut, idRelease, lstChanged)
+    with profile_span("delete orphans", "deploy"):
+        if lstOrphan:
+            target.delete(idRelease, lstOrphan)
+    with profile_span("switch", "deploy"):
+        target.switch(idRelease)
+
+    os.makedirs(op.dirname(fpRecord), exist_ok = True)
+    save_json_file(fpRecord, {
+        "target": strTarget, "release": idRelease, "files": dtHash
+    })
+    archivist.info("Release %s is live", idRelease)
+
+    # Earlier releases are kept around for rolling back
+    numKeep = max(1, getattr(cmdLineArgs, ArgName.KEEP))
+    lstOld = [r for r in target.list_releases() if r != idRelease]
+    for idOld in lstOld[:max(0, len(lstOld) - (numKeep - 1))]:
+        target.remove_release(idOld)
+        archivist.info("Removed release %s", idOld)
 
 
 #<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
@@ -277,36 +4464,96 @@ def create_cmd_line_parser():
         dest = ArgName.DEBUG, action = "store_true",
         help = "Specify this to see more diagnostic output"
     )
+    parser.add_argument(
+        "--subprocess",
+        dest = ArgName.SUBPROCESS, action = "store_true",
+        help = "Run Pelican as a separate process even if it can be imported"
+    )
+    parser.add_argument(
+        "--profile",
+        dest = ArgName.PROFILE, action = "store_true",
+        help = "Time every phase of the run, print a summary at the end and " \
+            "write a Chrome trace to {}".format(get_profile_trace_file())
+    )
 
     subparsers = parser.add_subparsers(
         description = "Different build modes", dest = SubCmd._SUBCMD
     )
     subparsers.required = True
 
-    subparsers.add_parser(
+    parserSite = subparsers.add_parser(
         name = SubCmd.SITE, help = "Regenerate the HTML and CSS files"
     )
-    subparsers.add_parser(
+    parserHtml = subparsers.add_parser(
         name = SubCmd.HTML, help = "Regenerate the HTML files"
     )
-    subparsers.add_parser(
+    parserCss = subparsers.add_parser(
         name = SubCmd.CSS, help = "Regenerate the CSS files"
     )
-    subparsers.add_parser(
+    for p in [parserSite, parserHtml, parserCss]:
+        p.add_argument(
+            "--full",
+            dest = ArgName.FULL, action = "store_true",
+            help = "Regenerate everything instead of only what is stale"
+        )
+        p.add_argument(
+            "--release",
+            dest = ArgName.RELEASE, action = "store_true",
+            help = "Generate compressed CSS without an embedded source map " \
+                "and minified HTML, for publishing"
+        )
+    for p in [parserSite, parserCss]:
+        p.add_argument(
+            "--source-map",
+            dest = ArgName.SOURCE_MAP, action = "store_true",
+            help = "With --release, write the source map of the CSS to a " \
+                "separate file"
+        )
+    parserWatch = subparsers.add_parser(
+        name = SubCmd.WATCH,
+        help = "Regenerate the HTML and CSS files, then keep regenerating " \
+            "whatever is affected by changes to the sources"
+    )
+    parserWatch.add_argument(
+        "--poll",
+        dest = ArgName.POLL, action = "store_true",
+        help = "Poll for changes instead of using inotify"
+    )
+    for p in [parserSite, parserHtml, parserWatch]:
+        p.add_argument(
+            "-j", "--jobs",
+            dest = ArgName.JOBS, type = int, default = 1,
+            help = "Write the pages in this many processes once the content " \
+                "has been read; 0 means one per CPU core (default: 1)"
+        )
+
+    parserClean = subparsers.add_parser(
         name = SubCmd.CLEAN, help = "Remove existing HTML and CSS files"
     )
+    parserClean.add_argument(
+        "--purge-cache",
+        dest = ArgName.PURGE_CACHE, nargs = "*", metavar = "CACHE",
+        choices = sorted(get_purgeable_cache_files()),
+        help = "Also purge the named build caches, or all of them if none " \
+            "are named (choices: %(choices)s)"
+    )
 
     DEFAULT_PORT = 8000
 
     parserServe = subparsers.add_parser(
         name = SubCmd.SERVE_PYTHON,
-        help = "Serve site locally with Python [3.x]"
+        help = "Serve site locally with the built-in server"
     )
     parserServe.add_argument(
         "-p", "--port",
         dest = ArgName.PORT, type = int, default = DEFAULT_PORT,
         help = "Port at which to serve the site"
     )
+    parserServe.add_argument(
+        "-b", "--bind",
+        dest = ArgName.BIND, default = "localhost",
+        help = "Address at which to serve the site (default: %(default)s)"
+    )
 
     parserServePel = subparsers.add_parser(
         name = SubCmd.SERVE_PELICAN, help = "Serve site locally using Pelican"
@@ -317,6 +4564,98 @@ def create_cmd_line_parser():
         help = "Port at which to serve the site"
     )
 
+    for p in [parserServe, parserServePel]:
+        p.add_argument(
+            "--no-livereload",
+            dest = ArgName.LIVERELOAD, action = "store_false",
+            help = "Do not reload pages in the browser when the output changes"
+        )
+
+    parserBench = subparsers.add_parser(
+        name = SubCmd.BENCH,
+        help = "Time cold, warm and single-edit HTML builds of a synthetic " \
+            "site in a scratch copy of the repository"
+    )
+    for (strFlag, strDest, cls, default, strHelp) in [
+        ("--posts", ArgName.POSTS, int, 200, "Number of posts"),
+        ("--math", ArgName.MATH, float, 4.0,
+            "Average number of formulas per post"),
+        ("--code", ArgName.CODE, float, 1.0,
+            "Average number of code blocks per post"),
+        ("--footnotes", ArgName.FOOTNOTES, float, 1.0,
+            "Average number of footnotes per post"),
+        ("--tags", ArgName.TAGS, int, 30, "Number of distinct tags"),
+        ("--categories", ArgName.CATEGORIES, int, 6,
+            "Number of distinct categories"),
+        ("--seed", ArgName.SEED, int, 0, "Seed of the corpus generator"),
+        ("--repeat", ArgName.REPEAT, int, 3,
+            "Runs of each scenario, of which the median time is reported"),
+    ]:
+        parserBench.add_argument(
+            strFlag, dest = strDest, type = cls, default = default,
+            help = strHelp + " (default: %(default)s)"
+        )
+    parserBench.add_argument(
+        "--release",
+        dest = ArgName.RELEASE, action = "store_true",
+        help = "Time release builds"
+    )
+    parserBench.add_argument(
+        "-j", "--jobs",
+        dest = ArgName.JOBS, type = int, default = 1,
+        help = "Passed on to the builds timed (default: %(default)s)"
+    )
+    parserBench.add_argument(
+        "--report",
+        dest = ArgName.REPORT, default = get_bench_report_file(),
+        help = "Where to write the JSON report (default: %(default)s)"
+    )
+    parserBench.add_argument(
+        "--compare",
+        dest = ArgName.COMPARE, metavar = "BASELINE",
+        help = "Fail if the results are worse than those of this earlier " \
+            "report by more than the threshold"
+    )
+    parserBench.add_argument(
+        "--threshold",
+        dest = ArgName.THRESHOLD, type = float, default = 10.0,
+        help = "Largest acceptable slowdown or growth in memory use with " \
+            "--compare, in percent (default: %(default)s)"
+    )
+
+    parserDeploy = subparsers.add_parser(
+        name = SubCmd.DEPLOY,
+        help = "Upload the output as a new release of a target, transferring " \
+            "only what changed since the last deployment there"
+    )
+    parserDeploy.add_argument(
+        ArgName.TARGET, nargs = "?",
+        help = "A local directory or [user@]host:path for rsync over ssh " \
+            "(default: DEPLOY_TARGET in the Pelican settings)"
+    )
+    parserDeploy.add_argument(
+        "-n", "--dry-run",
+        dest = ArgName.DRY_RUN, action = "store_true",
+        help = "Only list what would be uploaded and deleted"
+    )
+    parserDeploy.add_argument(
+        "--full",
+        dest = ArgName.FULL, action = "store_true",
+        help = "Upload everything instead of only what changed"
+    )
+    parserDeploy.add_argument(
+        "-j", "--jobs",
+        dest = ArgName.JOBS, type = int, default = 4,
+        help = "Number of uploads at a time; 0 means one per CPU core " \
+            "(default: %(default)s)"
+    )
+    parserDeploy.add_argument(
+        "--keep",
+        dest = ArgName.KEEP, type = int, default = 3,
+        help = "Number of releases to keep on the target, including the new " \
+            "one, for rolling back (default: %(default)s)"
+    )
+
     return parser
 
 
@@ -333,9 +4672,10 @@ def check_valid_ext(lstCmd, strLabel):
 
     try:
         # Attempt to get the installed version number
-        strOut = sp.check_output(
-            lstCmd + ["--version"], universal_newlines = True
-        ).strip()
+        with profile_span("probe {}".format(strLabel), "probe"):
+            strOut = sp.check_output(
+                lstCmd + ["--version"], universal_newlines = True
+            ).strip()
         archivist.info("Detected %s %s", strLabel, strOut)
         return True
     except:
@@ -344,9 +4684,436 @@ def check_valid_ext(lstCmd, strLabel):
         return False
 
 
-def build_html(cmdLineArgs, dtPelPath):
+def require_valid_ext(lstCmd, strLabel):
+    if not check_valid_ext(lstCmd, strLabel):
+        raise Exception("{} is not available".format(strLabel))
+
+
+def copy_sass_output(dtPelPath):
+    """
+    Make sure the output directory has the current Sass output. Pelican copies
+    the theme's static files while it runs, which may be before Sass has
+    finished when both run at the same time.
+    """
+
+    import filecmp
+    import shutil
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    fpCss = build_sass_paths(wantIn = False)[SassArgLabel.OUTPUT]
+    dpThemeStatic = op.abspath(op.join("theme", "static"))
+
+    # The external source map, if any, goes along with the CSS
+    for fpIn in [fpCss, get_sass_map_file(fpCss)]:
+        fpOut = op.join(
+            dtPelPath[PelicanArgLabel.OUTPUT], "theme",
+            op.relpath(fpIn, dpThemeStatic)
+        )
+
+        if not op.isfile(fpIn):
+            if op.isfile(fpOut):
+                os.remove(fpOut)
+                archivist.info("Removed stale [%s] from the output", fpOut)
+            continue
+
+        if op.isfile(fpOut) and filecmp.cmp(fpIn, fpOut, shallow = False):
+            archivist.debug("Output copy [%s] is up to date", fpOut)
+            continue
+
+        os.makedirs(op.dirname(fpOut), exist_ok = True)
+        shutil.copy2(fpIn, fpOut)
+        archivist.info("Copied [%s] into the output directory", fpIn)
+
+
+# PELICAN ENGINE SUPPORT >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# Pelican is imported and run inside this script whenever it can be, which
+# saves starting another interpreter and importing Pelican, Markdown, Jinja and
+# Pygments all over again on every build. The command line tool is used when
+# Pelican cannot be imported, or when asked to.
+def import_pelican():
+    try:
+        import pelican
+        return pelican
+    except ImportError:
+        return None
+
+
+def want_pel_in_process(cmdLineArgs):
+    if getattr(cmdLineArgs, ArgName.SUBPROCESS, False):
+        return False
+
+    return import_pelican() is not None
+
+
+def probe_pelican(cmdLineArgs):
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    if want_pel_in_process(cmdLineArgs):
+        archivist.info(
+            "Detected Pelican %s (running in-process)",
+            import_pelican().__version__
+        )
+        return
+
+    require_valid_ext(get_pel_cmd(), "Pelican")
+
+
+class LogForwardHandler(logging.Handler):
+    """
+    Hand records from Pelican's loggers (and those of its plugins) over to our
+    own logger, so they are formatted and filtered the same way as ours.
+    """
+
+    def emit(self, record):
+        if record.name == LogName.SCRIPT_LOGGER:
+            return
+
+        # Going through the handlers directly rather than our logger, which
+        # would propagate the record back up to the root logger and this handler
+        archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+        for handler in archivist.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class LogWriter:
+    """
+    File-like object turning every line written to it into a log message. Used
+    to catch what Pelican and its plugins print.
+    """
+
+    def __init__(self, level = logging.INFO):
+        self.level = level
+        self._buffer = ""
+
+    def write(self, s):
+        self._buffer += s
+        while "\n" in self._buffer:
+            (line, self._buffer) = self._buffer.split("\n", 1)
+            logging.getLogger(LogName.SCRIPT_LOGGER).log(self.level, line)
+        return len(s)
+
+    def flush(self):
+        if self._buffer:
+            logging.getLogger(LogName.SCRIPT_LOGGER).log(
+                self.level, self._buffer
+            )
+            self._buffer = ""
+
+
+def read_pel_settings(dtPelPath, dtOverride = None):
+    from pelican.settings import read_settings
+
+    dtFullOverride = {}
+    if PelicanArgLabel.INPUT in dtPelPath:
+        dtFullOverride["PATH"] = dtPelPath[PelicanArgLabel.INPUT]
+    if PelicanArgLabel.OUTPUT in dtPelPath:
+        dtFullOverride["OUTPUT_PATH"] = dtPelPath[PelicanArgLabel.OUTPUT]
+    dtFullOverride.update(dtOverride or {})
+
+    return read_settings(
+        dtPelPath[PelicanArgLabel.SETTINGS], override = dtFullOverride
+    )
+
+
+# Loggers of our plugins that report per-build statistics at info level
+PLUGIN_STATS_LOGGERS = [
+    "disk_cache", "katex_cache", "katex_assets", "search_index", "sitemaps"
+]
+
+
+def run_pelican_in_process(cmdLineArgs, dtPelPath, lstSelected):
+    import contextlib
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    flagDebug = getattr(cmdLineArgs, ArgName.DEBUG)
+
+    # Same levels as the command line tool uses with and without --debug
+    logRoot = logging.getLogger()
+    levelRoot = logRoot.level
+    logRoot.setLevel(logging.DEBUG if flagDebug else logging.WARNING)
+    forwarder = LogForwardHandler()
+    logRoot.addHandler(forwarder)
+
+    # Except for the statistics of our plugins, which belong in the build log
+    dtPluginLevel = {}
+    if not flagDebug:
+        for name in PLUGIN_STATS_LOGGERS:
+            logPlugin = logging.getLogger(name)
+            dtPluginLevel[name] = logPlugin.level
+            logPlugin.setLevel(logging.INFO)
+
+    try:
+        # pelican.log has to be imported before any other part of Pelican
+        import pelican.log
+        import pelican
+
+        settings = read_pel_settings(
+            dtPelPath, {"WRITE_SELECTED": lstSelected or []}
+        )
+
+        cls = settings["PELICAN_CLASS"]
+        if isinstance(cls, str):
+            (module, clsName) = cls.rsplit(".", 1)
+            cls = getattr(__import__(module, fromlist = [clsName]), clsName)
+
+        with contextlib.redirect_stdout(LogWriter()) as writer:
+            try:
+                pel = cls(settings)
+
+                # The plugins are loaded by now, so their parts can be timed
+                # as well
+                undo = None
+                if BuildProfiler.get_active() is not None:
+                    undo = instrument_pelican()
+                numJob = get_pelican_jobs(cmdLineArgs)
+                if numJob > 1 and not hasattr(os, "fork"):
+                    archivist.warning(
+                        "Cannot write pages in parallel on this platform"
+                    )
+                    numJob = 1
+                try:
+                    if numJob > 1:
+                        run_pelican_sharded(pel, numJob)
+                    else:
+                        pel.run()
+                finally:
+                    if undo is not None:
+                        undo()
+            finally:
+                writer.flush()
+    except Exception:
+        archivist.exception("Pelican raised an exception")
+        return False
+    finally:
+        logRoot.removeHandler(forwarder)
+        logRoot.setLevel(levelRoot)
+        for (name, level) in dtPluginLevel.items():
+            logging.getLogger(name).setLevel(level)
+
+    return True
+
+
+def get_pelican_jobs(cmdLineArgs):
+    numJob = getattr(cmdLineArgs, ArgName.JOBS, 1)
+    if numJob <= 0:
+        numJob = os.cpu_count() or 1
+    return numJob
+
+
+def get_page_shard(name, numShard):
+    # Depends on nothing but the name, so that every process agrees on it
+    import zlib
+    return zlib.crc32(name.encode("utf-8")) % numShard
+
+
+def shard_writer(writer, idxShard, numShard):
+    """
+    Make a Pelican writer skip the files that belong to other shards.
+    """
+
+    writeFile = writer.write_file
+    writeFeed = writer.write_feed
+
+    def is_mine(name):
+        # Nameless calls are left for the writer to ignore
+        return not isinstance(name, str) or not name or \
+            get_page_shard(name, numShard) == idxShard
+
+    def write_file(name, *args, **kwargs):
+        if is_mine(name):
+            return writeFile(name, *args, **kwargs)
+
+    def write_feed(elements, context, path = None, *args, **kwargs):
+        if is_mine(path):
+            return writeFeed(elements, context, path, *args, **kwargs)
+
+    writer.write_file = write_file
+    writer.write_feed = write_feed
+
+
+def run_output_shard(lstGenerator, writer, lstPlugin, idxShard, numShard):
+    """
+    Write one shard of the pages in a forked process, returning what the
+    parent needs to know afterwards: the state of the plugins that keep track
+    of the pages written, and the phases timed if profiling.
+    """
+
+    profiler = BuildProfiler.get_active()
+    if profiler is not None:
+        profiler.clear()
+
+    shard_writer(writer, idxShard, numShard)
+    for generator in lstGenerator:
+        generator.generate_output(writer)
+
+    return {
+        "plugins": {
+            plugin.__name__: plugin.get_shard_state()
+            for plugin in lstPlugin
+        },
+        "profile": profiler.get_events() if profiler is not None else [],
+    }
+
+
+def fork_output_shards(lstGenerator, writer, lstPlugin, numShard):
+    """
+    Fork a process for every shard and collect their results in shard order.
+    """
+
+    import pickle
+    import traceback
+
+    lstChild = []
+    for idxShard in range(numShard):
+        (fdRead, fdWrite) = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(fdRead)
+            status = 0
+            try:
+                result = (True, run_output_shard(
+                    lstGenerator, writer, lstPlugin, idxShard, numShard
+                ))
+            except BaseException:
+                result = (False, traceback.format_exc())
+                status = 1
+            try:
+                sys.stdout.flush()
+                with os.fdopen(fdWrite, "wb") as f:
+                    pickle.dump(result, f)
+            finally:
+                # Skip the parent's clean-up, such as closing caches shared
+                # with it
+                os._exit(status)
+
+        os.close(fdWrite)
+        lstChild.append((pid, fdRead))
+
+    # Read every pipe at the same time so that no child blocks on a full one
+    lstData = [None] * numShard
+
+    def read_pipe(idx, fd):
+        with os.fdopen(fd, "rb") as f:
+            lstData[idx] = f.read()
+
+    lstThread = [
+        threading.Thread(target = read_pipe, args = (idx, fd))
+        for (idx, (pid, fd)) in enumerate(lstChild)
+    ]
+    for thread in lstThread:
+        thread.start()
+    for thread in lstThread:
+        thread.join()
+
+    lstResult = []
+    lstError = []
+    for (idx, (pid, fd)) in enumerate(lstChild):
+        os.waitpid(pid, 0)
+        try:
+            (flagOk, result) = pickle.loads(lstData[idx])
+        except Exception:
+            (flagOk, result) = (False, "Shard process died")
+        if flagOk:
+            lstResult.append(result)
+        else:
+            lstError.append("Shard {}: {}".format(idx, result))
+
+    if lstError:
+        raise Exception("\n".join(lstError))
+
+    return lstResult
+
+
+def run_pelican_sharded(pel, numShard):
+    """
+    Do what Pelican.run does, except that the pages are written by several
+    processes. The content is read once, before forking, so every process
+    renders from the same context and the output is the same as that of a
+    serial run. The static files are copied by this process, after the others
+    have finished.
+    """
+
+    import time
+
+    from pelican import signals
+    from pelican.generators import StaticGenerator
+
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+    start = time.time()
+
+    context = pel.settings.copy()
+    context["generated_content"] = {}
+    context["static_links"] = set()
+    context["static_content"] = {}
+    context["localsiteurl"] = pel.settings["SITEURL"]
+
+    lstGenerator = [
+        cls(
+            context = context, settings = pel.settings, path = pel.path,
+            theme = pel.theme, output_path = pel.output_path
+        ) for cls in pel.get_generator_classes()
+    ]
+
+    if pel.delete_outputdir and \
+            not op.realpath(pel.path).startswith(pel.output_path):
+        from pelican.utils import clean_output_dir
+        clean_output_dir(pel.output_path, pel.output_retention)
+
+    for generator in lstGenerator:
+        if hasattr(generator, "generate_context"):
+            generator.generate_context()
+    for generator in lstGenerator:
+        if hasattr(generator, "refresh_metadata_intersite_links"):
+            generator.refresh_metadata_intersite_links()
+
+    signals.all_generators_finalized.send(lstGenerator)
+
+    writer = pel.get_writer()
+    lstPage = [
+        g for g in lstGenerator
+        if hasattr(g, "generate_output") and not isinstance(g, StaticGenerator)
+    ]
+    lstStatic = [g for g in lstGenerator if isinstance(g, StaticGenerator)]
+
+    # Plugins keeping track of the pages written hand over what the shards
+    # saw
+    lstPlugin = [
+        plugin for plugin in pel.plugins
+        if hasattr(plugin, "get_shard_state") and
+            hasattr(plugin, "merge_shard_state")
+    ]
+
+    archivist.info("Writing pages in %d processes", numShard)
+    with profile_span("write shards", "generate"):
+        lstResult = fork_output_shards(lstPage, writer, lstPlugin, numShard)
+
+    profiler = BuildProfiler.get_active()
+    for (idxShard, result) in enumerate(lstResult):
+        for plugin in lstPlugin:
+            plugin.merge_shard_state(result["plugins"][plugin.__name__])
+        if profiler is not None:
+            profiler.add_events(
+                result["profile"], "Shard {}".format(idxShard)
+            )
+
+    for generator in lstStatic:
+        generator.generate_output(writer)
+
+    signals.finalized.send(pel)
+
+    archivist.info(
+        "Done: Processed %d articles and %d pages in %.2f seconds",
+        sum(len(getattr(g, "articles", [])) for g in lstGenerator),
+        sum(len(getattr(g, "pages", [])) for g in lstGenerator),
+        time.time() - start
+    )
+
+
+def run_pelican_subprocess(cmdLineArgs, dtPelPath, lstSelected):
     archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
-    archivist.info("Generating HTML using Pelican into output directory")
 
     fpSettings = dtPelPath[PelicanArgLabel.SETTINGS]
     dpIn = dtPelPath[PelicanArgLabel.INPUT]
@@ -356,6 +5123,8 @@ def build_html(cmdLineArgs, dtPelPath):
     if not isinstance(cmdPel, list):
         cmdPel = [cmdPel]
     args = cmdPel + [dpIn, "--output", dpOut, "--settings", fpSettings]
+    if lstSelected:
+        args += ["--write-selected", ",".join(lstSelected)]
     if getattr(cmdLineArgs, ArgName.DEBUG):
         args.append("--debug")
     proc = sp.Popen(
@@ -367,8 +5136,131 @@ def build_html(cmdLineArgs, dtPelPath):
     for line in iter(proc.stdout.readline, ""):
         archivist.info(line.rstrip('\n'))
 
-    retcode = proc.wait()
-    if retcode == 0:
+    return proc.wait() == 0
+
+
+#<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+
+
+def add_build_tasks(
+    graph, cmdLineArgs, dtPelPath, dtSassPath, flagCss, flagHtml,
+    flagProbed = False
+):
+    """
+    Add the tasks regenerating the CSS and/or the HTML to a task graph. Unless
+    the external tools have been probed already, the graph is expected to hold
+    the tasks probing them.
+    """
+
+    if flagCss:
+        graph.add(
+            "sass", lambda: build_css(cmdLineArgs, dtSassPath),
+            deps = [] if flagProbed else ["probe-sass"]
+        )
+
+    if flagHtml:
+        lstPelDep = [] if flagProbed else ["probe-pelican"]
+
+        # Writing the pages in parallel forks the process, which is only safe
+        # while no other task is running (and possibly holding a lock)
+        if flagCss and get_pelican_jobs(cmdLineArgs) > 1:
+            lstPelDep.append("sass")
+
+        graph.add(
+            "pelican", lambda: build_html(cmdLineArgs, dtPelPath),
+            deps = lstPelDep
+        )
+
+    # Only the copy of the CSS into the output directory has to wait for Sass
+    flagOutExists = dtPelPath is not None and \
+        op.isdir(dtPelPath[PelicanArgLabel.OUTPUT])
+    if flagHtml or (flagCss and flagOutExists):
+        lstCopyDep = []
+        if flagHtml:
+            lstCopyDep.append("pelican")
+        if flagCss:
+            lstCopyDep.append("sass")
+        graph.add(
+            "copy-css", lambda: copy_sass_output(dtPelPath), deps = lstCopyDep
+        )
+
+    if flagHtml:
+        graph.add(
+            "subset-icons", lambda: subset_icons(dtPelPath), deps = ["pelican"]
+        )
+
+        # Both rewrite the pages, so they take turns
+        graph.add(
+            "resize-images", lambda: make_responsive_images(dtPelPath),
+            deps = ["subset-icons"]
+        )
+
+    if flagHtml and get_build_profile(cmdLineArgs) == BuildProfile.RELEASE:
+        # The bundle takes in the fresh CSS as well as the subset icons, and
+        # the resized images have to be there before they are fingerprinted
+        graph.add(
+            "bundle-css", lambda: bundle_css(dtPelPath),
+            deps = ["copy-css", "resize-images"]
+        )
+
+        # The critical rules come out of the bundle, and their URLs are
+        # fingerprinted along with those of the pages
+        graph.add(
+            "critical-css", lambda: inline_critical_css(dtPelPath),
+            deps = ["bundle-css"]
+        )
+
+        graph.add(
+            "fingerprint", lambda: fingerprint_assets(dtPelPath),
+            deps = ["critical-css"]
+        )
+
+        dpOut = dtPelPath[PelicanArgLabel.OUTPUT]
+        graph.add(
+            "minify-html", lambda: minify_html_output(dpOut),
+            deps = ["fingerprint"]
+        )
+
+        # Compression goes last, once everything else has finished writing to
+        # the output directory
+        graph.add(
+            "compress", lambda: compress_output(dpOut),
+            deps = ["copy-css", "minify-html"]
+        )
+
+
+def build_html(cmdLineArgs, dtPelPath):
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+    archivist.info("Generating HTML using Pelican into output directory")
+
+    # Hash the inputs before Pelican starts so that anything edited while it
+    # runs is picked up by the next build
+    dtInput = scan_build_inputs(dtPelPath)
+    dtInput[ManifestKey.PROFILE] = get_build_profile(cmdLineArgs)
+    if getattr(cmdLineArgs, ArgName.FULL, False):
+        lstSelected = None
+    else:
+        lstSelected = plan_html_build(dtPelPath, dtInput)
+
+    if lstSelected is not None and not lstSelected:
+        archivist.info("Output is up to date, Pelican not needed")
+        return
+
+    if lstSelected:
+        archivist.info("Regenerating %d stale output files", len(lstSelected))
+
+    if want_pel_in_process(cmdLineArgs):
+        flagSuccess = run_pelican_in_process(cmdLineArgs, dtPelPath, lstSelected)
+    else:
+        if get_pelican_jobs(cmdLineArgs) > 1:
+            archivist.warning(
+                "Pages are only written in parallel when Pelican runs "
+                "in-process"
+            )
+        flagSuccess = run_pelican_subprocess(cmdLineArgs, dtPelPath, lstSelected)
+
+    if flagSuccess:
+        save_build_manifest(dtPelPath, dtInput)
         archivist.info("Pelican finished")
     else:
         strErrMsg = "Pelican did not finish successfully"
@@ -382,14 +5274,45 @@ def build_css(cmdLineArgs, dtSassPath):
 
     fpIn = dtSassPath[SassArgLabel.INPUT]
     fpOut = dtSassPath[SassArgLabel.OUTPUT]
+    fpStamp = get_sass_stamp_file(fpOut)
 
-    if op.isfile(fpOut):
-        archivist.info("Existing file [%s] will be overwritten by Sass", fpOut)
+    fpMap = get_sass_map_file(fpOut)
 
     cmdSass = get_sass_cmd()
     if not isinstance(cmdSass, list):
         cmdSass = [cmdSass]
-    args = cmdSass + ["--no-quiet", "--embed-source-map", fpIn, fpOut]
+    lstOption = ["--no-quiet"]
+    flagMap = False
+    if get_build_profile(cmdLineArgs) == BuildProfile.RELEASE:
+        lstOption.append("--style=compressed")
+        flagMap = getattr(cmdLineArgs, ArgName.SOURCE_MAP, False)
+        lstOption.append("--source-map" if flagMap else "--no-source-map")
+    else:
+        lstOption.append("--embed-source-map")
+    args = cmdSass + lstOption + [fpIn, fpOut]
+
+    # Hash the inputs before Sass starts so that anything edited while it runs
+    # is picked up by the next build
+    dpCur = os.getcwd()
+    dtStamp = {
+        "options": lstOption,
+        "inputs": dict(
+            (to_manifest_path(fp, dpCur), hash_file(fp))
+            for fp in find_sass_deps(fpIn)
+        )
+    }
+
+    if not getattr(cmdLineArgs, ArgName.FULL, False) and op.isfile(fpOut) \
+            and load_json_file(fpStamp) == dtStamp:
+        archivist.info("Output is up to date, Sass not needed")
+        return
+
+    if op.isfile(fpOut):
+        archivist.info("Existing file [%s] will be overwritten by Sass", fpOut)
+    if not flagMap and op.isfile(fpMap):
+        # Left over from a release build with an external source map
+        os.remove(fpMap)
+
     proc = sp.Popen(
         args, stdout = sp.PIPE, stderr = sp.STDOUT, universal_newlines = True
     )
@@ -401,6 +5324,7 @@ def build_css(cmdLineArgs, dtSassPath):
 
     retcode = proc.wait()
     if retcode == 0:
+        save_json_file(fpStamp, dtStamp)
         archivist.info("Sass finished")
     else:
         strErrMsg = "Sass did not finish successfully"
@@ -417,10 +5341,19 @@ def clean(cmdLineArgs):
     fpSassOut = get_sass_output_file()
     flagRmSass = op.isfile(fpSassOut)
 
-    lstFlagRm = [flagRmPel, flagRmSass]
+    # The build manifest describes the output directory, so it goes with it
+    lstFpManifest = [
+        get_build_manifest_file(), get_build_deps_file(),
+        get_search_state_file(), get_sitemap_state_file(),
+        get_image_record_file()
+    ]
+    flagRmManifest = any(op.isfile(fp) for fp in lstFpManifest)
+
+    lstFlagRm = [flagRmPel, flagRmSass, flagRmManifest]
     lstDesc = [
         "Pelican output directory [{}]".format(dpPelOut),
-        "Sass output CSS file [{}]".format(fpSassOut)
+        "Sass output CSS file [{}]".format(fpSassOut),
+        "Build manifest [{}]".format(get_build_manifest_file())
     ]
     flagRmAny = any(lstFlagRm)
     if flagRmAny:
@@ -450,6 +5383,49 @@ def clean(cmdLineArgs):
             archivist.error("Could not remove Sass output file")
             raise
 
+    # So do its source map and the record of what it was generated from
+    for fp in [get_sass_map_file(fpSassOut), get_sass_stamp_file(fpSassOut)]:
+        if op.isfile(fp):
+            os.remove(fp)
+
+    for fp in lstFpManifest:
+        if op.isfile(fp):
+            try:
+                os.remove(fp)
+                archivist.info("Removed [%s]", fp)
+            except:
+                archivist.error("Could not remove [%s]", fp)
+                raise
+
+    lstCacheName = getattr(cmdLineArgs, ArgName.PURGE_CACHE)
+    if lstCacheName is not None:
+        purge_caches(lstCacheName)
+
+
+def purge_caches(lstCacheName):
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    dtCacheFile = get_purgeable_cache_files()
+    if not lstCacheName:
+        lstCacheName = sorted(dtCacheFile)
+
+    for name in lstCacheName:
+        fp = dtCacheFile[name]
+        if not op.exists(fp):
+            archivist.info("No %s cache to purge", name)
+            continue
+
+        try:
+            if op.isdir(fp):
+                import shutil
+                shutil.rmtree(fp)
+            else:
+                os.remove(fp)
+            archivist.info("Purged %s cache [%s]", name, fp)
+        except:
+            archivist.error("Could not purge %s cache [%s]", name, fp)
+            raise
+
 
 def serve_pelican(cmdLineArgs, dtPelPath):
     # This method won't return until the user stops the server
@@ -463,6 +5439,40 @@ def serve_pelican(cmdLineArgs, dtPelPath):
     port = getattr(cmdLineArgs, ArgName.PORT)
     flagDebug = getattr(cmdLineArgs, ArgName.DEBUG)
 
+    import webbrowser
+    strUrl = "http://localhost:{}/".format(str(port))
+
+    flagLiveReload = getattr(cmdLineArgs, ArgName.LIVERELOAD)
+
+    if want_pel_in_process(cmdLineArgs):
+        hub = None
+        if flagLiveReload:
+            hub = LiveReloadHub(dpOut)
+            hub.start()
+
+        server = create_pelican_server(dpOut, "127.0.0.1", port, hub)
+        archivist.info("Listening at http://127.0.0.1:%d/", port)
+        archivist.info("Press Ctrl+C to stop")
+
+        webbrowser.open_new_tab(strUrl)
+        logRoot = logging.getLogger()
+        forwarder = LogForwardHandler()
+        logRoot.addHandler(forwarder)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            logRoot.removeHandler(forwarder)
+        archivist.info("Server stopped")
+        return
+
+    if flagLiveReload:
+        archivist.warning(
+            "Live reload is not available with Pelican as a separate process"
+        )
+
     cmdPel = get_pel_cmd()
     if not isinstance(cmdPel, list):
         cmdPel = [cmdPel]
@@ -473,42 +5483,104 @@ def serve_pelican(cmdLineArgs, dtPelPath):
     if flagDebug:
         args.append("--debug")
 
-    # Let the server communicate in a separate console window
-    proc = sp.Popen(args, creationflags = sp.CREATE_NEW_CONSOLE)
+    # Let the server communicate in a separate console window, where there is
+    # such a thing
+    proc = sp.Popen(
+        args, creationflags = getattr(sp, "CREATE_NEW_CONSOLE", 0)
+    )
     archivist.debug("Executed the following command as PID %d:", proc.pid)
     archivist.debug("    %r", args)
 
-    import webbrowser
-    strUrl = "http://localhost:{}/".format(str(port))
     webbrowser.open_new_tab(strUrl)
     proc.wait()
     archivist.info("Server stopped")
 
 
 def serve_python(cmdLineArgs, dtPelOutPath):
+    # This method won't return until the user stops the server
     archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
     archivist.info("Serving Pelican site using Python...")
 
     dpOut = dtPelOutPath[PelicanArgLabel.OUTPUT]
 
     port = getattr(cmdLineArgs, ArgName.PORT)
-    args = [
-        "python", "-m", "http.server", str(port), "--bind", "localhost",
-        "--directory", dpOut
-    ]
+    host = getattr(cmdLineArgs, ArgName.BIND)
 
-    # Let the server communicate in a separate console window
-    proc = sp.Popen(args, creationflags = sp.CREATE_NEW_CONSOLE)
-    archivist.debug("Executed the following command as PID %d:", proc.pid)
-    archivist.debug("    %r", args)
+    hub = None
+    if getattr(cmdLineArgs, ArgName.LIVERELOAD):
+        hub = LiveReloadHub(dpOut)
+        hub.start()
+
+    server = create_static_server(dpOut, host, port, hub)
+    archivist.info("Listening at http://%s:%d/", host, port)
+    archivist.info("Press Ctrl+C to stop")
 
     import webbrowser
     strUrl = "http://localhost:{}/".format(str(port))
     webbrowser.open_new_tab(strUrl)
-    proc.wait()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
     archivist.info("Server stopped")
 
 
+def watch_site(cmdLineArgs, dtPelPath, dtSassPath):
+    # This method won't return until the user stops it
+    archivist = logging.getLogger(LogName.SCRIPT_LOGGER)
+
+    def rebuild(flagCss, flagHtml):
+        graph = TaskGraph()
+        add_build_tasks(
+            graph, cmdLineArgs, dtPelPath, dtSassPath,
+            flagCss = flagCss, flagHtml = flagHtml, flagProbed = True
+        )
+        try:
+            graph.run()
+        except Exception:
+            # Keep watching; the next save will probably fix it
+            archivist.error("Rebuild failed")
+
+    rebuild(flagCss = True, flagHtml = True)
+
+    dpCur = op.dirname(dtPelPath[PelicanArgLabel.SETTINGS])
+    dpExtra = op.join(dpCur, "extra")
+    lstDir = [op.join(dpCur, dp) for dp in get_watch_dirs()]
+    lstFile = [op.join(dpCur, fp) for fp in get_watch_files()]
+    watcher = create_watcher(
+        [dp for dp in lstDir if op.isdir(dp)], lstFile,
+        getattr(cmdLineArgs, ArgName.POLL)
+    )
+
+    archivist.info("Press Ctrl+C to stop")
+    try:
+        while True:
+            setChanged = wait_for_changes(watcher)
+            for fp in sorted(setChanged):
+                archivist.info("Changed: %s", op.relpath(fp, dpCur))
+
+            # Sass sources only affect the CSS; everything else watched is read
+            # by Pelican
+            flagCss = any(
+                fp.startswith(dpExtra + os.sep) and fp.endswith(".scss")
+                for fp in setChanged
+            )
+            flagHtml = any(
+                not (fp.startswith(dpExtra + os.sep) and fp.endswith(".scss"))
+                for fp in setChanged
+            )
+            rebuild(flagCss, flagHtml)
+            archivist.info("Waiting for further changes")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+    archivist.info("Stopped watching")
+
+
 def dump_path_diagnostic(dtPath, strHead = None):
     labelColWidth = 0
     for (k, v) in dtPath.items():
@@ -546,6 +5618,9 @@ def main():
             h.setLevel(logging.DEBUG)
             break
 
+    if getattr(args, ArgName.PROFILE):
+        BuildProfiler.set_active(BuildProfiler())
+
     subcmd = getattr(args, SubCmd._SUBCMD)
     archivist.info("Running in \"%s\" mode", subcmd)
     archivist.info("")
@@ -553,21 +5628,26 @@ def main():
     # Decide dependencies
 
     # Do Pelican input files need to exist?
-    flagNeedPelIn = subcmd in [SubCmd.HTML, SubCmd.SITE, SubCmd.SERVE_PELICAN]
+    flagNeedPelIn = subcmd in [
+        SubCmd.HTML, SubCmd.SITE, SubCmd.WATCH, SubCmd.SERVE_PELICAN
+    ]
 
     # Does Pelican need to be executed?
     flagNeedPelUse = flagNeedPelIn
 
     # Do Pelican output files need to exist?
-    flagNeedPelOut = subcmd in [SubCmd.SERVE_PELICAN, SubCmd.SERVE_PYTHON]
+    flagNeedPelOut = subcmd in [
+        SubCmd.SERVE_PELICAN, SubCmd.SERVE_PYTHON, SubCmd.DEPLOY
+    ]
 
     # Do Pelican output destinations need to be specified?
     # Only use is for deciding if we should remind the user what the output
     # destinations are.
-    flagNeedPelOutSpec = flagNeedPelOut or subcmd in [SubCmd.HTML, SubCmd.SITE]
+    flagNeedPelOutSpec = flagNeedPelOut or \
+        subcmd in [SubCmd.HTML, SubCmd.SITE, SubCmd.WATCH]
 
     # Do Sass input files need to exist?
-    flagNeedSassIn = subcmd in [SubCmd.CSS, SubCmd.SITE]
+    flagNeedSassIn = subcmd in [SubCmd.CSS, SubCmd.SITE, SubCmd.WATCH]
 
     # Does Sass need to be executed?
     flagNeedSassUse = flagNeedSassIn
@@ -580,26 +5660,22 @@ def main():
     # destinations are. Note that if Pelican is building the site, it already
     # knows where to find the Sass output file, and the user does not need to
     # know.
-    flagNeedSassOutSpec = subcmd in [SubCmd.CSS, SubCmd.SITE]
+    flagNeedSassOutSpec = subcmd in [SubCmd.CSS, SubCmd.SITE, SubCmd.WATCH]
 
     # Sass creates any necessary directories needed for writing to the
     # destination, so no need to check if the parent directory of the
     # destination file exists
 
     try:
-        # Validate existing resources depending on required dependencies
-        assert check_valid_pel_dir_structure(
-            wantIn = flagNeedPelIn, wantOut = flagNeedPelOut
-        )
-        assert not flagNeedPelUse or check_valid_ext(get_pel_cmd(), "Pelican")
-
-        assert check_valid_sass_file_structure(
-            wantIn = flagNeedSassIn, wantOut = flagNeedSassOut
-        )
-        assert not flagNeedSassUse or check_valid_ext(get_sass_cmd(), "Sass")
-
-        if flagNeedPelUse or flagNeedSassUse:
-            archivist.info("")
+        # Validate existing resources depending on required dependencies. The
+        # external tools themselves are probed as part of the task graph.
+        with profile_span("validate", "validate"):
+            assert check_valid_pel_dir_structure(
+                wantIn = flagNeedPelIn, wantOut = flagNeedPelOut
+            )
+            assert check_valid_sass_file_structure(
+                wantIn = flagNeedSassIn, wantOut = flagNeedSassOut
+            )
     except AssertionError:
         destroy_logger()
         raise
@@ -616,27 +5692,55 @@ def main():
         )
         dump_path_diagnostic(dtSassPath, "Sass arguments")
 
+    # Decide what to execute. Tasks without a dependency between them run at
+    # the same time.
+    graph = TaskGraph()
+    if flagNeedPelUse:
+        graph.add("probe-pelican", lambda: probe_pelican(args))
+    if flagNeedSassUse:
+        graph.add(
+            "probe-sass", lambda: require_valid_ext(get_sass_cmd(), "Sass")
+        )
+
+    if subcmd in [SubCmd.CSS, SubCmd.HTML, SubCmd.SITE]:
+        add_build_tasks(
+            graph, args,
+            dtPelPath if flagNeedPelIn else None,
+            dtSassPath if flagNeedSassIn else None,
+            flagCss = subcmd in [SubCmd.CSS, SubCmd.SITE],
+            flagHtml = subcmd in [SubCmd.HTML, SubCmd.SITE]
+        )
+
+    if subcmd == SubCmd.WATCH:
+        graph.add(
+            "watch", lambda: watch_site(args, dtPelPath, dtSassPath),
+            deps = ["probe-pelican", "probe-sass"]
+        )
+    elif subcmd == SubCmd.CLEAN:
+        graph.add("clean", lambda: clean(args))
+    elif subcmd == SubCmd.SERVE_PELICAN:
+        graph.add(
+            "serve", lambda: serve_pelican(args, dtPelPath),
+            deps = ["probe-pelican"]
+        )
+    elif subcmd == SubCmd.SERVE_PYTHON:
+        graph.add("serve", lambda: serve_python(args, dtPelPath))
+    elif subcmd == SubCmd.BENCH:
+        graph.add("bench", lambda: run_bench(args))
+    elif subcmd == SubCmd.DEPLOY:
+        graph.add("deploy", lambda: deploy_output(args, dtPelPath))
+
     try:
         # Execute commands
-        if subcmd == SubCmd.HTML:
-            build_html(args, dtPelPath)
-        elif subcmd == SubCmd.CSS:
-            build_css(args, dtSassPath)
-        elif subcmd == SubCmd.SITE:
-            build_css(args, dtSassPath)
-            archivist.info("")
-            build_html(args, dtPelPath)
-        elif subcmd == SubCmd.CLEAN:
-            clean(args)
-        elif subcmd == SubCmd.SERVE_PELICAN:
-            serve_pelican(args, dtPelPath)
-        elif subcmd == SubCmd.SERVE_PYTHON:
-            serve_python(args, dtPelPath)
+        graph.run()
     except:
         archivist.error("Could not finish successfully")
+        finish_profile()
         destroy_logger()
         raise
 
+    finish_profile()
+
     archivist.info("")
     archivist.info("Finished")
 
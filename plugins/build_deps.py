@@ -0,0 +1,116 @@
+################################################################################
+# Homotypus Pelican plugin: output dependency recorder
+#
+# Records which content source files every written output page was rendered
+# from, so that the build script can ask Pelican to regenerate only the pages
+# that depend on content which actually changed. The record is written to
+# BUILD_DEPS_FILE inside CACHE_PATH.
+################################################################################
+
+import json
+import logging
+import os
+import os.path as op
+
+from pelican import signals
+
+
+BUILD_DEPS_FILE = "build-deps.json"
+
+# Keys in a template's local context that may hold content objects
+CONTEXT_SINGLE_KEYS = ["article", "page"]
+CONTEXT_LIST_KEYS = ["articles", "dates", "pages"]
+
+archivist = logging.getLogger(__name__)
+
+_dtWritten = {}
+_settings = {}
+
+
+def get_deps_path(settings):
+    return op.join(settings["CACHE_PATH"], BUILD_DEPS_FILE)
+
+
+def to_rel_path(fp, dpBase):
+    return op.relpath(fp, dpBase).replace(os.sep, "/")
+
+
+def collect_sources(context):
+    setSource = set()
+
+    # Every template gets the full article list in its context, but the
+    # templates for a single article or page only show that one piece of
+    # content (plus the category list, which is metadata)
+    lstContent = [context[k] for k in CONTEXT_SINGLE_KEYS if context.get(k)]
+
+    # Similarly a paginated page only shows the articles on that page
+    if not lstContent and context.get("articles_page"):
+        lstContent = list(context["articles_page"].object_list)
+
+    if not lstContent:
+        for k in CONTEXT_LIST_KEYS:
+            lstContent.extend(context.get(k) or [])
+
+    for content in lstContent:
+        fpSource = getattr(content, "source_path", None)
+        if fpSource:
+            setSource.add(fpSource)
+
+        for translation in getattr(content, "translations", []):
+            fpSource = getattr(translation, "source_path", None)
+            if fpSource:
+                setSource.add(fpSource)
+
+    return setSource
+
+
+def on_initialized(pelican):
+    _dtWritten.clear()
+    _settings.clear()
+    _settings.update(pelican.settings)
+
+
+def on_content_written(path, context):
+    # Paths are recorded relative to the directory containing the settings
+    # file (the repository root), the same way the build manifest is keyed
+    dpBase = op.dirname(_settings["PATH"])
+    fpOut = to_rel_path(path, _settings["OUTPUT_PATH"])
+    _dtWritten[fpOut] = sorted(
+        to_rel_path(fp, dpBase) for fp in collect_sources(context)
+    )
+
+
+def get_shard_state():
+    # The build script writes pages in several processes when asked to, and
+    # hands what each of them recorded to the one finishing the run
+    return dict(_dtWritten)
+
+
+def merge_shard_state(state):
+    _dtWritten.update(state)
+
+
+def on_finalized(pelican):
+    fpDeps = get_deps_path(pelican.settings)
+
+    dtDeps = {}
+    if pelican.settings["WRITE_SELECTED"] and op.isfile(fpDeps):
+        # Only some pages were written, so keep what is known about the rest
+        with open(fpDeps, "r", encoding = "utf-8") as f:
+            dtDeps = json.load(f)
+
+    dtDeps.update(_dtWritten)
+
+    os.makedirs(op.dirname(fpDeps), exist_ok = True)
+    with open(fpDeps, "w", encoding = "utf-8") as f:
+        json.dump(dtDeps, f, indent = 1, sort_keys = True)
+    archivist.debug(
+        "Recorded dependencies of %d output files in %s",
+        len(_dtWritten), fpDeps
+    )
+
+
+def register():
+    signals.initialized.connect(on_initialized)
+    signals.content_written.connect(on_content_written)
+    signals.finalized.connect(on_finalized)
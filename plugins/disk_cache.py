@@ -0,0 +1,128 @@
+################################################################################
+# Homotypus Pelican plugin support: persistent key-value cache
+#
+# A small SQLite-backed cache shared by the caching plugins. Entries are evicted
+# least-recently-used first once the total size of the stored values exceeds
+# the configured limit. This module is not a plugin by itself.
+################################################################################
+
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+import sqlite3
+import time
+
+
+archivist = logging.getLogger(__name__)
+
+
+def make_key(*parts):
+    """
+    Combine JSON-serialisable parts into a single cache key.
+    """
+
+    strParts = json.dumps(parts, sort_keys = True, ensure_ascii = False)
+    return hashlib.sha256(strParts.encode("utf-8")).hexdigest()
+
+
+def get_dist_version(name):
+    try:
+        from importlib import metadata
+        return metadata.version(name)
+    except Exception:
+        return "unknown"
+
+
+class DiskCache:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entry (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            atime REAL NOT NULL
+        )
+    """
+
+    def __init__(self, fpDb, maxBytes, label):
+        self.fpDb = fpDb
+        self.maxBytes = maxBytes
+        self.label = label
+
+        self.hits = 0
+        self.misses = 0
+
+        # Access times are only written back when the cache is closed, so that
+        # a hit costs a single SELECT
+        self._dtTouched = {}
+
+        os.makedirs(op.dirname(fpDb), exist_ok = True)
+        self._conn = sqlite3.connect(fpDb, timeout = 30)
+        self._conn.execute(self.SCHEMA)
+        self._conn.commit()
+
+    def get(self, key):
+        row = self._conn.execute(
+            "SELECT value FROM entry WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._dtTouched[key] = time.time()
+        return row[0]
+
+    def contains(self, key):
+        # Unlike get(), this neither counts as a hit or miss nor as a use
+        row = self._conn.execute(
+            "SELECT 1 FROM entry WHERE key = ?", (key,)
+        ).fetchone()
+        return row is not None
+
+    def put(self, key, value):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO entry (key, value, size, atime) "
+            "VALUES (?, ?, ?, ?)",
+            (key, value, len(value.encode("utf-8")), time.time())
+        )
+
+    def evict(self):
+        (totalBytes,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entry"
+        ).fetchone()
+        if totalBytes <= self.maxBytes:
+            return 0
+
+        numEvicted = 0
+        cursor = self._conn.execute(
+            "SELECT key, size FROM entry ORDER BY atime ASC"
+        )
+        lstKey = []
+        for (key, size) in cursor:
+            if totalBytes <= self.maxBytes:
+                break
+            lstKey.append((key,))
+            totalBytes -= size
+            numEvicted += 1
+
+        self._conn.executemany("DELETE FROM entry WHERE key = ?", lstKey)
+        return numEvicted
+
+    def close(self):
+        self._conn.executemany(
+            "UPDATE entry SET atime = ? WHERE key = ?",
+            [(t, key) for (key, t) in self._dtTouched.items()]
+        )
+        self._dtTouched.clear()
+
+        numEvicted = self.evict()
+        self._conn.commit()
+        self._conn.close()
+
+        archivist.info(
+            "%s cache: %d hits, %d misses, %d evicted",
+            self.label, self.hits, self.misses, numEvicted
+        )
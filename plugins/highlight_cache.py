@@ -0,0 +1,87 @@
+################################################################################
+# Homotypus Pelican plugin: persistent code highlighting cache
+#
+# Wraps the highlighter of Markdown's codehilite extension (which fenced code
+# blocks go through as well) so that a piece of code is only handed to Pygments
+# if it has not been highlighted before with the same language, the same
+# codehilite options and the same versions of Pygments and Markdown.
+#
+# Settings:
+#   HIGHLIGHT_CACHE_MAX_SIZE    Size limit of the cache in bytes
+################################################################################
+
+import os.path as op
+
+from markdown.extensions import codehilite
+from pelican import signals
+
+from disk_cache import DiskCache, get_dist_version, make_key
+
+
+HIGHLIGHT_CACHE_FILE = "highlight.sqlite"
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+
+# Everything about a CodeHilite object that goes into its output; from
+# Markdown 3.3 on, the options passed to Pygments are in its options instead
+HILITE_ATTRS = [
+    "src", "lang", "linenums", "guess_lang", "css_class", "style", "noclasses",
+    "tab_length", "hl_lines", "use_pygments", "lang_prefix"
+]
+
+_state = {"cache": None, "settings": None, "hilite": None}
+
+
+def get_cache():
+    if _state["cache"] is None:
+        settings = _state["settings"]
+        _state["cache"] = DiskCache(
+            op.join(settings["CACHE_PATH"], HIGHLIGHT_CACHE_FILE),
+            settings.get("HIGHLIGHT_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE),
+            "Highlight"
+        )
+
+    return _state["cache"]
+
+
+def make_hilite_key(hiliter, args, kwargs):
+    return make_key(
+        get_dist_version("Pygments"), get_dist_version("Markdown"),
+        {a: getattr(hiliter, a, None) for a in HILITE_ATTRS},
+        getattr(hiliter, "options", None), list(args), kwargs
+    )
+
+
+def hilite(self, *args, **kwargs):
+    # Outside a Pelican run (or before it is initialised) there is nowhere to
+    # keep the cache
+    if _state["settings"] is None:
+        return _state["hilite"](self, *args, **kwargs)
+
+    cache = get_cache()
+    key = make_hilite_key(self, args, kwargs)
+
+    html = cache.get(key)
+    if html is None:
+        html = _state["hilite"](self, *args, **kwargs)
+        cache.put(key, html)
+
+    return html
+
+
+def on_initialized(pelican):
+    _state["settings"] = pelican.settings
+
+
+def on_finalized(pelican):
+    if _state["cache"] is not None:
+        _state["cache"].close()
+        _state["cache"] = None
+
+
+def register():
+    if _state["hilite"] is None:
+        _state["hilite"] = codehilite.CodeHilite.hilite
+        codehilite.CodeHilite.hilite = hilite
+
+    signals.initialized.connect(on_initialized)
+    signals.finalized.connect(on_finalized)
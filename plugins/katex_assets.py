@@ -0,0 +1,276 @@
+################################################################################
+# Homotypus Pelican plugin: self-hosted KaTeX stylesheet and fonts
+#
+# Copies the stylesheet and fonts of a local installation of KaTeX (from `npm
+# install katex`) into the output directory, so that pages with mathematical
+# notation do not depend on a CDN. The fonts are cut down to the characters
+# that actually appear in the rendered notation if fontTools is available.
+#
+# The templates link to the stylesheet through KATEX_STYLESHEET, which points
+# at the copy in the output directory, or at the CDN if KaTeX cannot be found.
+# The link is taken out of every page written without any KaTeX markup in it,
+# so that only pages with mathematical notation load the stylesheet.
+#
+# Settings:
+#   KATEX_DIST_PATH     The dist directory of the KaTeX package, relative to
+#                       the directory containing the settings file
+################################################################################
+
+import json
+import logging
+import os
+import os.path as op
+import re
+import shutil
+from html.parser import HTMLParser
+
+from pelican import signals
+
+from disk_cache import make_key
+
+
+DEFAULT_DIST_PATH = op.join("node_modules", "katex", "dist")
+CDN_STYLESHEET = "https://cdn.jsdelivr.net/npm/katex/dist/katex.min.css"
+
+STYLESHEET_FILE = "katex.min.css"
+OUTPUT_DIR = op.join("theme", "katex")
+RECORD_FILE = "katex-assets.json"
+
+# Font formats kept in the stylesheet; every browser supporting the rest of the
+# site understands at least one of them
+FONT_FORMATS = ["woff2", "woff"]
+
+RE_FONT_FACE_SRC = re.compile(r"(@font-face\s*\{[^}]*?src\s*:\s*)([^;}]*)")
+RE_FONT_URL = re.compile(r"""url\(\s*['"]?([^'")]+)['"]?\s*\)""")
+RE_FONT_FORMAT = re.compile(r"""format\(\s*['"]?([^'")]+)['"]?\s*\)""")
+RE_CSS_CONTENT = re.compile(r"""content\s*:\s*["']([^"']*)["']""")
+RE_CSS_ESCAPE = re.compile(r"\\([0-9a-fA-F]{1,6})\s?")
+RE_KATEX_CLASS = re.compile(
+    r"""\bclass=(["'])(?:[^"']*\s)?katex(?:\s[^"']*)?\1"""
+)
+
+archivist = logging.getLogger(__name__)
+
+
+class KatexTextCollector(HTMLParser):
+    """
+    Collects the characters displayed by the HTML half of KaTeX's output (the
+    MathML half is only read out by assistive technology, which does not need
+    KaTeX's fonts).
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs = True)
+        self.setChar = set()
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._depth > 0:
+            self._depth += 1
+        elif tag == "span" and \
+                "katex-html" in (dict(attrs).get("class") or "").split():
+            self._depth = 1
+
+    def handle_endtag(self, tag):
+        if self._depth > 0:
+            self._depth -= 1
+
+    def handle_data(self, data):
+        if self._depth > 0:
+            self.setChar.update(data)
+
+
+def get_dist_dir(settings):
+    dpDist = settings.get("KATEX_DIST_PATH", DEFAULT_DIST_PATH)
+    return op.join(op.dirname(settings["PATH"]), dpDist)
+
+
+def get_katex_version(dpDist):
+    try:
+        with open(op.join(dpDist, "..", "package.json"), "r") as f:
+            return json.load(f).get("version", "unknown")
+    except (OSError, ValueError):
+        return "unknown"
+
+
+def collect_math_chars(dpOut):
+    collector = KatexTextCollector()
+    for (dpRoot, lstDir, lstName) in os.walk(dpOut):
+        for name in lstName:
+            if op.splitext(name)[1].lower() not in [".html", ".htm"]:
+                continue
+
+            with open(op.join(dpRoot, name), "r", encoding = "utf-8") as f:
+                text = f.read()
+            if "katex-html" in text:
+                collector.feed(text)
+                collector.close()
+
+    return collector.setChar
+
+
+def keep_font_formats(css):
+    """
+    Drop the font formats that are not in FONT_FORMATS from the @font-face
+    rules, returning the new stylesheet and the font files still referenced.
+    """
+
+    lstFont = []
+
+    def replace_src(m):
+        lstKept = []
+        for src in m.group(2).split(","):
+            mFormat = RE_FONT_FORMAT.search(src)
+            mUrl = RE_FONT_URL.search(src)
+            if mFormat is None or mUrl is None or \
+                    mFormat.group(1) not in FONT_FORMATS:
+                continue
+            lstKept.append(src.strip())
+            lstFont.append(mUrl.group(1))
+
+        return m.group(1) + ",".join(lstKept)
+
+    return (RE_FONT_FACE_SRC.sub(replace_src, css), lstFont)
+
+
+def subset_font(fpIn, fpOut, setChar):
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = op.splitext(fpIn)[1][1:]
+    options.layout_features = ["*"]
+
+    font = subset.load_font(fpIn, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes = [ord(c) for c in setChar])
+    subsetter.subset(font)
+    subset.save_font(font, fpOut, options)
+
+
+def vendor_katex(settings):
+    dpDist = get_dist_dir(settings)
+    dpOut = op.join(settings["OUTPUT_PATH"], OUTPUT_DIR)
+    fpRecord = op.join(settings["CACHE_PATH"], RECORD_FILE)
+
+    with open(op.join(dpDist, STYLESHEET_FILE), "r", encoding = "utf-8") as f:
+        css = f.read()
+    (css, lstFont) = keep_font_formats(css)
+
+    # Characters inserted by the stylesheet itself count as well
+    setChar = collect_math_chars(settings["OUTPUT_PATH"])
+    for m in RE_CSS_CONTENT.finditer(css):
+        setChar.update(RE_CSS_ESCAPE.sub(
+            lambda mEscape: chr(int(mEscape.group(1), 16)), m.group(1)
+        ))
+
+    try:
+        import fontTools
+        flagSubset = True
+    except ImportError:
+        flagSubset = False
+
+    lstFile = [STYLESHEET_FILE] + lstFont
+    key = make_key(
+        get_katex_version(dpDist), css, sorted(setChar), flagSubset, lstFile
+    )
+    try:
+        with open(fpRecord, "r", encoding = "utf-8") as f:
+            dtRecord = json.load(f)
+    except (OSError, ValueError):
+        dtRecord = {}
+    if dtRecord.get("key") == key and \
+            all(op.isfile(op.join(dpOut, fp)) for fp in lstFile):
+        return
+
+    os.makedirs(dpOut, exist_ok = True)
+    with open(op.join(dpOut, STYLESHEET_FILE), "w", encoding = "utf-8") as f:
+        f.write(css)
+
+    sizeIn = 0
+    sizeOut = 0
+    for fpFont in sorted(set(lstFont)):
+        fpIn = op.join(dpDist, fpFont)
+        fpOut = op.join(dpOut, fpFont)
+        os.makedirs(op.dirname(fpOut), exist_ok = True)
+
+        if flagSubset:
+            subset_font(fpIn, fpOut, setChar)
+        else:
+            shutil.copyfile(fpIn, fpOut)
+        sizeIn += op.getsize(fpIn)
+        sizeOut += op.getsize(fpOut)
+
+    os.makedirs(op.dirname(fpRecord), exist_ok = True)
+    with open(fpRecord, "w", encoding = "utf-8") as f:
+        json.dump({"key": key}, f)
+
+    if flagSubset:
+        archivist.info(
+            "KaTeX assets: subset %d font files to %d characters, "
+                "%d -> %d bytes",
+            len(set(lstFont)), len(setChar), sizeIn, sizeOut
+        )
+    else:
+        archivist.info(
+            "KaTeX assets: copied %d font files (%d bytes); install "
+                "fontTools to subset them",
+            len(set(lstFont)), sizeOut
+        )
+
+
+def on_initialized(pelican):
+    if op.isfile(op.join(get_dist_dir(pelican.settings), STYLESHEET_FILE)):
+        strHref = "{}/{}/{}".format(
+            pelican.settings["SITEURL"], OUTPUT_DIR.replace(os.sep, "/"),
+            STYLESHEET_FILE
+        )
+    else:
+        archivist.warning(
+            "KaTeX not found in [%s], linking to its stylesheet on a CDN",
+            get_dist_dir(pelican.settings)
+        )
+        strHref = CDN_STYLESHEET
+
+    # Read by the templates
+    pelican.settings["KATEX_STYLESHEET"] = strHref
+
+
+def drop_stylesheet_link(fp, strHref):
+    """
+    Take the link to the KaTeX stylesheet out of a page that has no KaTeX
+    markup.
+    """
+
+    with open(fp, "r", encoding = "utf-8") as f:
+        html = f.read()
+    if RE_KATEX_CLASS.search(html):
+        return
+
+    reLink = re.compile(
+        r"""[ \t]*<link\b[^>]*\bhref=(["']){}\1[^>]*>[ \t]*\n?""".format(
+            re.escape(strHref)
+        )
+    )
+    htmlNew = reLink.sub("", html)
+    if htmlNew != html:
+        with open(fp, "w", encoding = "utf-8") as f:
+            f.write(htmlNew)
+
+
+def on_content_written(path, context):
+    # Pelican writes feeds and the like through other signals, and pages that
+    # are not HTML have no stylesheet links
+    if op.splitext(path)[1].lower() in [".html", ".htm"] and \
+            "KATEX_STYLESHEET" in context:
+        drop_stylesheet_link(path, context["KATEX_STYLESHEET"])
+
+
+def on_finalized(pelican):
+    if pelican.settings["KATEX_STYLESHEET"] != CDN_STYLESHEET:
+        vendor_katex(pelican.settings)
+
+
+def register():
+    signals.initialized.connect(on_initialized)
+    signals.content_written.connect(on_content_written)
+    signals.finalized.connect(on_finalized)
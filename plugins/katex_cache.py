@@ -0,0 +1,246 @@
+################################################################################
+# Homotypus Pelican plugin: persistent KaTeX render cache
+#
+# Wraps the renderer of pelican_katex so that a piece of LaTeX is only sent to
+# KaTeX if it has not been rendered before with the same options, the same
+# KATEX_PREAMBLE and the same file-local preamble (the $$@ ... $$ blocks).
+# Needs to be listed after "pelican_katex" in PLUGINS.
+#
+# Anything that does need rendering goes to a pool of persistent Node workers
+# (see katex_pool.py) instead of pelican_katex's single render server. Before
+# the content is read, the sources are scanned for mathematical notation and
+# everything missing from the cache is rendered in parallel across the pool.
+#
+# Settings:
+#   KATEX_CACHE_MAX_SIZE    Size limit of the cache in bytes
+#   KATEX_WORKERS           Number of Node workers; 0 means one per CPU core
+################################################################################
+
+import logging
+import os
+import os.path as op
+import re
+
+from pelican import signals
+
+import pelican_katex.markdown
+import pelican_katex.rendering as rendering
+import pelican_katex.restructuredtext
+
+from disk_cache import DiskCache, get_dist_version, make_key
+from katex_pool import KatexPool
+
+
+KATEX_CACHE_FILE = "katex.sqlite"
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+MARKDOWN_EXTS = [".md", ".markdown", ".mkd", ".mdown"]
+
+# Same flags as Markdown uses for inline patterns
+RE_MATH = re.compile(pelican_katex.markdown.PATTERN, re.DOTALL | re.UNICODE)
+RE_FENCED_CODE = re.compile(
+    r"^(?P<fence>`{3,}|~{3,}).*?^(?P=fence)[ \t]*$", re.DOTALL | re.MULTILINE
+)
+RE_INLINE_CODE = re.compile(r"(`+).+?\1", re.DOTALL)
+RE_BLANK_LINE = re.compile(r"\n[ \t]*\n")
+
+archivist = logging.getLogger(__name__)
+
+_state = {"cache": None, "pool": None, "settings": None, "prefetched": False}
+
+
+def get_cache():
+    if _state["cache"] is None:
+        settings = _state["settings"]
+        _state["cache"] = DiskCache(
+            op.join(settings["CACHE_PATH"], KATEX_CACHE_FILE),
+            settings.get("KATEX_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE),
+            "KaTeX"
+        )
+
+    return _state["cache"]
+
+
+def get_pool():
+    # The pool outlives a single Pelican run so that repeated runs in the same
+    # process keep their warm workers
+    if _state["pool"] is None:
+        katexPath = rendering.KATEX_PATH
+        if not katexPath:
+            # The copy of KaTeX bundled with pelican_katex
+            katexPath = str(rendering.SRC_DIR / "katex.js")
+
+        _state["pool"] = KatexPool(
+            rendering.KATEX_NODEJS_BINARY, str(katexPath),
+            _state["settings"].get("KATEX_WORKERS", 0)
+        )
+
+    return _state["pool"]
+
+
+def build_request(latex, options, lstLocalPreamble):
+    """
+    Mirror what pelican_katex sends to KaTeX for the given LaTeX.
+    """
+
+    katexOptions = dict(rendering.KATEX_DEFAULT_OPTIONS)
+    if options is not None:
+        katexOptions.update(options)
+
+    lstPreamble = [rendering.KATEX_PREAMBLE] + list(lstLocalPreamble)
+    strPreamble = "\n".join(p for p in lstPreamble if p is not None)
+    if strPreamble:
+        latex = strPreamble + "\n" + latex
+
+    return (latex, katexOptions)
+
+
+def make_render_key(latex, options, lstLocalPreamble):
+    (_, katexOptions) = build_request(latex, options, lstLocalPreamble)
+
+    return make_key(
+        get_dist_version("pelican-katex"), str(rendering.KATEX_PATH),
+        make_key(rendering.KATEX_PREAMBLE), list(lstLocalPreamble),
+        katexOptions, latex
+    )
+
+
+def render_uncached(latex, options, lstLocalPreamble):
+    response = get_pool().render(
+        *build_request(latex, options, lstLocalPreamble)
+    )
+
+    if "html" in response:
+        return response["html"]
+    elif "error" in response:
+        raise rendering.KaTeXError(response["error"])
+    else:
+        raise rendering.KaTeXError("Unknown response from KaTeX renderer")
+
+
+def render_latex(latex, options = None):
+    cache = get_cache()
+    lstLocalPreamble = list(rendering.LOCAL_PREAMBLES)
+    key = make_render_key(latex, options, lstLocalPreamble)
+
+    html = cache.get(key)
+    if html is None:
+        # Rendering errors are raised rather than returned, so they are never
+        # cached
+        html = render_uncached(latex, options, lstLocalPreamble)
+        cache.put(key, html)
+
+    return html
+
+
+def find_markdown_math(text):
+    """
+    Yield (latex, options, local preamble) for the mathematical notation that
+    pelican_katex is expected to find in a Markdown document. This only has to
+    be a good guess: anything missed is rendered when the document is read, and
+    anything extra merely costs a cache entry.
+    """
+
+    # Skip the metadata header, code blocks and code spans
+    (_, _, text) = text.partition("\n\n")
+    text = RE_FENCED_CODE.sub("", text)
+    text = RE_INLINE_CODE.sub("", text)
+
+    lstLocalPreamble = []
+    for block in RE_BLANK_LINE.split(text):
+        if all(line.startswith(("    ", "\t")) for line in block.splitlines()):
+            continue
+
+        # Follow the way pelican_katex's inline pattern consumes the block
+        pos = 0
+        while True:
+            m = RE_MATH.search(block, pos)
+            if m is None:
+                break
+
+            if len(m.group("preceding")) == 0 and m.start() > 0:
+                pos = m.start() + 1
+                continue
+            pos = m.end()
+
+            delimiter = m.group("delimiter")
+            latex = m.group("latex")
+            if len(delimiter) == 2 and latex[0] == "@":
+                lstLocalPreamble.append(latex[1:])
+                continue
+
+            options = {"displayMode": delimiter == "$$"}
+            yield (latex, options, tuple(lstLocalPreamble))
+
+
+def prefetch(dpContent):
+    cache = get_cache()
+
+    dtMissing = {}
+    for (dpRoot, lstDir, lstName) in os.walk(dpContent):
+        for name in lstName:
+            if op.splitext(name)[1].lower() not in MARKDOWN_EXTS:
+                continue
+
+            with open(op.join(dpRoot, name), "r", encoding = "utf-8") as f:
+                text = f.read()
+
+            for (latex, options, lstLocal) in find_markdown_math(text):
+                key = make_render_key(latex, options, lstLocal)
+                if key not in dtMissing and not cache.contains(key):
+                    dtMissing[key] = build_request(latex, options, lstLocal)
+
+    if not dtMissing:
+        return
+
+    lstKey = list(dtMissing)
+    lstResponse = get_pool().render_many([dtMissing[k] for k in lstKey])
+    for (key, response) in zip(lstKey, lstResponse):
+        # Errors are left for the real render to report
+        if "html" in response:
+            cache.put(key, response["html"])
+
+    archivist.info(
+        "KaTeX: pre-rendered %d expressions across %d workers",
+        len(lstKey), min(len(lstKey), get_pool().numWorkers)
+    )
+
+
+def on_initialized(pelican):
+    _state["settings"] = pelican.settings
+    _state["prefetched"] = False
+
+
+def on_generator_init(generator):
+    # Every generator announces itself, but the content only needs scanning
+    # once per run
+    if _state["prefetched"]:
+        return
+    _state["prefetched"] = True
+
+    prefetch(generator.settings["PATH"])
+
+
+def on_content_object_init(content):
+    # pelican_katex only forgets the file-local preamble once everything has
+    # been written, by which point every file has been read, so the $$@ blocks
+    # of one file would leak into the ones read after it
+    rendering.reset_preamble()
+
+
+def on_finalized(pelican):
+    if _state["cache"] is not None:
+        _state["cache"].close()
+        _state["cache"] = None
+
+
+def register():
+    # pelican_katex imports the renderer by name into each of its front ends
+    rendering.render_latex = render_latex
+    pelican_katex.markdown.render_latex = render_latex
+    pelican_katex.restructuredtext.render_latex = render_latex
+
+    signals.initialized.connect(on_initialized)
+    signals.generator_init.connect(on_generator_init)
+    signals.content_object_init.connect(on_content_object_init)
+    signals.finalized.connect(on_finalized)
@@ -0,0 +1,155 @@
+################################################################################
+# Homotypus Pelican plugin support: pool of persistent KaTeX workers
+#
+# Keeps a number of Node processes running katex_worker.js, each of which loads
+# KaTeX once and then renders requests sent over its stdin/stdout pipes. A
+# worker that dies is restarted and the request is retried once. This module is
+# not a plugin by itself.
+################################################################################
+
+import atexit
+import json
+import os
+import os.path as op
+import queue
+import struct
+import subprocess as sp
+import threading
+
+
+WORKER_SCRIPT = op.join(op.dirname(op.abspath(__file__)), "katex_worker.js")
+
+# The length of a message is transmitted as 32-bit little-endian integer, the
+# same as in pelican_katex
+LENGTH_STRUCT = struct.Struct("<i")
+
+
+class KatexWorkerError(Exception):
+    pass
+
+
+class KatexWorker:
+    def __init__(self, lstCmd):
+        self.lstCmd = lstCmd
+        self.proc = None
+        self.numStarted = 0
+
+    def start(self):
+        self.proc = sp.Popen(self.lstCmd, stdin = sp.PIPE, stdout = sp.PIPE)
+        self.numStarted += 1
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self):
+        if self.proc is None:
+            return
+
+        try:
+            # Closing stdin lets the worker exit by itself
+            self.proc.stdin.close()
+            self.proc.wait(timeout = 1)
+        except (OSError, sp.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def request(self, dtRequest):
+        if not self.is_alive():
+            self.stop()
+            self.start()
+
+        data = json.dumps(dtRequest).encode("utf-8")
+        self.proc.stdin.write(LENGTH_STRUCT.pack(len(data)) + data)
+        self.proc.stdin.flush()
+
+        header = self.proc.stdout.read(LENGTH_STRUCT.size)
+        if len(header) < LENGTH_STRUCT.size:
+            raise KatexWorkerError("KaTeX worker exited unexpectedly")
+        (length,) = LENGTH_STRUCT.unpack(header)
+
+        data = self.proc.stdout.read(length)
+        if len(data) < length:
+            raise KatexWorkerError("KaTeX worker exited unexpectedly")
+
+        return json.loads(data.decode("utf-8"))
+
+
+class KatexPool:
+    """
+    Workers are started lazily, so a build where every expression is already
+    cached never starts Node at all.
+    """
+
+    def __init__(self, nodeBinary, katexPath, numWorkers = 0):
+        if numWorkers <= 0:
+            numWorkers = os.cpu_count() or 1
+
+        self.lstCmd = [nodeBinary, WORKER_SCRIPT, katexPath]
+        self.numWorkers = numWorkers
+
+        self._lock = threading.Lock()
+        self._lstWorker = []
+        self._idle = queue.Queue()
+
+        atexit.register(self.stop)
+
+    def _acquire(self):
+        with self._lock:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            if len(self._lstWorker) < self.numWorkers:
+                worker = KatexWorker(self.lstCmd)
+                worker.start()
+                self._lstWorker.append(worker)
+                return worker
+
+        return self._idle.get()
+
+    def render(self, latex, katexOptions):
+        """
+        Render a single expression, returning the response of the worker as a
+        dictionary with either an "html" or an "error" entry. Safe to call from
+        several threads at once.
+        """
+
+        dtRequest = {"latex": latex, "katex_options": katexOptions}
+
+        worker = self._acquire()
+        try:
+            try:
+                return worker.request(dtRequest)
+            except (OSError, KatexWorkerError):
+                # The worker crashed; give the request one more chance with a
+                # fresh worker
+                worker.stop()
+                worker.start()
+                return worker.request(dtRequest)
+        finally:
+            self._idle.put(worker)
+
+    def render_many(self, lstRequest):
+        """
+        Render (latex, katexOptions) pairs concurrently across the workers,
+        returning the responses in the same order.
+        """
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        numThread = min(self.numWorkers, len(lstRequest))
+        if numThread == 0:
+            return []
+
+        with ThreadPoolExecutor(max_workers = numThread) as executor:
+            return list(executor.map(lambda r: self.render(*r), lstRequest))
+
+    def stop(self):
+        with self._lock:
+            for worker in self._lstWorker:
+                worker.stop()
+            self._lstWorker = []
+            self._idle = queue.Queue()
@@ -0,0 +1,59 @@
+// Homotypus KaTeX render worker
+//
+// Long-lived worker managed by katex_pool.py. Requests arrive on stdin and
+// responses leave on stdout, both as a 32-bit little-endian byte length
+// followed by that many bytes of UTF-8 encoded JSON. A request looks like
+//   {"latex": "...", "katex_options": {...}}
+// and is answered with either {"html": "..."} or {"error": "..."}, in order.
+//
+// Usage: node katex_worker.js [path to katex]
+
+const process = require("process");
+
+const katex = require(process.argv.length > 2 ? process.argv[2] : "katex");
+
+let pending = Buffer.alloc(0);
+
+process.stdin.on("data", function (chunk) {
+  pending = Buffer.concat([pending, chunk]);
+
+  while (pending.length >= 4) {
+    const length = pending.readInt32LE(0);
+    if (pending.length < 4 + length) {
+      break;
+    }
+
+    const serialized = pending.slice(4, 4 + length).toString("utf-8");
+    pending = pending.slice(4 + length);
+    sendMessage(handleRequest(serialized));
+  }
+});
+
+// The pool closes our stdin when it shuts down or its process dies, so this is
+// how we know we are no longer needed
+process.stdin.on("end", function () {
+  process.exit(0);
+});
+
+function handleRequest(serialized) {
+  let request;
+  try {
+    request = JSON.parse(serialized);
+  } catch (e) {
+    return { "error": `Could not deserialize ${serialized}: ${e.message}` };
+  }
+
+  try {
+    const options = request["katex_options"] || {};
+    return { "html": katex.renderToString(request["latex"], options) };
+  } catch (e) {
+    return { "error": e.message };
+  }
+}
+
+function sendMessage(response) {
+  const msgBuffer = Buffer.from(JSON.stringify(response), "utf-8");
+  const lengthBuffer = Buffer.alloc(4);
+  lengthBuffer.writeInt32LE(msgBuffer.length, 0);
+  process.stdout.write(Buffer.concat([lengthBuffer, msgBuffer]));
+}
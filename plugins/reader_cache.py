@@ -0,0 +1,180 @@
+################################################################################
+# Homotypus Pelican plugin: persistent parsed-content cache
+#
+# Wraps Pelican's Markdown reader so that a source file is only converted to
+# HTML (with all the Markdown extensions, including the KaTeX and code
+# highlighting work that goes with them) if it has not been converted before.
+# Entries are keyed on a hash of the file's contents and a hash of everything
+# else that goes into the conversion: the MARKDOWN, KATEX_PREAMBLE and
+# FORMATTED_FIELDS settings and the versions of the packages involved.
+#
+# What is cached is the HTML of the body and of the formatted metadata fields
+# along with the metadata as written in the file, which is processed again on
+# every read, so that the cache only holds plain text.
+#
+# Settings:
+#   READER_CACHE_MAX_SIZE   Size limit of the cache in bytes
+################################################################################
+
+import hashlib
+import json
+import logging
+import os.path as op
+
+from pelican import signals
+from pelican.readers import DUPLICATES_DEFINITIONS_ALLOWED, MarkdownReader
+from pelican.utils import pelican_open
+
+from disk_cache import DiskCache, get_dist_version, make_key
+
+
+READER_CACHE_FILE = "reader.sqlite"
+DEFAULT_MAX_SIZE = 128 * 1024 * 1024
+
+# Bumped whenever what is stored changes shape
+ENTRY_VERSION = 1
+
+# Packages whose versions affect the HTML
+DIST_NAMES = ["pelican", "Markdown", "Pygments", "pelican-katex"]
+
+# Pelican's reader warnings come from its own logger
+logger = logging.getLogger("pelican.readers")
+
+_state = {"cache": None, "settings": None, "configKey": None, "read": None}
+
+
+def get_cache():
+    if _state["cache"] is None:
+        settings = _state["settings"]
+        _state["cache"] = DiskCache(
+            op.join(settings["CACHE_PATH"], READER_CACHE_FILE),
+            settings.get("READER_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE),
+            "Reader"
+        )
+
+    return _state["cache"]
+
+
+def describe_object(obj):
+    """
+    Describe an object found in the settings that JSON does not know, such as
+    an extension instance, by its class and (for extensions) its options.
+    """
+
+    strClass = type(obj).__module__ + "." + type(obj).__qualname__
+    if hasattr(obj, "getConfigs"):
+        return [strClass, obj.getConfigs()]
+    else:
+        return strClass
+
+
+def make_config_key(settings):
+    try:
+        import pelican_katex.rendering as rendering
+        strKatexPath = str(rendering.KATEX_PATH)
+    except ImportError:
+        strKatexPath = None
+
+    strMarkdown = json.dumps(
+        settings["MARKDOWN"], sort_keys = True, default = describe_object
+    )
+
+    return make_key(
+        ENTRY_VERSION, strMarkdown, settings.get("KATEX_PREAMBLE"),
+        sorted(settings["FORMATTED_FIELDS"]), strKatexPath,
+        [get_dist_version(name) for name in DIST_NAMES]
+    )
+
+
+def convert(reader, source_path):
+    """
+    Do the expensive part of MarkdownReader.read, returning what is cached.
+    """
+
+    from markdown import Markdown
+
+    reader._source_path = source_path
+    reader._md = Markdown(**reader.settings["MARKDOWN"])
+    with pelican_open(source_path) as text:
+        content = reader._md.convert(text)
+
+    dtMeta = getattr(reader._md, "Meta", {})
+    dtFormatted = {}
+    for (name, value) in dtMeta.items():
+        if name.lower() in reader.settings["FORMATTED_FIELDS"]:
+            # Reset the Markdown instance to clear any state, as Pelican does
+            reader._md.reset()
+            dtFormatted[name.lower()] = reader._md.convert("\n".join(value))
+
+    return {"content": content, "meta": dtMeta, "formatted": dtFormatted}
+
+
+def parse_metadata(reader, entry):
+    """
+    Turn the metadata of a cache entry into what MarkdownReader.read returns,
+    the same way MarkdownReader._parse_metadata does.
+    """
+
+    output = {}
+    for (name, value) in entry["meta"].items():
+        name = name.lower()
+        if name in entry["formatted"]:
+            output[name] = reader.process_metadata(
+                name, entry["formatted"][name]
+            )
+        elif not DUPLICATES_DEFINITIONS_ALLOWED.get(name, True):
+            if len(value) > 1:
+                logger.warning(
+                    "Duplicate definition of `%s` for %s. Using first one.",
+                    name, reader._source_path
+                )
+            output[name] = reader.process_metadata(name, value[0])
+        elif len(value) > 1:
+            output[name] = reader.process_metadata(name, value)
+        else:
+            output[name] = reader.process_metadata(name, value[0])
+
+    return output
+
+
+def read(self, source_path):
+    # Outside a Pelican run (or before it is initialised) there is nowhere to
+    # keep the cache
+    if _state["settings"] is None:
+        return _state["read"](self, source_path)
+
+    with open(source_path, "rb") as f:
+        hashSource = hashlib.sha256(f.read()).hexdigest()
+
+    cache = get_cache()
+    key = make_key(_state["configKey"], hashSource)
+
+    value = cache.get(key)
+    if value is None:
+        entry = convert(self, source_path)
+        cache.put(key, json.dumps(entry, ensure_ascii = False))
+    else:
+        entry = json.loads(value)
+
+    self._source_path = source_path
+    return (entry["content"], parse_metadata(self, entry))
+
+
+def on_initialized(pelican):
+    _state["settings"] = pelican.settings
+    _state["configKey"] = make_config_key(pelican.settings)
+
+
+def on_finalized(pelican):
+    if _state["cache"] is not None:
+        _state["cache"].close()
+        _state["cache"] = None
+
+
+def register():
+    if _state["read"] is None:
+        _state["read"] = MarkdownReader.read
+        MarkdownReader.read = read
+
+    signals.initialized.connect(on_initialized)
+    signals.finalized.connect(on_finalized)
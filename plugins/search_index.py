@@ -0,0 +1,372 @@
+################################################################################
+# Homotypus Pelican plugin: client-side search index
+#
+# Tokenizes the titles, tags, categories and bodies of the articles and writes
+# an inverted index into SEARCH_INDEX_PATH in the output, for the search page to
+# query in the browser without any server-side help. Rather than one file every
+# visitor would have to download, the index is split into shards by the first
+# SEARCH_PREFIX_LENGTH characters of the terms, so that a query only fetches the
+# shards of the terms in it. The titles, URLs and dates of the articles go into
+# separate files of SEARCH_DOCS_PER_FILE articles each. INDEX_FILE lists both
+# with hashes of their contents, which the search page adds to their URLs.
+#
+# The terms of every article are kept in SEARCH_STATE_FILE inside CACHE_PATH,
+# so that only the articles that changed are tokenized again and only the
+# shards holding their terms (before and after the change) are written again.
+################################################################################
+
+import hashlib
+import html.parser
+import json
+import logging
+import os
+import os.path as op
+import re
+import unicodedata
+
+from pelican import signals
+
+
+SEARCH_STATE_FILE = "search-index.json"
+INDEX_FILE = "index.json"
+TERMS_DIR = "terms"
+DOCS_DIR = "docs"
+
+DEFAULT_INDEX_PATH = "search"
+DEFAULT_PREFIX_LENGTH = 2
+DEFAULT_DOCS_PER_FILE = 100
+
+# Bumped whenever the format of the index or the tokenizing changes
+INDEX_VERSION = 1
+
+archivist = logging.getLogger(__name__)
+
+# How much a term counts for every time it appears in a field
+FIELD_WEIGHTS = {"title": 8, "tags": 4, "category": 4, "body": 1}
+
+MIN_TERM_LENGTH = 2
+STOP_WORDS = sorted([
+    "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has",
+    "have", "if", "in", "into", "is", "it", "its", "not", "of", "on", "or",
+    "so", "that", "the", "their", "then", "there", "these", "this", "to",
+    "was", "we", "were", "which", "will", "with"
+])
+SET_STOP_WORDS = frozenset(STOP_WORDS)
+
+# Letters and digits, as the search page splits queries
+RE_TERM = re.compile(r"[^\W_]+")
+
+# Shard names that need no escaping in a URL or a file system
+RE_PLAIN_PREFIX = re.compile(r"[a-z0-9]+")
+
+# Elements whose text is not worth searching; KaTeX output is mostly glyphs
+SKIPPED_TAGS = {"script", "style", "template"}
+SKIPPED_CLASSES = {"katex"}
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "param", "source", "track", "wbr"
+}
+
+_state = {"settings": None, "articles": []}
+
+
+class TextExtractor(html.parser.HTMLParser):
+    """
+    Collects the text of an HTML fragment that is worth searching.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs = True)
+        self.lstText = []
+        self.numSkipDepth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+
+        if self.numSkipDepth:
+            self.numSkipDepth += 1
+        elif tag in SKIPPED_TAGS or \
+                SKIPPED_CLASSES & set((dict(attrs).get("class") or "").split()):
+            self.numSkipDepth = 1
+
+    def handle_endtag(self, tag):
+        if self.numSkipDepth and tag not in VOID_TAGS:
+            self.numSkipDepth -= 1
+
+    def handle_data(self, data):
+        if not self.numSkipDepth:
+            self.lstText.append(data)
+
+    def get_text(self):
+        return " ".join(self.lstText)
+
+
+def get_state_path(settings):
+    return op.join(settings["CACHE_PATH"], SEARCH_STATE_FILE)
+
+
+def html_to_text(strHtml):
+    extractor = TextExtractor()
+    extractor.feed(strHtml or "")
+    extractor.close()
+    return extractor.get_text()
+
+
+def tokenize(text):
+    """
+    Split text into search terms: lowercase letters and digits with accents
+    taken off, leaving out stop words. The search page does the same to
+    queries.
+    """
+
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return [
+        t for t in RE_TERM.findall(text.lower())
+        if len(t) >= MIN_TERM_LENGTH and t not in SET_STOP_WORDS
+    ]
+
+
+def get_shard_name(prefix):
+    # Anything but plain letters and digits is spelt out as UTF-8 in hex
+    if RE_PLAIN_PREFIX.fullmatch(prefix):
+        return prefix
+    else:
+        return "_" + prefix.encode("utf-8").hex()
+
+
+def get_fields(article):
+    return {
+        "title": html_to_text(article.title),
+        "tags": " ".join(t.name for t in getattr(article, "tags", [])),
+        "category": article.category.name if article.category else "",
+        "body": html_to_text(article.content),
+    }
+
+
+def make_doc(article):
+    # What the search page shows for a result
+    return [html_to_text(article.title), article.url, article.locale_date]
+
+
+def hash_article(article):
+    # Of what the fields are made from, which is quicker than making them
+    data = json.dumps([
+        article.title, article.url, article.locale_date,
+        [t.name for t in getattr(article, "tags", [])],
+        article.category.name if article.category else "", article.content
+    ], ensure_ascii = False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def weigh_terms(article):
+    dtWeight = {}
+    for (name, text) in get_fields(article).items():
+        for term in tokenize(text):
+            dtWeight[term] = dtWeight.get(term, 0) + FIELD_WEIGHTS[name]
+
+    return dtWeight
+
+
+def make_config(settings):
+    # Anything that changes what goes where in the index
+    return {
+        "version": INDEX_VERSION,
+        "prefixLength": settings.get(
+            "SEARCH_PREFIX_LENGTH", DEFAULT_PREFIX_LENGTH
+        ),
+        "docsPerFile": settings.get(
+            "SEARCH_DOCS_PER_FILE", DEFAULT_DOCS_PER_FILE
+        ),
+        "minLength": MIN_TERM_LENGTH,
+        "stopWords": STOP_WORDS,
+        "weights": FIELD_WEIGHTS,
+    }
+
+
+def load_state(fp, dtConfig):
+    try:
+        with open(fp, "r", encoding = "utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = None
+
+    if not isinstance(state, dict) or state.get("config") != dtConfig:
+        state = {
+            "config": dtConfig, "nextId": 0, "docs": {}, "shards": {},
+            "chunks": {}
+        }
+
+    return state
+
+
+def encode_json(obj):
+    return json.dumps(
+        obj, ensure_ascii = False, sort_keys = True, separators = (",", ":")
+    ).encode("utf-8")
+
+
+def write_if_changed(fp, data):
+    try:
+        with open(fp, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    os.makedirs(op.dirname(fp), exist_ok = True)
+    with open(fp, "wb") as f:
+        f.write(data)
+
+    return True
+
+
+def remove_if_exists(fp):
+    if op.isfile(fp):
+        os.remove(fp)
+
+
+def write_index(settings, lstArticle):
+    dtConfig = make_config(settings)
+    numPrefix = dtConfig["prefixLength"]
+    numPerFile = dtConfig["docsPerFile"]
+
+    dpIndex = op.join(
+        settings["OUTPUT_PATH"],
+        settings.get("SEARCH_INDEX_PATH", DEFAULT_INDEX_PATH)
+    )
+    fpState = get_state_path(settings)
+    state = load_state(fpState, dtConfig)
+
+    def get_prefixes(dtTerm):
+        return {t[:numPrefix] for t in dtTerm}
+
+    # Work out which articles are new, changed or gone, and so which shards
+    # and document files need writing
+    dtOldDoc = state["docs"]
+    dtDoc = {}
+    setPrefix = set()
+    setChunk = set()
+    numTokenized = 0
+    for article in lstArticle:
+        key = op.relpath(article.source_path, settings["PATH"])
+        if key in dtDoc:
+            continue
+
+        strHash = hash_article(article)
+        entry = dtOldDoc.pop(key, None)
+        if entry is not None and entry["hash"] == strHash:
+            dtDoc[key] = entry
+            continue
+
+        if entry is None:
+            idDoc = state["nextId"]
+            state["nextId"] += 1
+        else:
+            idDoc = entry["id"]
+            setPrefix |= get_prefixes(entry["terms"])
+
+        dtTerm = weigh_terms(article)
+        numTokenized += 1
+        dtDoc[key] = {
+            "id": idDoc, "hash": strHash, "doc": make_doc(article),
+            "terms": dtTerm
+        }
+        setPrefix |= get_prefixes(dtTerm)
+        setChunk.add(idDoc // numPerFile)
+
+    for entry in dtOldDoc.values():
+        setPrefix |= get_prefixes(entry["terms"])
+        setChunk.add(entry["id"] // numPerFile)
+
+    state["docs"] = dtDoc
+
+    # Shards that went missing from the output (e.g. after cleaning it) are
+    # written again too
+    for prefix in state["shards"]:
+        fp = op.join(dpIndex, TERMS_DIR, get_shard_name(prefix) + ".json")
+        if not op.isfile(fp):
+            setPrefix.add(prefix)
+    for chunk in state["chunks"]:
+        if not op.isfile(op.join(dpIndex, DOCS_DIR, chunk + ".json")):
+            setChunk.add(int(chunk))
+
+    dtShard = {prefix: {} for prefix in setPrefix}
+    dtChunk = {str(chunk): {} for chunk in setChunk}
+    for entry in dtDoc.values():
+        for (term, weight) in entry["terms"].items():
+            shard = dtShard.get(term[:numPrefix])
+            if shard is not None:
+                shard.setdefault(term, []).append((weight, entry["id"]))
+
+        chunk = dtChunk.get(str(entry["id"] // numPerFile))
+        if chunk is not None:
+            chunk[str(entry["id"])] = entry["doc"]
+
+    # Postings are flat lists of document IDs and weights, heaviest first
+    numWritten = 0
+    for (prefix, shard) in dtShard.items():
+        fp = op.join(dpIndex, TERMS_DIR, get_shard_name(prefix) + ".json")
+        if not shard:
+            remove_if_exists(fp)
+            state["shards"].pop(prefix, None)
+            continue
+
+        data = encode_json({
+            term: [x for (w, i) in sorted(lst, key = lambda p: (-p[0], p[1]))
+                   for x in (i, w)]
+            for (term, lst) in shard.items()
+        })
+        state["shards"][prefix] = hashlib.sha1(data).hexdigest()[:10]
+        numWritten += write_if_changed(fp, data)
+
+    for (chunk, dtChunkDoc) in dtChunk.items():
+        fp = op.join(dpIndex, DOCS_DIR, chunk + ".json")
+        if not dtChunkDoc:
+            remove_if_exists(fp)
+            state["chunks"].pop(chunk, None)
+            continue
+
+        data = encode_json(dtChunkDoc)
+        state["chunks"][chunk] = hashlib.sha1(data).hexdigest()[:10]
+        write_if_changed(fp, data)
+
+    dtIndex = {k: dtConfig[k] for k in dtConfig if k != "weights"}
+    dtIndex.update({"shards": state["shards"], "docs": state["chunks"]})
+    write_if_changed(op.join(dpIndex, INDEX_FILE), encode_json(dtIndex))
+
+    os.makedirs(op.dirname(fpState), exist_ok = True)
+    with open(fpState, "w", encoding = "utf-8") as f:
+        json.dump(state, f, ensure_ascii = False)
+
+    archivist.info(
+        "Search index: %d articles, %d tokenized, %d of %d shards written",
+        len(dtDoc), numTokenized, numWritten, len(state["shards"])
+    )
+
+
+def on_initialized(pelican):
+    _state["settings"] = pelican.settings
+    _state["articles"] = []
+
+
+def on_article_generator_finalized(generator):
+    # The articles are all read by now, before any page is written (or the
+    # writing is split between processes)
+    _state["articles"] = list(generator.articles) + \
+        list(generator.translations)
+
+
+def on_finalized(pelican):
+    if _state["settings"] is not None:
+        write_index(_state["settings"], _state["articles"])
+
+    _state["articles"] = []
+
+
+def register():
+    signals.initialized.connect(on_initialized)
+    signals.article_generator_finalized.connect(on_article_generator_finalized)
+    signals.finalized.connect(on_finalized)
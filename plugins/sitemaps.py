@@ -0,0 +1,305 @@
+################################################################################
+# Homotypus Pelican plugin: sitemaps
+#
+# Writes the articles and pages into sitemaps of at most SITEMAP_MAX_URLS
+# entries and SITEMAP_MAX_BYTES bytes each (the limits of the sitemap protocol
+# by default), saved as SITEMAP_SAVE_AS (formatted with the group, "pages" or
+# "posts", and a number) and listed by a sitemap index at
+# SITEMAP_INDEX_SAVE_AS. The entries are streamed to disk one at a time rather
+# than rendered into one document.
+#
+# Pages and articles get sitemaps of their own, and articles go in order of
+# date, so that new articles only ever change the last of their sitemaps. A
+# sitemap is only replaced in the output when its contents changed, which
+# leaves crawlers nothing new to fetch for the rest.
+#
+# The lastmod of an entry is its "modified" metadata if it has any, or else
+# the time its source file was first seen with its current contents. The
+# content hashes and those times are kept in SITEMAP_STATE_FILE inside
+# CACHE_PATH, along with the hashes of the sitemaps written.
+################################################################################
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+import urllib.parse
+from xml.sax.saxutils import escape
+
+from pelican import signals
+
+
+SITEMAP_STATE_FILE = "sitemap.json"
+
+DEFAULT_INDEX_SAVE_AS = "sitemap_index.xml"
+DEFAULT_SAVE_AS = "sitemap-{group}-{number}.xml"
+DEFAULT_MAX_URLS = 50000
+DEFAULT_MAX_BYTES = 50 * 1000 * 1000
+
+# Entries of each group (and the order of the groups in the index)
+GROUP_PRIORITIES = [("pages", "1.0"), ("posts", "0.8")]
+
+archivist = logging.getLogger(__name__)
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_START = XML_HEADER + \
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_END = "</urlset>\n"
+URL_ENTRY = "<url><loc>{}</loc><lastmod>{}</lastmod>" \
+    "<priority>{}</priority></url>\n"
+INDEX_START = XML_HEADER + \
+    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_END = "</sitemapindex>\n"
+INDEX_ENTRY = "<sitemap><loc>{}</loc><lastmod>{}</lastmod></sitemap>\n"
+
+_state = {"settings": None, "articles": [], "pages": []}
+
+
+class SitemapFile:
+    """
+    One sitemap being streamed into a temporary file next to where it goes.
+    Nothing replaces the existing sitemap unless the contents differ.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.fpTemp = fp + ".tmp"
+        os.makedirs(op.dirname(fp), exist_ok = True)
+        self.f = open(self.fpTemp, "wb")
+        self.hasher = hashlib.sha256()
+        self.numUrls = 0
+        self.numBytes = 0
+        self.strLastmod = ""
+        self.write(URLSET_START)
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.f.write(data)
+        self.hasher.update(data)
+        self.numBytes += len(data)
+
+    def fits(self, strEntry, numMaxUrls, numMaxBytes):
+        numBytes = len(strEntry.encode("utf-8")) + len(URLSET_END)
+        return self.numUrls < numMaxUrls and \
+            self.numBytes + numBytes <= numMaxBytes
+
+    def add(self, strEntry, strLastmod):
+        self.write(strEntry)
+        self.numUrls += 1
+        self.strLastmod = max(self.strLastmod, strLastmod)
+
+    def close(self, strOldHash):
+        """
+        Finish the sitemap, returning its hash and whether it was replaced.
+        """
+
+        self.write(URLSET_END)
+        self.f.close()
+
+        strHash = self.hasher.hexdigest()
+        if strHash == strOldHash and op.isfile(self.fp):
+            os.remove(self.fpTemp)
+            return (strHash, False)
+
+        os.replace(self.fpTemp, self.fp)
+        return (strHash, True)
+
+
+def get_state_path(settings):
+    return op.join(settings["CACHE_PATH"], SITEMAP_STATE_FILE)
+
+
+def load_state(fp):
+    try:
+        with open(fp, "r", encoding = "utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = None
+
+    if not isinstance(state, dict):
+        state = {}
+    state.setdefault("urls", {})
+    state.setdefault("files", {})
+
+    return state
+
+
+def format_time(dt):
+    # Always in UTC, so that the times compare as strings
+    return dt.astimezone(datetime.timezone.utc).isoformat(timespec = "seconds")
+
+
+def hash_source(fp):
+    hasher = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+
+def get_lastmod(content, dtOldUrl, dtNewUrl):
+    strHash = hash_source(content.source_path)
+    (strOldHash, strLastmod) = dtOldUrl.get(content.url, (None, None))
+
+    if strHash != strOldHash:
+        if strOldHash is None:
+            # Seen for the first time, so the best guess is the file's time
+            # (unless the content is dated later)
+            dt = datetime.datetime.fromtimestamp(
+                op.getmtime(content.source_path), datetime.timezone.utc
+            )
+            if getattr(content, "date", None) is not None:
+                dt = max(dt, content.date)
+        else:
+            dt = datetime.datetime.now(datetime.timezone.utc)
+        strLastmod = format_time(dt)
+
+    dtNewUrl[content.url] = (strHash, strLastmod)
+
+    if content.metadata.get("modified") is not None:
+        return format_time(content.modified)
+    else:
+        return strLastmod
+
+
+def sort_articles(lstArticle):
+    # Oldest first, so that new articles go at the end
+    return sorted(lstArticle, key = lambda a: (a.date, a.source_path))
+
+
+def sort_pages(lstPage):
+    return sorted(lstPage, key = lambda p: p.source_path)
+
+
+def iter_contents(lstContent):
+    for content in lstContent:
+        yield content
+        for translation in getattr(content, "translations", []):
+            yield translation
+
+
+def make_loc(settings, strPath):
+    return escape(
+        settings["SITEURL"] + "/" + urllib.parse.quote(strPath, safe = "/%~")
+    )
+
+
+def write_sitemaps(settings, dtGroupContent):
+    dpOut = settings["OUTPUT_PATH"]
+    strSaveAs = settings.get("SITEMAP_SAVE_AS", DEFAULT_SAVE_AS)
+    numMaxUrls = settings.get("SITEMAP_MAX_URLS", DEFAULT_MAX_URLS)
+    numMaxBytes = settings.get("SITEMAP_MAX_BYTES", DEFAULT_MAX_BYTES)
+
+    fpState = get_state_path(settings)
+    state = load_state(fpState)
+    dtOldUrl = state["urls"]
+    dtOldFile = state["files"]
+    dtNewUrl = {}
+    dtNewFile = {}
+
+    lstIndexEntry = []
+    numWritten = 0
+
+    def finish(sitemap, strPath):
+        nonlocal numWritten
+        (strHash, flagWritten) = sitemap.close(dtOldFile.get(strPath))
+        dtNewFile[strPath] = strHash
+        numWritten += flagWritten
+        lstIndexEntry.append((strPath, sitemap.strLastmod))
+
+    for (group, strPriority) in GROUP_PRIORITIES:
+        sitemap = None
+        strPath = None
+        numSitemap = 0
+        for content in iter_contents(dtGroupContent[group]):
+            strLastmod = get_lastmod(content, dtOldUrl, dtNewUrl)
+            strEntry = URL_ENTRY.format(
+                make_loc(settings, content.url), strLastmod, strPriority
+            )
+
+            if sitemap is not None and \
+                    not sitemap.fits(strEntry, numMaxUrls, numMaxBytes):
+                finish(sitemap, strPath)
+                sitemap = None
+
+            if sitemap is None:
+                numSitemap += 1
+                strPath = strSaveAs.format(group = group, number = numSitemap)
+                sitemap = SitemapFile(op.join(dpOut, strPath))
+
+            sitemap.add(strEntry, strLastmod)
+
+        if sitemap is not None:
+            finish(sitemap, strPath)
+
+    # Sitemaps that are no longer needed
+    for strPath in set(dtOldFile) - set(dtNewFile):
+        fp = op.join(dpOut, strPath)
+        if op.isfile(fp):
+            os.remove(fp)
+
+    fpIndex = op.join(
+        dpOut, settings.get("SITEMAP_INDEX_SAVE_AS", DEFAULT_INDEX_SAVE_AS)
+    )
+    lstIndex = [INDEX_START]
+    for (strPath, strLastmod) in lstIndexEntry:
+        lstIndex.append(
+            INDEX_ENTRY.format(make_loc(settings, strPath), strLastmod)
+        )
+    lstIndex.append(INDEX_END)
+    data = "".join(lstIndex).encode("utf-8")
+
+    try:
+        with open(fpIndex, "rb") as f:
+            flagIndexSame = f.read() == data
+    except OSError:
+        flagIndexSame = False
+    if not flagIndexSame:
+        with open(fpIndex, "wb") as f:
+            f.write(data)
+
+    state["urls"] = dtNewUrl
+    state["files"] = dtNewFile
+    os.makedirs(op.dirname(fpState), exist_ok = True)
+    with open(fpState, "w", encoding = "utf-8") as f:
+        json.dump(state, f)
+
+    archivist.info(
+        "Sitemaps: %d URLs in %d sitemaps, %d written",
+        len(dtNewUrl), len(dtNewFile), numWritten
+    )
+
+
+def on_initialized(pelican):
+    _state["settings"] = pelican.settings
+    _state["articles"] = []
+    _state["pages"] = []
+
+
+def on_article_generator_finalized(generator):
+    _state["articles"] = list(generator.articles)
+
+
+def on_page_generator_finalized(generator):
+    _state["pages"] = list(generator.pages)
+
+
+def on_finalized(pelican):
+    if _state["settings"] is not None:
+        write_sitemaps(_state["settings"], {
+            "pages": sort_pages(_state["pages"]),
+            "posts": sort_articles(_state["articles"]),
+        })
+
+    _state["articles"] = []
+    _state["pages"] = []
+
+
+def register():
+    signals.initialized.connect(on_initialized)
+    signals.article_generator_finalized.connect(on_article_generator_finalized)
+    signals.page_generator_finalized.connect(on_page_generator_finalized)
+    signals.finalized.connect(on_finalized)
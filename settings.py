@@ -14,18 +14,55 @@ PATH = 'content'
 # Theme setup
 THEME = 'theme' # Pelicanyan
 DIRECT_TEMPLATES = ('index', 'categories', 'authors', 'tags', 'archives',
-                    'sitemap', 'robots', 'humans')
+                    'robots', 'humans', 'search')
 STATIC_PATHS = [
     'images',
     '../extra/symbol-defs.svg',
     '../extra/symbols.css',
 ]
+# Emacs lock files (Pelican's default) and the record of what the Sass output
+# was generated from, which the build script keeps next to it
+IGNORE_FILES = ['.#*', '*.deps.json']
 ICONS_SVG_PATH = 'theme/img/symbol-defs.svg'
-    # This setting is referenced in Jinja templates
+ICONS_CSS_PATH = 'theme/css/symbols.css'
+    # These settings are referenced in Jinja templates; the build script cuts
+    # both files down to the icons the site uses
+ICONS_SVG_INLINE = False # Put the sprite into every page instead
+
+# Stylesheets that release builds combine into one, leaving out the rules no
+# page uses; the pages link to the bundle instead
+CSS_BUNDLE = [
+    'theme/css/syntax.css',
+    'theme/css/styles.css',
+    'theme/css/homotypus.css',
+    ICONS_CSS_PATH,
+]
+CSS_BUNDLE_PATH = 'theme/css/bundle.css'
+
+# Release builds put the rules needed to render the top of each kind of page
+# into the pages themselves, and load the stylesheets without blocking
+# rendering; the top is taken to end this many characters of text into the
+# page (0 turns this off)
+CRITICAL_CSS_FOLD = 1200
+
+# Output directories whose images get resized copies, which the pages offer to
+# browsers through srcset and sizes
+IMAGE_PATHS = ['images', 'theme/img']
+IMAGE_WIDTHS = [160, 320, 640, 960, 1280, 1920] # Pixels
+IMAGE_FORMATS = ['avif', 'webp'] # Offered ahead of the original's format
+IMAGE_SIZES = '(min-width: 56em) 760px, (min-width: 38em) 640px, ' \
+    'calc(100vw - 2rem)' # Width of the content; images may have their own
+IMAGE_PATH_SIZES = { # Output path: sizes, for images not as wide as the content
+    'theme/img/profile.png': '80px',
+}
+
+# Output directories whose assets release builds copy to names containing a
+# hash of their contents, for caching without revalidation
+FINGERPRINT_PATHS = ['theme', 'images']
 
 EXTRA_PATH_METADATA = {
     '../extra/symbol-defs.svg': {'path': ICONS_SVG_PATH},
-    '../extra/symbols.css': {'path': 'theme/css/symbols.css'},
+    '../extra/symbols.css': {'path': ICONS_CSS_PATH},
 }
 
 # Markdown settings
@@ -44,8 +81,24 @@ MARKDOWN = {
     'output_format': 'html5',
 }
 
+# Plugins; the local ones live in the plugins directory
+PLUGIN_PATHS = ['plugins']
+PLUGINS = [
+    "pelican_katex", # Mathematical notation rendering
+    "build_deps", # Output dependencies for incremental builds
+    "katex_cache", # Persistent cache of rendered mathematical notation
+    "katex_assets", # Self-hosted KaTeX stylesheet and fonts
+    "highlight_cache", # Persistent cache of highlighted code blocks
+    "reader_cache", # Persistent cache of converted Markdown sources
+    "search_index", # Sharded client-side search index
+    "sitemaps", # Size-split sitemaps and their index
+]
+
+# Directory for caches kept between builds; needs to be consistent with the
+# build script
+CACHE_PATH = 'cache'
+
 # Mathematical notation rendering
-PLUGINS = ["pelican_katex"]
 KATEX_PREAMBLE = r"""
 % Slanted inequality signs
 \renewcommand{\geq}{\geqslant}
@@ -56,6 +109,21 @@ KATEX_PREAMBLE = r"""
 \newcommand{\mfs}{\mathrlap{.}} % Full stop at the end of a line in maths
 \newcommand{\mcm}{\mathrlap{,}} % Comma at the end of a line in maths
 """
+KATEX_CACHE_MAX_SIZE = 64 * 1024 * 1024 # Bytes
+KATEX_WORKERS = 0 # Persistent Node workers; 0 means one per CPU core
+KATEX_DIST_PATH = 'node_modules/katex/dist' # From `npm install katex`
+
+# Code highlighting
+HIGHLIGHT_CACHE_MAX_SIZE = 32 * 1024 * 1024 # Bytes
+
+# Markdown conversion
+READER_CACHE_MAX_SIZE = 128 * 1024 * 1024 # Bytes
+
+# Client-side search; the index goes into SEARCH_INDEX_PATH in the output, next
+# to the search page, which fetches only the shards a query needs
+SEARCH_INDEX_PATH = 'search'
+SEARCH_PREFIX_LENGTH = 2 # Leading characters of a term that pick its shard
+SEARCH_DOCS_PER_FILE = 100 # Post titles, URLs and dates per file
 
 # Locale information
 DEFAULT_LANG = u'en'
@@ -85,4 +153,18 @@ YEAR_ARCHIVE_SAVE_AS = 'posts/{date:%Y}/index.html'
 # Site directives; these happen to have templates in Pelicanyan
 ROBOTS_SAVE_AS = 'robots.txt'
 HUMANS_SAVE_AS = 'humans.txt'
-SITEMAP_SAVE_AS = 'sitemap.xml'
+
+# Sitemaps, written by the sitemaps plugin rather than a template; the index
+# lists the numbered sitemaps of pages and posts
+SITEMAP_INDEX_SAVE_AS = 'sitemap_index.xml'
+SITEMAP_SAVE_AS = 'sitemap-{group}-{number}.xml'
+SITEMAP_MAX_URLS = 50000 # Limits of the sitemap protocol
+SITEMAP_MAX_BYTES = 50 * 1000 * 1000
+
+SEARCH_URL = 'search/'
+SEARCH_SAVE_AS = 'search/index.html'
+
+# Where `build.py deploy` uploads to when no target is given on the command
+# line: a local directory or [user@]host:path. The web server should serve the
+# "current" link inside it.
+DEPLOY_TARGET = None